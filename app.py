@@ -1,11 +1,34 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify
-import os, json, threading, uuid, csv
+from flask import Flask, Request, render_template, request, redirect, url_for, jsonify, Response, stream_with_context
+import os, io, csv, json, time, uuid, random, hashlib, tempfile
 from datetime import datetime
 from werkzeug.utils import secure_filename
-from send_from_csv import run_send_job
-import openpyxl
+from dataset_store import DatasetStore, VersionConflict, dataset_index, dataset_facets, dataset_lock, snapshot_rows
+from shared_state import open_store
+from upload_cache import UploadCache, HashingStream, content_hash
+from job_queue import JobQueue, JobRunner
+from job_log import LEVELS, DEFAULT_CAPACITY
+from message_template import compile_template, TemplateError
+from category_index import CategoryIndex, normalize_value, row_ids_from_bits, count_bits
+from contact_dataset import ContactDataset, column_values
+from row_paging import RowPager
+from ingest import stream_csv, stream_xlsx, stream_file
+from parallel_ingest import ingest_parts, parse_parts, merge_parts, INGEST_WORKERS
+from phone_numbers import validate_contacts
+from campaign_scheduler import parse_send_datetime
+from campaign_simulation import latency_sampler
+from filter_expr import compile_filter, FilterError
+import metrics
+from worker import make_run_job
+
+class UploadRequest(Request):
+    """Hashes uploaded files while werkzeug spools them, for the upload cache"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingStream(super()._get_file_stream(total_content_length, content_type, filename, content_length))
+
 
 app = Flask(__name__)
+app.request_class = UploadRequest
 app.secret_key = 'your-secret-key-here-change-in-production'
 
 UPLOAD_FOLDER = 'uploads'
@@ -13,72 +36,160 @@ ALLOWED_EXTENSIONS = {'csv', 'xlsx', 'xls'}
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
-job_store = {}
+job_queue = JobQueue(os.path.join('data', 'jobs.db'))
+LOG_PAGE_SIZE = 2000
+JOB_LOG_CAPACITY = DEFAULT_CAPACITY  # log lines kept per job for the status page
+JOB_LOG_SPILL_DIR = os.path.join('data', 'logs')  # full JSONL logs; None to disable
+SSE_POLL_SECONDS = 0.5
+SSE_KEEPALIVE_SECONDS = 15
+# Each status stream ends after this long and the browser reconnects from
+# Last-Event-ID, so an open tab doesn't hold a server worker for a whole job
+SSE_MAX_SECONDS = 60
+SSE_RETRY_MS = 1000
+# Set RUN_WORKERS=0 to only serve the UI and leave sending to `python worker.py`
+RUN_WORKERS = os.environ.get('RUN_WORKERS', '1') != '0'
+# Settings a resubmitted dead-letter job inherits from the original job
+RESUBMIT_SETTINGS = ('wait_time', 'backend', 'concurrency', 'rate_per_second', 'phone_cooldown',
+                     'log_level', 'log_capacity', 'max_attempts', 'retry_base_seconds', 'retry_max_seconds')
+# Datasets and upload progress live here so any worker (e.g. under
+# `gunicorn -w 4 app:app`) can serve any request; jobs and logs are in jobs.db.
+# Use redis://host:6379/0 to share across hosts, memory:// for a single process.
+SHARED_STATE_URL = os.environ.get('SHARED_STATE_URL', 'sqlite:///' + os.path.join('data', 'shared.db'))
+DATASET_TTL_SECONDS = 7 * 24 * 3600
+INGEST_PROGRESS_TTL_SECONDS = 600
+shared_state = open_store(SHARED_STATE_URL)
+dataset_store = DatasetStore(max_in_memory=8, shared=shared_state, ttl=DATASET_TTL_SECONDS)
+# Parsed uploads by content hash, so re-uploading the same sheet skips parsing
+upload_cache = UploadCache(os.path.join('data', 'upload_cache'), max_bytes=512 * 1024 * 1024)
+# The contacts table is paged from the server; /parse-excel only returns the first page
+FIRST_PAGE_ROWS = 200
+row_pager = RowPager(max_views=16)
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def parse_csv_file(filepath):
-    """Parse CSV file and return headers + rows"""
-    headers = []
-    rows = []
+def parse_csv_file(source, progress=None):
+    """Parse CSV file (path or binary stream) and return headers + a ContactDataset"""
     try:
-        with open(filepath, 'r', encoding='utf-8') as csvfile:
-            reader = csv.reader(csvfile)
-            headers = next(reader, [])
-            
-            for row in reader:
-                if len(row) >= 2:  # At least Name and Phone
-                    rows.append([cell.strip() for cell in row])
+        headers, chunks = stream_csv(source, progress=progress)
+        rows = ContactDataset(headers)
+        for chunk in chunks:
+            rows.extend(chunk)
     except Exception as e:
         raise Exception(f"Error parsing CSV: {str(e)}")
     
     return headers, rows
 
-def parse_xlsx_file(filepath):
-    """Parse XLSX/XLS file and return headers + rows"""
-    headers = []
-    rows = []
+def parse_xlsx_file(source, progress=None):
+    """Parse XLSX/XLS file (path or binary stream) and return headers + a ContactDataset"""
     try:
-        workbook = openpyxl.load_workbook(filepath)
-        sheet = workbook.active
-        
-        if sheet is None:
-            raise Exception("No active sheet found in workbook")
-        
-        # Get headers from first row
-        headers = [str(cell.value).strip() if cell.value else f"Column{i}" 
-                   for i, cell in enumerate(sheet[1], 1)]
-        
-        # Get data rows
-        for row in sheet.iter_rows(min_row=2, values_only=True):
-            if row and any(row):  # Skip empty rows
-                row_data = [str(cell).strip() if cell is not None else '' for cell in row]
-                if len(row_data) >= 2:  # At least Name and Phone
-                    rows.append(row_data)
-        
-        workbook.close()
+        headers, chunks = stream_xlsx(source, progress=progress)
+        rows = ContactDataset(headers)
+        for chunk in chunks:
+            rows.extend(chunk)
     except Exception as e:
         raise Exception(f"Error parsing XLSX: {str(e)}")
     
     return headers, rows
 
-def launch_send_in_thread(job_id, params):
-    def logger(line):
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        job_store[job_id]['logs'].append(f"[{timestamp}] {line}")
-
-    job_store[job_id]['status'] = 'running'
-    job_store[job_id]['started_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+def detect_contact_columns(headers):
+    """Return (name_col_idx, phone_col_idx), -1 where a column is missing"""
+    name_col_idx = -1
+    phone_col_idx = -1
     
+    # First: Look for exact matches
+    for idx, h in enumerate(headers):
+        h_lower = h.lower().strip()
+        if h_lower == 'name' and name_col_idx == -1:
+            name_col_idx = idx
+        if h_lower == 'phone' and phone_col_idx == -1:
+            phone_col_idx = idx
+    
+    # Second: Look for partial matches if not found
+    if name_col_idx == -1:
+        for idx, h in enumerate(headers):
+            if 'name' in h.lower():
+                name_col_idx = idx
+                break
+    
+    if phone_col_idx == -1:
+        for idx, h in enumerate(headers):
+            h_lower = h.lower()
+            if 'phone' in h_lower or 'mobile' in h_lower:
+                phone_col_idx = idx
+                break
+    
+    return name_col_idx, phone_col_idx
+
+def parse_merged(files, file_exts, all_sheets=False, country_code=None, progress=None):
+    """Parse several uploads (and every sheet of each workbook with
+    ``all_sheets``) in parallel processes and merge them into one
+    ContactDataset; returns (headers, rows, ingest report)"""
+    paths = []
     try:
-        run_send_job(params, logger)
-        job_store[job_id]['status'] = 'finished'
-        job_store[job_id]['finished_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    except Exception as e:
-        logger(f'❌ Job error: {str(e)}')
-        job_store[job_id]['status'] = 'failed'
-        job_store[job_id]['error'] = str(e)
+        # Pool processes read the parts from disk, so the uploads are saved first
+        for file, file_ext in zip(files, file_exts):
+            fd, path = tempfile.mkstemp(suffix=f".{file_ext}", dir=app.config['UPLOAD_FOLDER'])
+            with os.fdopen(fd, 'wb') as f:
+                file.save(f)
+            paths.append((path, file_ext, file.filename))
+        parts = ingest_parts(paths, all_sheets)
+        if not parts:
+            raise Exception("No worksheets found")
+        results = parse_parts(parts, progress)
+        headers, rows, report = merge_parts(parts, results, detect_contact_columns, country_code)
+        report['workers'] = min(len(parts), INGEST_WORKERS)
+        return headers, rows, report
+    finally:
+        for path, _, _ in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def category_columns(headers, name_col_idx, phone_col_idx):
+    """All columns except the detected Name and Phone are categories"""
+    return [header for idx, header in enumerate(headers)
+            if idx != name_col_idx and idx != phone_col_idx]
+
+def category_summary(headers, rows, categories):
+    """Distinct non-empty values per category column, in order of first appearance"""
+    summary = {}
+    for category in categories:
+        values = (str(value).strip() for value in rows.distinct_values(headers.index(category)))
+        summary[category] = [value for value in dict.fromkeys(values) if value]
+    return summary
+
+def category_counts(dataset):
+    """Rows per value of each category ({category: {value: rows}}), read
+    from the dataset's precomputed facet counts (call under its read lock)"""
+    headers = dataset['headers']
+    facets = dataset_facets(dataset)
+    summary = dataset.get('summary') or category_summary(headers, dataset['rows'], dataset['categories'])
+    counts = {}
+    for category in dataset['categories']:
+        value_counts = facets.value_counts(headers.index(category))
+        counts[category] = {value: value_counts.get(normalize_value(value), 0)
+                            for value in summary.get(category, [])}
+    return counts
+
+def resolve_dataset(data):
+    """Return the dataset dict for a request payload.
+
+    Prefers a server-side ``dataset_id``; falls back to inline
+    ``headers``/``rows`` for older clients. Returns None if the ID is unknown.
+    """
+    dataset_id = data.get('dataset_id')
+    if dataset_id:
+        return dataset_store.get(dataset_id)
+    return {"headers": data.get('headers', []), "rows": data.get('rows', [])}
+
+# The sender is imported when the first job runs, keeping web startup fast
+run_job = make_run_job(job_queue, dataset_store, JOB_LOG_CAPACITY, JOB_LOG_SPILL_DIR)
+
+# Jobs scheduled for later park until due (see PARK_AFTER_SECONDS), so slots stay free
+job_runner = JobRunner(job_queue, run_job, max_workers=8)
+metrics.ACTIVE_JOBS.set_function(lambda: len(job_runner.active_jobs()))
 
 
 @app.route('/parse-excel', methods=['POST'])
@@ -88,104 +199,250 @@ def parse_excel():
         if 'file' not in request.files:
             return jsonify({"success": False, "error": "No file uploaded"}), 400
         
-        file = request.files['file']
-        
-        if file.filename == '':
-            return jsonify({"success": False, "error": "No file selected"}), 400
-        
-        if not allowed_file(file.filename):
-            return jsonify({"success": False, "error": "Invalid file type"}), 400
+        files = request.files.getlist('file')
         
-        if file.filename is None:
-            return jsonify({"success": False, "error": "Invalid filename"}), 400
+        for file in files:
+            if file.filename == '':
+                return jsonify({"success": False, "error": "No file selected"}), 400
+            
+            if not allowed_file(file.filename):
+                return jsonify({"success": False, "error": "Invalid file type"}), 400
+            
+            if file.filename is None:
+                return jsonify({"success": False, "error": "Invalid filename"}), 400
         
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        file = files[0]
+        file_exts = [secure_filename(f.filename).rsplit('.', 1)[1].lower() for f in files]
+        file_ext = file_exts[0]
+        upload_id = request.form.get('upload_id')
+        # Several files, or every sheet of a workbook, are parsed in parallel and merged
+        all_sheets = request.form.get('all_sheets', '') in ('1', 'true', 'on')
+        merge = len(files) > 1 or all_sheets
+        country_code = request.form.get('country_code', '').strip()
+        format_label = 'merged' if merge else file_ext
         
-        file_ext = filename.rsplit('.', 1)[1].lower()
+        def progress(rows_read, fraction):
+            if upload_id:
+                shared_state.set_json(f"ingest:{upload_id}", {"rows": rows_read, "fraction": fraction},
+                                      INGEST_PROGRESS_TTL_SECONDS)
         
         try:
-            if file_ext == 'csv':
-                headers, rows = parse_csv_file(filepath)
-            elif file_ext in ['xlsx', 'xls']:
-                headers, rows = parse_xlsx_file(filepath)
+            if merge:
+                # Phones are deduped across parts, so the country code is part of the key
+                digests = [f"{ext}:{content_hash(f.stream)}" for f, ext in zip(files, file_exts)]
+                digests += [f"all_sheets={all_sheets}", f"country_code={country_code}"]
+                cache_key = upload_cache.key(hashlib.sha256('\n'.join(digests).encode('utf-8')).hexdigest(), 'merged')
             else:
-                return jsonify({"success": False, "error": "Unsupported file type"}), 400
-            
-            os.remove(filepath)
-            
-            if not rows:
-                return jsonify({"success": False, "error": "File is empty"}), 400
-            
-            # Validate that Name and Phone columns exist (prefer exact matches)
-            name_col_idx = -1
-            phone_col_idx = -1
-            
-            # First: Look for exact matches
-            for idx, h in enumerate(headers):
-                h_lower = h.lower().strip()
-                if h_lower == 'name' and name_col_idx == -1:
-                    name_col_idx = idx
-                if h_lower == 'phone' and phone_col_idx == -1:
-                    phone_col_idx = idx
-            
-            # Second: Look for partial matches if not found
-            if name_col_idx == -1:
-                for idx, h in enumerate(headers):
-                    if 'name' in h.lower():
-                        name_col_idx = idx
-                        break
-            
-            if phone_col_idx == -1:
-                for idx, h in enumerate(headers):
-                    h_lower = h.lower()
-                    if 'phone' in h_lower or 'mobile' in h_lower:
-                        phone_col_idx = idx
-                        break
-            
-            if name_col_idx == -1:
-                return jsonify({"success": False, "error": "❌ Required column 'Name' not found in file headers"}), 400
-            
-            if phone_col_idx == -1:
-                return jsonify({"success": False, "error": "❌ Required column 'Phone' not found in file headers"}), 400
+                cache_key = upload_cache.key(content_hash(file.stream), file_ext)
+            cached = upload_cache.get(cache_key)
+            if cached is not None:
+                # Same bytes as an earlier upload: reuse its parse, detection and summary
+                metrics.UPLOAD_CACHE.labels('hit').inc()
+                headers = cached['headers']
+                rows = ContactDataset.from_state(cached['rows'])
+                categories = cached['categories']
+                summary = cached['category_summary']
+                ingest_report = cached.get('ingest')
+                index = None
+            else:
+                metrics.UPLOAD_CACHE.labels('miss').inc()
+                parse_started = time.perf_counter()
+                ingest_report = None
+                if merge:
+                    headers, rows, ingest_report = parse_merged(files, file_exts, all_sheets, country_code, progress)
+                    name_col_idx, phone_col_idx = detect_contact_columns(headers)
+                else:
+                    # Stream straight from the upload; nothing is saved to uploads/
+                    headers, chunks = stream_file(file.stream, file_ext, progress=progress)
+                    
+                    name_col_idx, phone_col_idx = detect_contact_columns(headers)
+                    
+                    if name_col_idx == -1:
+                        return jsonify({"success": False, "error": "❌ Required column 'Name' not found in file headers"}), 400
+                    
+                    if phone_col_idx == -1:
+                        return jsonify({"success": False, "error": "❌ Required column 'Phone' not found in file headers"}), 400
+                    
+                    # Columnar storage; category postings are built from its codes afterwards
+                    rows = ContactDataset(headers)
+                    for chunk in chunks:
+                        rows.extend(chunk)
+                index = CategoryIndex(headers, rows)
+                for idx in range(len(headers)):
+                    if idx != name_col_idx and idx != phone_col_idx:
+                        index.postings(idx)
+                metrics.PARSE_SECONDS.labels(format_label).observe(time.perf_counter() - parse_started)
+                metrics.ROWS_INGESTED.labels(format_label).inc(len(rows))
+                
+                if not rows:
+                    return jsonify({"success": False, "error": "File is empty"}), 400
+                
+                categories = category_columns(headers, name_col_idx, phone_col_idx)
+                summary = category_summary(headers, rows, categories)
+                upload_cache.put(cache_key, {
+                    "headers": headers,
+                    "rows": rows.to_state(),
+                    "name_col_idx": name_col_idx,
+                    "phone_col_idx": phone_col_idx,
+                    "categories": categories,
+                    "category_summary": summary,
+                    "ingest": ingest_report
+                })
             
-            # Identify category columns (all columns except the detected Name and Phone)
-            categories = []
-            for idx, header in enumerate(headers):
-                if idx != name_col_idx and idx != phone_col_idx:
-                    categories.append(header)
+            dataset_id = dataset_store.put(headers, rows, categories, index=index, summary=summary)
+            # Value and pairwise counts for the summary, dropdowns and match badges
+            dataset = dataset_store.get(dataset_id)
+            dataset_facets(dataset)
             
             return jsonify({
                 "success": True, 
+                "dataset_id": dataset_id,
+                "version": 0,
                 "headers": headers,
-                "rows": rows,
-                "categories": categories
+                "row_count": len(rows),
+                "rows": rows.to_rows(0, FIRST_PAGE_ROWS),
+                "categories": categories,
+                "category_summary": summary,
+                "category_counts": category_counts(dataset),
+                "ingest": ingest_report
             })
             
         except Exception as e:
-            try:
-                os.remove(filepath)
-            except:
-                pass
             return jsonify({"success": False, "error": f"Error parsing file: {str(e)}"}), 400
+        finally:
+            if upload_id:
+                shared_state.delete(f"ingest:{upload_id}")
             
     except Exception as e:
         return jsonify({"success": False, "error": f"Server error: {str(e)}"}), 500
 
 
+@app.route('/parse-excel/progress/<upload_id>')
+def parse_progress(upload_id):
+    """Rows parsed so far for an upload that is still being ingested"""
+    progress = shared_state.get_json(f"ingest:{upload_id}")
+    if progress is None:
+        return jsonify({"success": False, "error": "Upload not in progress"}), 404
+    return jsonify({"success": True, **progress})
+
+
+@app.route('/datasets/<dataset_id>', methods=['PATCH'])
+def patch_dataset(dataset_id):
+    """Apply a small versioned delta to a stored dataset.
+
+    The body names the ``base_version`` it was made against plus any of
+    ``updates`` (``[row_id, col_idx, value]``), ``deletes`` (row IDs) and
+    ``inserts`` (rows to append). Row IDs are those of the base version;
+    updates apply first, then deletes (later rows move up), then inserts.
+    Returns 409 with the current version if someone else patched it first.
+    """
+    try:
+        data = request.json
+        dataset = dataset_store.patch(dataset_id, int(data.get('base_version', -1)), data)
+        if dataset is None:
+            return jsonify({"success": False, "error": "Dataset not found or expired, please upload the file again"}), 404
+        
+        with dataset_lock(dataset).reading():
+            return jsonify({
+                "success": True,
+                "version": dataset['version'],
+                "row_count": len(dataset['rows']),
+                "category_summary": dataset['summary'],
+                "category_counts": category_counts(dataset)
+            })
+        
+    except VersionConflict as e:
+        dataset = dataset_store.get(dataset_id)
+        if dataset is None:
+            return jsonify({"success": False, "error": str(e), "version": e.version}), 409
+        with dataset_lock(dataset).reading():
+            return jsonify({
+                "success": False,
+                "error": str(e),
+                "version": e.version,
+                "row_count": len(dataset['rows']),
+                "category_summary": dataset['summary'],
+                "category_counts": category_counts(dataset)
+            }), 409
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+
+@app.route('/datasets/<dataset_id>/summary')
+def dataset_summary(dataset_id):
+    """Contact count and rows per value of each category, from the facet counts"""
+    try:
+        dataset = dataset_store.get(dataset_id)
+        if dataset is None:
+            return jsonify({"success": False, "error": "Dataset not found or expired, please upload the file again"}), 404
+        
+        with dataset_lock(dataset).reading():
+            return jsonify({
+                "success": True,
+                "version": dataset['version'],
+                "row_count": len(dataset['rows']),
+                "category_summary": dataset['summary'] or category_summary(dataset['headers'], dataset['rows'], dataset['categories']),
+                "category_counts": category_counts(dataset)
+            })
+        
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+
+@app.route('/datasets/<dataset_id>/rows')
+def dataset_rows(dataset_id):
+    """One window of a dataset's rows: ``offset``/``limit``, optionally
+    ``search`` (any cell, case-insensitive) and ``sort`` (column index)
+    with ``order=asc|desc``. ``row_ids`` identify the rows for edits."""
+    try:
+        dataset = dataset_store.get(dataset_id)
+        if dataset is None:
+            return jsonify({"success": False, "error": "Dataset not found or expired, please upload the file again"}), 404
+        rows = dataset['rows']
+        offset = int(request.args.get('offset', 0))
+        limit = int(request.args.get('limit', FIRST_PAGE_ROWS))
+        search = request.args.get('search', '').strip()
+        sort_col = request.args.get('sort')
+        sort_col = int(sort_col) if sort_col not in (None, '') else None
+        descending = request.args.get('order', 'asc') == 'desc'
+        
+        with dataset_lock(dataset).reading():
+            version = dataset['version']
+            row_count = len(rows)
+            total, row_ids, page = row_pager.page(dataset_id, rows, offset, limit, search, sort_col, descending,
+                                                  version=version)
+        
+        return jsonify({
+            "success": True,
+            "version": version,
+            "offset": offset,
+            "total": total,
+            "row_count": row_count,
+            "row_ids": row_ids,
+            "rows": page
+        })
+        
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+
 @app.route('/', methods=['GET', 'POST'])
 def index():
     if request.method == 'POST':
         try:
-            # Get contact data
-            edited_table = request.form.get('edited_table')
-            if not edited_table:
+            # Get contact data: a stored dataset, at the version the browser last saw
+            dataset_id = request.form.get('dataset_id')
+            if not dataset_id:
                 return jsonify({"error": "No contact data provided"}), 400
-            
-            contact_data = json.loads(edited_table)
-            rows = contact_data.get('rows', [])
-            headers = contact_data.get('headers', [])
+            dataset = dataset_store.get(dataset_id)
+            if dataset is None:
+                return jsonify({"error": "Dataset not found or expired, please upload the file again"}), 404
+            # The job sends to a copy taken at one version; later patches don't touch it
+            dataset_version, rows = snapshot_rows(dataset)
+            if request.form.get('dataset_version', '') not in ('', str(dataset_version)):
+                return jsonify({"error": "Contacts were changed elsewhere since this page loaded, please review them and submit again",
+                                "version": dataset_version}), 409
+            headers = dataset['headers']
             
             if not rows:
                 return jsonify({"error": "No contacts provided"}), 400
@@ -209,6 +466,49 @@ def index():
             if not filter_messages:
                 return jsonify({"error": "No message filters configured"}), 400
 
+            # Compile templates now so unknown placeholders are rejected before queueing
+            name_col_idx, phone_col_idx = detect_contact_columns(headers)
+            for idx, fm in enumerate(filter_messages, 1):
+                try:
+                    compile_template(fm['template'], headers, name_col_idx, phone_col_idx)
+                except TemplateError as e:
+                    return jsonify({"error": f"Filter #{idx} message: {str(e)}"}), 400
+                try:
+                    compile_filter(fm['filters'], headers)
+                except FilterError as e:
+                    return jsonify({"error": f"Filter #{idx} conditions: {str(e)}"}), 400
+                try:
+                    parse_send_datetime(fm['send_datetime'])
+                except Exception as e:
+                    return jsonify({"error": f"Filter #{idx}: {str(e)}"}), 400
+
+            # Normalize and dedupe phone numbers; report problems before queueing
+            if phone_col_idx == -1:
+                return jsonify({"error": "Phone column not found"}), 400
+            country_code = request.form.get('country_code', '').strip()
+            try:
+                _, _, validation = validate_contacts(rows, phone_col_idx, country_code)
+            except Exception as e:
+                return jsonify({"error": str(e)}), 400
+            if validation['valid'] == 0:
+                return jsonify({"error": "No valid phone numbers to send to", "validation": validation}), 400
+
+            log_level = request.form.get('log_level', 'info')
+            if log_level not in LEVELS:
+                return jsonify({"error": f"Unknown log level: {log_level}"}), 400
+
+            # Dry run: simulate the sends to estimate duration; latency is the
+            # median seconds per send (blank = typical for the backend)
+            dry_run = request.form.get('dry_run') == '1'
+            try:
+                simulation = {"failure_rate": float(request.form.get('sim_failure_percent', 0) or 0) / 100}
+                sim_latency = request.form.get('sim_latency', '').strip()
+                if sim_latency:
+                    simulation['latency'] = {"kind": "lognormal", "median": float(sim_latency), "sigma": 0.5}
+                    latency_sampler(simulation['latency'], random.Random())
+            except Exception as e:
+                return jsonify({"error": f"Dry run settings: {str(e)}"}), 400
+
             # Write messages_db.json
             os.makedirs('data', exist_ok=True)
             messages_file = os.path.join('data', 'messages_db.json')
@@ -217,29 +517,40 @@ def index():
 
             # Job parameters
             params = {
-                "rows": rows,
+                "rows": rows.to_state(),
                 "headers": headers,
+                "dataset_id": dataset_id,
+                "dataset_version": dataset_version,
                 "filter_messages": filter_messages,
                 "messages_db": messages_file,
-                "wait_time": int(request.form.get('wait_time', 10))
+                "wait_time": int(request.form.get('wait_time', 10)),
+                "backend": request.form.get('backend', 'pywhatkit'),
+                "concurrency": int(request.form.get('concurrency', 1)),
+                "rate_per_second": float(request.form.get('rate_per_second', 0) or 0),
+                "phone_cooldown": float(request.form.get('phone_cooldown', 0) or 0),
+                "country_code": country_code,
+                "coalesce": request.form.get('coalesce') == 'on',
+                "max_attempts": int(request.form.get('max_attempts', 3) or 3),
+                "campaign": request.form.get('campaign', '').strip() or None,
+                "log_level": log_level,
+                "log_capacity": JOB_LOG_CAPACITY,
+                "dry_run": dry_run,
+                "simulation": simulation
             }
 
             job_id = str(uuid.uuid4())
-            job_store[job_id] = {
-                "logs": [f"✅ Job {job_id} created with {len(rows)} contacts and {len(filter_messages)} message filters"],
-                "status": "queued",
-                "total_rows": len(rows),
-                "total_filters": len(filter_messages),
-                "created_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            }
-
-            threading.Thread(
-                target=launch_send_in_thread,
-                args=(job_id, params),
-                daemon=True
-            ).start()
-
-            return jsonify({"success": True, "job_id": job_id})
+            job_kind = "Dry run" if dry_run else "Job"
+            job_queue.create_job(
+                params,
+                info={"total_rows": len(rows), "total_filters": len(filter_messages),
+                      "valid_recipients": validation['valid'], "dry_run": dry_run,
+                      "dataset_id": dataset_id, "dataset_version": dataset_version},
+                first_log=f"✅ {job_kind} {job_id} created with {len(rows)} contacts and {len(filter_messages)} message filters",
+                job_id=job_id
+            )
+            job_runner.notify()
+
+            return jsonify({"success": True, "job_id": job_id, "validation": validation})
 
         except json.JSONDecodeError as e:
             return jsonify({"error": f"Invalid data format: {str(e)}"}), 400
@@ -251,27 +562,133 @@ def index():
 
 @app.route('/status/<job_id>')
 def status_page(job_id):
-    if job_id not in job_store:
+    if not job_queue.exists(job_id):
         return "Job not found", 404
     return render_template('status.html', job_id=job_id)
 
 
+def job_log_update(job_id, since):
+    """Job status and counters plus at most LOG_PAGE_SIZE log lines from ``since``"""
+    job = job_queue.get_job(job_id, include_logs=False)
+    if job is None:
+        return None
+    # Lines older than the job's log capacity are trimmed; skip ahead to the oldest kept
+    since = max(since, job_queue.first_log_offset(job_id))
+    lines = job_queue.get_logs(job_id, since, LOG_PAGE_SIZE)
+    job['logs'] = lines
+    job['offset'] = since
+    job['next_offset'] = since + len(lines)
+    job['has_more'] = len(lines) == LOG_PAGE_SIZE
+    return job
+
+
 @app.route('/status/<job_id>/logs')
 def status_logs(job_id):
-    return jsonify(job_store.get(job_id, {"error": "Job not found"}))
+    """Job status with log lines from ``?since=<offset>`` (default: from the start)"""
+    since = max(0, request.args.get('since', 0, type=int))
+    return jsonify(job_log_update(job_id, since) or {"error": "Job not found"})
+
+
+@app.route('/status/<job_id>/stream')
+def status_stream(job_id):
+    """Server-Sent Events stream of new log lines and counters.
+
+    Closes after SSE_MAX_SECONDS; EventSource reopens it with the last
+    event ID, which is the log offset to continue from.
+    """
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', 0, type=int)
+
+    def events():
+        offset = max(0, since)
+        last_state = None
+        last_sent = started = time.monotonic()
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        while time.monotonic() - started < SSE_MAX_SECONDS:
+            update = job_log_update(job_id, offset)
+            if update is None:
+                yield f"event: error\ndata: {json.dumps({'error': 'Job not found'})}\n\n"
+                return
+            
+            state = (update['status'], json.dumps(update['counters'], sort_keys=True))
+            if update['logs'] or state != last_state:
+                yield f"id: {update['next_offset']}\ndata: {json.dumps(update, ensure_ascii=False)}\n\n"
+                last_state = state
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent >= SSE_KEEPALIVE_SECONDS:
+                yield ": keepalive\n\n"
+                last_sent = time.monotonic()
+            offset = update['next_offset']
+            
+            if update['status'] in ('finished', 'failed') and not update['logs']:
+                yield "event: done\ndata: {}\n\n"
+                return
+            if not update['has_more']:
+                time.sleep(SSE_POLL_SECONDS)
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Counters, gauges and histograms in the Prometheus text format"""
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
 
 
 @app.route('/jobs')
 def list_jobs():
     """List all jobs"""
-    return jsonify({
-        job_id: {
-            "status": info["status"],
-            "created_at": info.get("created_at"),
-            "total_rows": info.get("total_rows", 0)
-        }
-        for job_id, info in job_store.items()
+    return jsonify(job_queue.list_jobs())
+
+
+@app.route('/jobs/<job_id>/dead-letters')
+def export_dead_letters(job_id):
+    """Deliveries that ran out of retries, as JSON or ``?format=csv``"""
+    if not job_queue.exists(job_id):
+        return jsonify({"success": False, "error": "Job not found"}), 404
+    dead_letters = job_queue.dead_letters(job_id)
+    
+    if request.args.get('format') == 'csv':
+        output = io.StringIO()
+        writer = csv.writer(output)
+        columns = ['key', 'name', 'phone', 'message', 'attempts', 'error', 'campaign', 'template_hash', 'created_at']
+        writer.writerow(columns)
+        for entry in dead_letters:
+            writer.writerow([entry[column] for column in columns])
+        return Response(output.getvalue(), mimetype='text/csv',
+                        headers={'Content-Disposition': f'attachment; filename=dead_letters_{job_id}.csv'})
+    
+    return jsonify({"success": True, "dead_letters": dead_letters})
+
+
+@app.route('/jobs/<job_id>/dead-letters/resubmit', methods=['POST'])
+def resubmit_dead_letters(job_id):
+    """Queue a new job that re-sends a job's dead letters as-is"""
+    params = job_queue.get_params(job_id)
+    if params is None:
+        return jsonify({"success": False, "error": "Job not found"}), 404
+    dead_letters = job_queue.dead_letters(job_id)
+    if not dead_letters:
+        return jsonify({"success": False, "error": "No dead letters to resubmit"}), 400
+    
+    new_params = {key: params[key] for key in RESUBMIT_SETTINGS if key in params}
+    new_params.update({
+        "deliveries": [{key: entry[key] for key in ('name', 'phone', 'message', 'template_hash')}
+                       for entry in dead_letters],
+        "campaign": dead_letters[0]['campaign'],
+        "resubmitted_from": job_id
     })
+    new_job_id = str(uuid.uuid4())
+    job_queue.create_job(
+        new_params,
+        info={"total_rows": len(dead_letters), "total_filters": 1, "resubmitted_from": job_id},
+        first_log=f"✅ Job {new_job_id} created to resend {len(dead_letters)} dead letter(s) from job {job_id}",
+        job_id=new_job_id
+    )
+    job_runner.notify()
+    return jsonify({"success": True, "job_id": new_job_id})
 
 
 @app.route('/preview-filter', methods=['POST'])
@@ -280,41 +697,67 @@ def preview_filter():
     try:
         data = request.json
         filters = data.get('filters', {})
-        headers = data.get('headers', [])
-        rows = data.get('rows', [])
-        
-        matched_contacts = []
+        dataset = resolve_dataset(data)
+        if dataset is None:
+            return jsonify({"success": False, "error": "Dataset not found"}), 404
+        rows = dataset['rows']
+        try:
+            compiled = compile_filter(filters, dataset['headers'])
+        except FilterError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
         
-        for row in rows:
-            match = True
-            for category, required_value in filters.items():
-                col_idx = headers.index(category) if category in headers else -1
-                if col_idx == -1 or col_idx >= len(row):
-                    match = False
-                    break
-                
-                cell_value = str(row[col_idx]).strip()
-                if cell_value.upper() != required_value.upper():
-                    match = False
-                    break
+        with dataset_lock(dataset).reading():
+            index = dataset_index(dataset)
+            with metrics.FILTER_MATCH_SECONDS.labels('preview').time():
+                # Stored datasets answer the count from their facet counts; the
+                # sample below only needs the first few matching rows
+                if 'categories' in dataset:
+                    matched_count = dataset_facets(dataset).count_filter(compiled)
+                    matched_bits = compiled.match(index) if matched_count else 0
+                else:
+                    matched_bits = compiled.match(index)
+                    matched_count = count_bits(matched_bits)
             
-            if match:
+            matched_contacts = []
+            for row_id in row_ids_from_bits(matched_bits, limit=10):  # First 10 for preview
+                row = rows[row_id]
                 matched_contacts.append({
                     'name': row[0] if len(row) > 0 else '',
                     'phone': row[1] if len(row) > 1 else ''
                 })
+            total_contacts = len(rows)
         
         return jsonify({
             "success": True,
-            "matched_count": len(matched_contacts),
-            "matched_contacts": matched_contacts[:10],  # First 10 for preview
-            "total_contacts": len(rows)
+            "matched_count": matched_count,
+            "matched_contacts": matched_contacts,
+            "total_contacts": total_contacts
         })
         
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 400
 
 
+@app.route('/validate-contacts', methods=['POST'])
+def validate_contacts_route():
+    """Normalize, validate and dedupe the dataset's phone numbers"""
+    try:
+        data = request.json
+        dataset = resolve_dataset(data)
+        if dataset is None:
+            return jsonify({"success": False, "error": "Dataset not found"}), 404
+        _, phone_col_idx = detect_contact_columns(dataset['headers'])
+        if phone_col_idx == -1:
+            return jsonify({"success": False, "error": "Phone column not found"}), 400
+        
+        with dataset_lock(dataset).reading():
+            _, _, report = validate_contacts(dataset['rows'], phone_col_idx, data.get('country_code', '').strip())
+        return jsonify({"success": True, "report": report})
+        
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+
 @app.route('/duplicate-filter/<int:filter_id>', methods=['POST'])
 def duplicate_filter():
     """Duplicate an existing filter configuration"""
@@ -369,24 +812,33 @@ def get_category_values():
     try:
         data = request.json
         category = data.get('category')
-        headers = data.get('headers', [])
-        rows = data.get('rows', [])
+        dataset = resolve_dataset(data)
+        if dataset is None:
+            return jsonify({"success": False, "error": "Dataset not found"}), 404
+        headers = dataset['headers']
+        rows = dataset['rows']
         
         if category not in headers:
             return jsonify({"success": False, "error": "Category not found"}), 400
         
         col_idx = headers.index(category)
         
-        # Get unique non-empty values
-        unique_values = sorted(list(set([
-            str(row[col_idx]).strip() 
-            for row in rows 
-            if col_idx < len(row) and str(row[col_idx]).strip()
-        ])))
+        # Get unique non-empty values, with how many contacts have each
+        with dataset_lock(dataset).reading():
+            if dataset.get('summary') and category in dataset['summary']:
+                values = dataset['summary'][category]
+            else:
+                values = rows.distinct_values(col_idx) if isinstance(rows, ContactDataset) else set(column_values(rows, col_idx))
+            unique_values = sorted(set(str(value).strip() for value in values) - {''})
+            counts = None
+            if 'categories' in dataset:
+                value_counts = dataset_facets(dataset).value_counts(col_idx)
+                counts = {value: value_counts.get(normalize_value(value), 0) for value in unique_values}
         
         return jsonify({
             "success": True,
-            "values": unique_values
+            "values": unique_values,
+            "counts": counts
         })
         
     except Exception as e:
@@ -394,4 +846,7 @@ def get_category_values():
 
 
 if __name__ == '__main__':
+    # With the debug reloader only the child process should run jobs
+    if RUN_WORKERS and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        job_runner.start()
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,295 @@
+"""Benchmark the contact pipeline on synthetic sheets.
+
+Generates contact sheets like create_sample_excel.py (Name, Phone and Yes/No
+category columns) at several sizes, times each stage - ingestion, indexing,
+filter matching, the preview and category-value endpoints, phone validation,
+template rendering and dispatch through the fake send backend - and writes
+the results as JSON.
+
+    python benchmark.py --rows 1000 10000 100000 --categories 6 --filters 4
+    python benchmark.py --rows 1000000 --no-xlsx --send-limit 5000
+    python benchmark.py --baseline benchmark_results.json   # flag regressions
+"""
+import os
+import sys
+import csv
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+from datetime import datetime
+
+CATEGORY_NAMES = ['Mehendi', 'Sangeet', 'Wedding', 'Reception']
+FIRST_NAMES = ['Ganesh', 'Priya', 'Rahul', 'Anjali', 'Vikram', 'Sneha', 'Arjun', 'Kavya', 'Rohan', 'Meera']
+LAST_NAMES = ['Kumar', 'Sharma', 'Verma', 'Patel', 'Singh', 'Iyer', 'Reddy', 'Gupta', 'Nair', 'Joshi']
+
+
+def category_headers(count):
+    return [CATEGORY_NAMES[i] if i < len(CATEGORY_NAMES) else f'Category{i + 1}' for i in range(count)]
+
+
+def generate_sheet(path, rows, categories, yes_ratio=0.5, seed=0, sheets=1):
+    """Write a synthetic CSV or XLSX contact sheet (XLSX rows split over
+    ``sheets`` worksheets); return the headers"""
+    rng = random.Random(seed)
+    headers = ['Name', 'Phone'] + category_headers(categories)
+
+    def contacts():
+        for i in range(rows):
+            name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+            phone = f"+91{9000000000 + i}"
+            yield [name, phone] + ['Yes' if rng.random() < yes_ratio else 'No' for _ in range(categories)]
+
+    if path.endswith('.csv'):
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(headers)
+            writer.writerows(contacts())
+    else:
+        import openpyxl
+        wb = openpyxl.Workbook(write_only=True)
+        worksheets = [wb.create_sheet("Wedding Contacts" if sheets == 1 else f"Side {i + 1}") for i in range(sheets)]
+        for ws in worksheets:
+            ws.append(headers)
+        for i, contact in enumerate(contacts()):
+            worksheets[i * sheets // rows].append(contact)
+        wb.save(path)
+    return headers
+
+
+def generate_filters(headers, count, seed=0):
+    """Filter/message pairs over one or two random categories"""
+    rng = random.Random(seed)
+    categories = headers[2:]
+    filter_messages = []
+    for i in range(count):
+        chosen = rng.sample(categories, min(len(categories), 1 + i % 2))
+        filter_messages.append({
+            "filters": {category: 'Yes' for category in chosen},
+            "template": f"Hi {{Name}}, you're invited to the {' & '.join(chosen)}! Reply to {{Phone|us}}.",
+            "send_datetime": None
+        })
+    return filter_messages
+
+
+def timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def stage(seconds, items=None, **extra):
+    result = {"seconds": round(seconds, 4)}
+    if items is not None:
+        result["items"] = items
+        result["per_second"] = round(items / seconds, 1) if seconds > 0 else None
+    result.update(extra)
+    return result
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def run_size(rows, args, workdir):
+    """Time every stage for one sheet size"""
+    import app
+    from category_index import CategoryIndex, row_ids_from_bits, count_bits
+    from message_template import compile_template
+    from phone_numbers import validate_contacts
+    from send_from_csv import run_send_job, FakeServerBackend
+
+    stages = {}
+    csv_path = os.path.join(workdir, f'contacts_{rows}.csv')
+    headers, seconds = timed(generate_sheet, csv_path, rows, args.categories, args.yes_ratio, args.seed)
+    stages['generate_csv'] = stage(seconds, rows, bytes=os.path.getsize(csv_path))
+
+    (headers, data), seconds = timed(app.parse_csv_file, csv_path)
+    stages['ingest_csv'] = stage(seconds, len(data))
+
+    if args.xlsx and rows <= args.xlsx_max_rows:
+        xlsx_path = os.path.join(workdir, f'contacts_{rows}.xlsx')
+        _, seconds = timed(generate_sheet, xlsx_path, rows, args.categories, args.yes_ratio, args.seed)
+        stages['generate_xlsx'] = stage(seconds, rows, bytes=os.path.getsize(xlsx_path))
+        (_, xlsx_rows), seconds = timed(app.parse_xlsx_file, xlsx_path)
+        stages['ingest_xlsx'] = stage(seconds, len(xlsx_rows))
+        del xlsx_rows
+
+        if args.sheets > 1:
+            from parallel_ingest import ingest_parts, parse_parts, merge_parts, INGEST_WORKERS
+            sheets_path = os.path.join(workdir, f'contacts_{rows}_sheets.xlsx')
+            generate_sheet(sheets_path, rows, args.categories, args.yes_ratio, args.seed, args.sheets)
+            parts = ingest_parts([(sheets_path, 'xlsx', 'contacts.xlsx')])
+            _, seconds = timed(parse_parts, parts, workers=1)
+            stages['sheets_serial'] = stage(seconds, rows, sheets=len(parts))
+            results, seconds = timed(parse_parts, parts)
+            stages['sheets_pool'] = stage(seconds, rows, sheets=len(parts),
+                                                 workers=min(len(parts), INGEST_WORKERS))
+            (_, merged, _), seconds = timed(merge_parts, parts, results, app.detect_contact_columns)
+            stages['sheets_merge'] = stage(seconds, len(merged))
+            del results, merged
+
+    filter_messages = generate_filters(headers, args.filters, args.seed)
+
+    def build_index():
+        index = CategoryIndex(headers, data)
+        for col_idx in range(2, len(headers)):
+            index.postings(col_idx)
+        return index
+    index, seconds = timed(build_index)
+    stages['index_build'] = stage(seconds, len(data))
+
+    def match_all():
+        return [index.match(fm['filters']) for fm in filter_messages]
+    matches, seconds = timed(match_all)
+    matched = sum(count_bits(bits) for bits in matches)
+    stages['filter_match'] = stage(seconds, len(filter_messages), matched_deliveries=matched)
+
+    dataset_id = app.dataset_store.put(headers, data, headers[2:], index=index)
+    client = app.app.test_client()
+
+    _, seconds = timed(app.dataset_store.get_facets, dataset_id)
+    stages['facet_build'] = stage(seconds, len(data))
+
+    def preview_all():
+        for fm in filter_messages:
+            response = client.post('/preview-filter', json={"dataset_id": dataset_id, "filters": fm['filters']})
+            assert response.status_code == 200, response.get_data(as_text=True)
+    _, seconds = timed(preview_all)
+    stages['preview_filter'] = stage(seconds, len(filter_messages))
+
+    def category_values_all():
+        for category in headers[2:]:
+            response = client.post('/get-category-values', json={"dataset_id": dataset_id, "category": category})
+            assert response.status_code == 200, response.get_data(as_text=True)
+    _, seconds = timed(category_values_all)
+    stages['category_values'] = stage(seconds, len(headers) - 2)
+
+    (_, _, report), seconds = timed(validate_contacts, data, 1, '+91')
+    stages['phone_validation'] = stage(seconds, len(data), valid=report['valid'])
+
+    def render_all():
+        templates = [compile_template(fm['template'], headers, 0, 1) for fm in filter_messages]
+        rendered = 0
+        for template, bits in zip(templates, matches):
+            for row_id in row_ids_from_bits(bits):
+                template.render(data[row_id])
+                rendered += 1
+        return rendered
+    rendered, seconds = timed(render_all)
+    stages['render'] = stage(seconds, rendered)
+
+    send_rows = data.to_rows(0, args.send_limit) if args.send_limit else data
+    params = {
+        "rows": send_rows,
+        "headers": headers,
+        "filter_messages": filter_messages,
+        "send_backend": FakeServerBackend(pool_size=args.concurrency, latency=args.latency),
+        "concurrency": args.concurrency
+    }
+    summary, seconds = timed(run_send_job, params, lambda line: None)
+    stages['dispatch'] = stage(seconds, summary['sent'], rows=len(send_rows),
+                               send_throughput_per_minute=summary['throughput_per_minute'],
+                               errors=summary['errors'], concurrency=summary['concurrency'])
+
+    app.dataset_store.discard(dataset_id)
+    return {"rows": rows, "categories": args.categories, "filters": args.filters,
+            "stages": stages, "peak_rss_mb": peak_rss_mb()}
+
+
+def compare(results, baseline, tolerance, min_seconds=0.05):
+    """Stages that got slower than the baseline by more than ``tolerance``.
+
+    Stages faster than ``min_seconds`` in the baseline are too noisy to judge.
+    """
+    previous = {run['rows']: run['stages'] for run in baseline.get('runs', [])}
+    regressions = []
+    for run in results['runs']:
+        for name, current in run['stages'].items():
+            before = previous.get(run['rows'], {}).get(name)
+            if not before or name.startswith('generate_') or before['seconds'] < min_seconds:
+                continue
+            ratio = current['seconds'] / before['seconds']
+            if ratio > 1 + tolerance:
+                regressions.append({"rows": run['rows'], "stage": name, "before": before['seconds'],
+                                    "after": current['seconds'], "ratio": round(ratio, 2)})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark ingestion, matching, rendering and dispatch')
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='Sheet sizes to benchmark')
+    parser.add_argument('--categories', type=int, default=4, help='Category columns per sheet')
+    parser.add_argument('--filters', type=int, default=3, help='Filter/message pairs')
+    parser.add_argument('--yes-ratio', type=float, default=0.5, help="Share of 'Yes' cells")
+    parser.add_argument('--no-xlsx', dest='xlsx', action='store_false', help='Skip XLSX generation and parsing')
+    parser.add_argument('--xlsx-max-rows', type=int, default=100000,
+                        help='Largest sheet to also benchmark as XLSX')
+    parser.add_argument('--sheets', type=int, default=4,
+                        help='Worksheets for the parallel multi-sheet ingestion stages (1 = skip)')
+    parser.add_argument('--send-limit', type=int, default=2000,
+                        help='Contacts sent through the fake backend per size (0 = all)')
+    parser.add_argument('--concurrency', type=int, default=8, help='Parallel senders for dispatch')
+    parser.add_argument('--latency', type=float, default=0.0, help='Fake backend response latency (seconds)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', help='Earlier results file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed slowdown vs. baseline before a stage counts as a regression')
+    parser.add_argument('--min-seconds', type=float, default=0.05,
+                        help='Ignore stages faster than this in the baseline when comparing')
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    # app creates data/ and uploads/ in the working directory; keep those out of the repo
+    workdir = tempfile.mkdtemp(prefix='wa-bench-')
+    os.chdir(workdir)
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec='seconds'),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')}
+        },
+        "runs": []
+    }
+    for rows in args.rows:
+        print(f"⏱️ Benchmarking {rows} rows...")
+        run = run_size(rows, args, workdir)
+        results['runs'].append(run)
+        for name, result in run['stages'].items():
+            rate = f" ({result['per_second']:.0f}/s)" if result.get('per_second') else ''
+            print(f"   {name:<18} {result['seconds']:>9.3f}s{rate}")
+
+    exit_code = 0
+    if baseline is not None:
+        results['regressions'] = compare(results, baseline, args.tolerance, args.min_seconds)
+        for regression in results['regressions']:
+            print(f"⚠️ Regression: {regression['stage']} at {regression['rows']} rows "
+                  f"{regression['before']}s -> {regression['after']}s (x{regression['ratio']})")
+        exit_code = 1 if results['regressions'] else 0
+
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"✅ Results written to {output}")
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
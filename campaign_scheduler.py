@@ -0,0 +1,105 @@
+import time
+import heapq
+import itertools
+import threading
+from array import array
+from datetime import datetime
+from metrics import SCHEDULED
+
+
+def parse_send_datetime(value):
+    """Turn a filter's ``send_datetime`` ("YYYY-MM-DDTHH:MM", local time)
+    into a Unix timestamp. Empty values mean "send now" (returns None).
+    """
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).strip()).timestamp()
+    except ValueError:
+        raise Exception(f"Invalid send date/time: {value}")
+
+
+class CampaignScheduler:
+    """Process-wide min-heap of future deliveries, ordered by due time.
+
+    Entries are compact ``(due_ts, seq, campaign, filter_idx, row_ids)``
+    tuples where ``row_ids`` is an ``array('I')`` of dataset row IDs, so a
+    filter matching a million contacts costs one heap entry and ~4 bytes per
+    contact. A single dispatcher thread sleeps until the earliest entry is
+    due and hands it to the campaign's ``dispatch(filter_idx, row_ids)``
+    callback, which must not block (e.g. it puts the batch on a queue that
+    the campaign's own send pool drains).
+    """
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self._heap = []
+        self._seq = itertools.count()
+        self._campaigns = {}
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def register(self, campaign, dispatch):
+        with self._cond:
+            self._campaigns[campaign] = dispatch
+
+    def cancel(self, campaign):
+        """Forget a campaign; its remaining entries are dropped when they come due"""
+        with self._cond:
+            self._campaigns.pop(campaign, None)
+
+    def schedule(self, campaign, due_ts, filter_idx, row_ids):
+        """Queue a batch of rows for one filter; ``due_ts`` None means now"""
+        if not row_ids:
+            return
+        if not isinstance(row_ids, array):
+            row_ids = array('I', row_ids)
+        entry = (due_ts if due_ts is not None else self.clock(), next(self._seq), campaign, filter_idx, row_ids)
+        with self._cond:
+            heapq.heappush(self._heap, entry)
+            if self._heap[0] is entry:
+                self._cond.notify()
+        self.start()
+
+    def pending(self, campaign=None):
+        """Number of deliveries still waiting (for one campaign, or all)"""
+        with self._cond:
+            return sum(len(entry[4]) for entry in self._heap
+                       if campaign is None or entry[2] == campaign)
+
+    def next_due(self):
+        with self._cond:
+            return self._heap[0][0] if self._heap else None
+
+    def start(self):
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='campaign-scheduler', daemon=True)
+                self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    delay = self._heap[0][0] - self.clock()
+                    if delay <= 0:
+                        break
+                    self._cond.wait(delay)
+                due = []
+                now = self.clock()
+                while self._heap and self._heap[0][0] <= now:
+                    _, _, campaign, filter_idx, row_ids = heapq.heappop(self._heap)
+                    dispatch = self._campaigns.get(campaign)
+                    if dispatch is not None:
+                        due.append((dispatch, filter_idx, row_ids))
+
+            for dispatch, filter_idx, row_ids in due:
+                dispatch(filter_idx, row_ids)
+
+
+scheduler = CampaignScheduler()
+SCHEDULED.set_function(scheduler.pending)
@@ -0,0 +1,178 @@
+import math
+import heapq
+import random
+import itertools
+from array import array
+from send_pool import TokenBucket, PhoneCooldown, backoff_delay
+
+
+def latency_preset(params):
+    """Default send latency distribution for the job's backend"""
+    backend = params.get('backend') or 'pywhatkit'
+    if backend == 'pywhatkit':
+        # sendwhatmsg waits for the next minute, then the page load, the
+        # wait_time pause and the ESC/close sleeps
+        wait_time = float(params.get('wait_time', 10))
+        return {"kind": "uniform", "low": 2 * wait_time + 3, "high": 2 * wait_time + 63}
+    if backend == 'http':
+        return {"kind": "lognormal", "median": 0.35, "sigma": 0.5}
+    return {"kind": "fixed", "value": 0.005}
+
+
+def latency_sampler(spec, rng):
+    """Build ``sample() -> seconds`` from a distribution spec such as
+    ``{"kind": "lognormal", "median": 0.35, "sigma": 0.5}``.
+
+    Kinds: fixed (value), uniform (low, high), normal (mean, stddev),
+    lognormal (median, sigma) and exponential (mean). Samples are never negative.
+    """
+    kind = spec.get('kind', 'fixed')
+    try:
+        if kind == 'fixed':
+            value = max(0.0, float(spec.get('value', 0)))
+            return lambda: value
+        if kind == 'uniform':
+            low, high = float(spec['low']), float(spec['high'])
+            return lambda: max(0.0, rng.uniform(low, high))
+        if kind == 'normal':
+            mean, stddev = float(spec['mean']), float(spec.get('stddev', 0))
+            return lambda: max(0.0, rng.gauss(mean, stddev))
+        if kind == 'lognormal':
+            mu, sigma = math.log(float(spec['median'])), float(spec.get('sigma', 0.5))
+            return lambda: rng.lognormvariate(mu, sigma)
+        if kind == 'exponential':
+            rate = 1.0 / float(spec['mean'])
+            return lambda: rng.expovariate(rate)
+    except (KeyError, TypeError, ValueError, ZeroDivisionError):
+        raise Exception(f"Invalid {kind} latency settings: {spec}")
+    raise Exception(f"Unknown latency distribution: {kind}")
+
+
+def format_duration(seconds):
+    """Human-readable duration: '12.5s', '3m 20s', '2h 05m', '3d 4h'"""
+    if seconds < 60:
+        return f"{seconds:.1f}s"
+    minutes, secs = divmod(int(round(seconds)), 60)
+    if minutes < 60:
+        return f"{minutes}m {secs:02d}s"
+    hours, minutes = divmod(minutes, 60)
+    if hours < 48:
+        return f"{hours}h {minutes:02d}m"
+    days, hours = divmod(hours, 24)
+    return f"{days}d {hours}h"
+
+
+class VirtualClock:
+    """Clock for TokenBucket/PhoneCooldown that only moves when told to"""
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def simulate_sends(deliveries, start, concurrency=1, rate_per_second=0, phone_cooldown=0,
+                   latency=None, failure_rate=0.0, max_attempts=3, retry_base=5.0, retry_max=300.0,
+                   queue_size=None, seed=0):
+    """Replay a campaign's deliveries through a model of SendWorkerPool in
+    virtual time and return timing estimates.
+
+    ``deliveries`` is a list of ``(due_ts, phone, filter_label)``. The model
+    uses the pool's own TokenBucket and PhoneCooldown on a VirtualClock:
+    ``concurrency`` workers take due deliveries in FIFO order, wait for the
+    rate limit and per-phone cooldown, then "send" for a sampled latency.
+    Sends fail with probability ``failure_rate`` and are retried with the
+    same backoff as real jobs. Nothing sleeps, so millions of deliveries
+    simulate in seconds.
+    """
+    rng = random.Random(seed)
+    sample = latency_sampler(latency or {"kind": "fixed", "value": 0}, rng)
+    clock = VirtualClock(start)
+    limiter = TokenBucket(rate_per_second, clock=clock)
+    cooldown = PhoneCooldown(phone_cooldown, clock=clock)
+    queue_size = queue_size or concurrency * 100
+
+    seq = itertools.count()
+    ready = [(max(due_ts or start, start), next(seq), idx, 1) for idx, (due_ts, _, _) in enumerate(deliveries)]
+    heapq.heapify(ready)
+    workers = [start] * max(1, concurrency)
+
+    # Backlog (due but not yet taken by a worker) only shrinks when a worker
+    # takes a delivery, so its peak is found by checking just before each pick.
+    # Picks happen in time order, so due times are consumed with a cursor.
+    due_times = array('d', sorted(entry[0] for entry in ready))
+    due_cursor = 0
+    retry_due = []
+    retries_due = 0
+    picked = 0
+    peak_backlog = 0
+    per_filter = {}
+    sent = failed = retries = 0
+    first_send = None
+    finished = start
+    busy_seconds = 0.0
+
+    while ready:
+        free_at = heapq.heappop(workers)
+        ready_at, _, idx, attempt = heapq.heappop(ready)
+        picked_at = max(free_at, ready_at)
+        while due_cursor < len(due_times) and due_times[due_cursor] <= picked_at:
+            due_cursor += 1
+        while retry_due and retry_due[0] <= picked_at:
+            heapq.heappop(retry_due)
+            retries_due += 1
+        peak_backlog = max(peak_backlog, due_cursor + retries_due - picked)
+        picked += 1
+
+        _, phone, label = deliveries[idx]
+        clock.now = picked_at
+        wait = max(limiter.reserve(), cooldown.reserve(phone))
+        sent_at = picked_at + wait
+        duration = sample()
+        done_at = sent_at + duration
+        busy_seconds += duration
+        if first_send is None or sent_at < first_send:
+            first_send = sent_at
+        finished = max(finished, done_at)
+        heapq.heappush(workers, done_at)
+
+        stats = per_filter.get(label)
+        if stats is None:
+            stats = per_filter[label] = {"filter": label, "messages": 0, "attempts": 0,
+                                         "first_send": sent_at, "finished": done_at}
+        stats['attempts'] += 1
+        stats['first_send'] = min(stats['first_send'], sent_at)
+        stats['finished'] = max(stats['finished'], done_at)
+
+        if failure_rate and rng.random() < failure_rate:
+            if attempt < max_attempts:
+                retries += 1
+                retry_at = done_at + backoff_delay(attempt, retry_base, retry_max, rng.random)
+                heapq.heappush(ready, (retry_at, next(seq), idx, attempt + 1))
+                heapq.heappush(retry_due, retry_at)
+            else:
+                failed += 1
+                stats['messages'] += 1
+            continue
+        sent += 1
+        stats['messages'] += 1
+
+    send_seconds = finished - first_send if first_send is not None else 0.0
+    workers_used = max(1, concurrency)
+    return {
+        "deliveries": len(deliveries),
+        "sent": sent,
+        "failed": failed,
+        "retries": retries,
+        "start": start,
+        "first_send": first_send,
+        "finish": finished,
+        "wall_clock_seconds": finished - start,
+        "send_seconds": send_seconds,
+        "throughput_per_minute": round((sent + failed + retries) / send_seconds * 60, 1) if send_seconds > 0 else None,
+        "worker_utilization": round(busy_seconds / (send_seconds * workers_used), 3) if send_seconds > 0 else None,
+        "peak_backlog": peak_backlog,
+        "peak_queue_depth": min(peak_backlog, queue_size),
+        "filters": sorted(per_filter.values(), key=lambda stats: stats['first_send'])
+    }
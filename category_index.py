@@ -0,0 +1,243 @@
+import threading
+from contact_dataset import ContactDataset, DictColumn
+
+
+def normalize_value(value):
+    """Normalize a cell for case-insensitive filter comparison"""
+    return str(value).strip().upper()
+
+
+def bits_from_row_ids(row_ids, row_count):
+    """Pack an iterable of row IDs into an int bitset"""
+    flags = bytearray((row_count + 7) // 8)
+    for row_id in row_ids:
+        flags[row_id >> 3] |= 1 << (row_id & 7)
+    return int.from_bytes(flags, 'little')
+
+
+_BYTE_BITS = [tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)]
+
+
+def row_ids_from_bits(bits, limit=None):
+    """Unpack an int bitset into an ascending list of row IDs"""
+    row_ids = []
+    if not bits:
+        return row_ids
+    data = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+    for byte_idx, byte in enumerate(data):
+        if not byte:
+            continue
+        base = byte_idx << 3
+        for bit in _BYTE_BITS[byte]:
+            row_ids.append(base + bit)
+            if limit is not None and len(row_ids) >= limit:
+                return row_ids
+    return row_ids
+
+
+def count_bits(bits):
+    return bin(bits).count('1')
+
+
+if hasattr(int, 'bit_count'):
+    # Python 3.10+: popcount without building a string of every bit
+    count_bits = int.bit_count
+
+
+def remove_bits(bits, positions):
+    """Drop the given bit positions from a bitset, shifting higher bits down
+    (row IDs after a deleted row move up by one)"""
+    for position in sorted(set(positions), reverse=True):
+        low = bits & ((1 << position) - 1)
+        bits = low | ((bits >> (position + 1)) << position)
+    return bits
+
+
+def bits_from_codes(codes, wanted):
+    """Bitset of rows whose dictionary code (an ``array``) is one of ``wanted``.
+
+    Byte-sized codes need no per-row Python loop: they are translated to
+    '0'/'1' digits and parsed as a base-2 int.
+    """
+    if codes.typecode == 'B':
+        table = bytearray(b'0' * 256)
+        for code in wanted:
+            table[code] = ord('1')
+        # Row 0 is the lowest bit, so the digits are read in reverse
+        return int(codes.tobytes().translate(table)[::-1] or b'0', 2)
+    wanted = set(wanted)
+    return bits_from_row_ids((row_id for row_id, code in enumerate(codes) if code in wanted), len(codes))
+
+
+class CategoryIndex:
+    """Inverted index from normalized cell values to row bitsets.
+
+    Column positions are resolved once from the headers. The posting list
+    for a column (value -> bitset of row IDs) is built the first time the
+    column is filtered on and reused afterwards, so a multi-category filter
+    is just an AND of a few ints.
+    """
+
+    def __init__(self, headers, rows):
+        self.headers = list(headers)
+        self.rows = rows
+        self.row_count = len(rows)
+        self.all_bits = (1 << self.row_count) - 1
+        self.columns = {}
+        for idx, header in enumerate(self.headers):
+            self.columns.setdefault(header, idx)
+        self._postings = {}
+        self._lock = threading.Lock()
+
+    def copy(self, rows):
+        """A separate index over ``rows`` (a copy of this index's rows) that
+        starts with the posting lists built so far"""
+        index = CategoryIndex(self.headers, rows)
+        with self._lock:
+            index._postings = {col_idx: dict(postings) for col_idx, postings in self._postings.items()}
+        return index
+
+    def column_index(self, category):
+        """Column position for a header, or -1 if it doesn't exist"""
+        return self.columns.get(category, -1)
+
+    def has_postings(self, col_idx):
+        """Whether the posting list for a column has been built already"""
+        return col_idx in self._postings
+
+    def postings(self, col_idx):
+        """Return {normalized value: bitset} for a column, building it once"""
+        postings = self._postings.get(col_idx)
+        if postings is not None:
+            return postings
+        with self._lock:
+            postings = self._postings.get(col_idx)
+            if postings is None:
+                postings = self._build_postings(col_idx)
+                self._postings[col_idx] = postings
+        return postings
+
+    def _build_postings(self, col_idx):
+        if isinstance(self.rows, ContactDataset) and self.rows.lengths is None:
+            column = self.rows.column(col_idx)
+            if column is None:
+                return {}
+            if isinstance(column, DictColumn):
+                return self._postings_from_codes(column)
+            cells = enumerate(column.slice(0, self.row_count))
+        else:
+            cells = ((row_id, row[col_idx]) for row_id, row in enumerate(self.rows) if col_idx < len(row))
+        row_ids_by_value = {}
+        for row_id, value in cells:
+            key = normalize_value(value)
+            row_ids = row_ids_by_value.get(key)
+            if row_ids is None:
+                row_ids_by_value[key] = [row_id]
+            else:
+                row_ids.append(row_id)
+        return {
+            key: bits_from_row_ids(row_ids, self.row_count)
+            for key, row_ids in row_ids_by_value.items()
+        }
+
+    def _postings_from_codes(self, column):
+        """Postings for a dictionary-encoded column: each distinct value is
+        normalized once, and byte-sized codes become bitsets without a
+        per-row Python loop (see bits_from_codes)."""
+        codes_by_key = {}
+        for code, value in enumerate(column.values):
+            codes_by_key.setdefault(normalize_value(value), []).append(code)
+
+        postings = {}
+        if column.codes.typecode == 'B':
+            for key, codes in codes_by_key.items():
+                bits = bits_from_codes(column.codes, codes)
+                if bits:
+                    postings[key] = bits
+            return postings
+
+        key_of_code = [None] * len(column.values)
+        for key, codes in codes_by_key.items():
+            for code in codes:
+                key_of_code[code] = key
+        row_ids_by_key = {}
+        for row_id, code in enumerate(column.codes):
+            row_ids_by_key.setdefault(key_of_code[code], []).append(row_id)
+        return {
+            key: bits_from_row_ids(row_ids, self.row_count)
+            for key, row_ids in row_ids_by_key.items()
+        }
+
+    def add_rows(self, new_rows):
+        """Append rows and fold them into every posting list built so far.
+
+        Lets ingestion feed the index chunk by chunk: postings requested
+        before the first chunk (e.g. for the category columns) stay current.
+        """
+        start = self.row_count
+        self.rows.extend(new_rows)
+        self.row_count = len(self.rows)
+        self.all_bits = (1 << self.row_count) - 1
+        with self._lock:
+            for col_idx, postings in self._postings.items():
+                row_ids_by_value = {}
+                for offset, row in enumerate(new_rows):
+                    if col_idx < len(row):
+                        row_ids_by_value.setdefault(normalize_value(row[col_idx]), []).append(offset)
+                for key, row_ids in row_ids_by_value.items():
+                    chunk_bits = bits_from_row_ids(row_ids, len(new_rows)) << start
+                    postings[key] = postings.get(key, 0) | chunk_bits
+
+    def update_cells(self, changes):
+        """Move edited cells between posting lists.
+
+        ``changes`` is a list of ``(row_id, col_idx, old_value, new_value)``
+        for cells already changed in ``rows``; only posting lists built so
+        far are touched.
+        """
+        with self._lock:
+            for row_id, col_idx, old_value, new_value in changes:
+                postings = self._postings.get(col_idx)
+                if postings is None:
+                    continue
+                bit = 1 << row_id
+                if old_value is not None:
+                    old_key = normalize_value(old_value)
+                    remaining = postings.get(old_key, 0) & ~bit
+                    if remaining:
+                        postings[old_key] = remaining
+                    else:
+                        postings.pop(old_key, None)
+                new_key = normalize_value(new_value)
+                postings[new_key] = postings.get(new_key, 0) | bit
+
+    def delete_rows(self, row_ids):
+        """Remove rows (already deleted from ``rows``) from every posting list"""
+        self.row_count = len(self.rows)
+        self.all_bits = (1 << self.row_count) - 1
+        with self._lock:
+            for postings in self._postings.values():
+                for key in list(postings):
+                    bits = remove_bits(postings[key], row_ids)
+                    if bits:
+                        postings[key] = bits
+                    else:
+                        del postings[key]
+
+    def match(self, filters):
+        """Bitset of rows matching every ``{category: value}`` pair"""
+        bits = self.all_bits
+        for category, required_value in filters.items():
+            col_idx = self.column_index(category)
+            if col_idx == -1:
+                return 0
+            bits &= self.postings(col_idx).get(str(required_value).upper(), 0)
+            if not bits:
+                return 0
+        return bits
+
+    def matching_rows(self, filters, limit=None):
+        return row_ids_from_bits(self.match(filters), limit)
+
+    def count(self, filters):
+        return count_bits(self.match(filters))
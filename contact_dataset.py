@@ -0,0 +1,401 @@
+import base64
+import itertools
+from array import array
+
+
+# Text columns are packed into one string per block of this many rows
+BLOCK_BITS = 12
+BLOCK_SIZE = 1 << BLOCK_BITS
+BLOCK_MASK = BLOCK_SIZE - 1
+
+# A column stays dictionary-encoded until it has more than this many
+# distinct values and fewer than DICT_MIN_REPEAT rows per value on average
+# (names, phone numbers); then its cells are stored as packed text instead.
+DICT_MAX_VALUES = 1024
+DICT_MIN_REPEAT = 4
+
+_WIDER_CODES = {'B': ('H', 1 << 8), 'H': ('I', 1 << 16), 'I': ('I', 1 << 32)}
+
+
+def _encode_array(values):
+    return base64.b64encode(values.tobytes()).decode('ascii')
+
+
+def _decode_array(typecode, data):
+    values = array(typecode)
+    values.frombytes(base64.b64decode(data))
+    return values
+
+
+def _without(values, positions, offset=0):
+    """Copy of an array or list minus the sorted ``positions`` (shifted by ``offset``)"""
+    kept = values[:0]
+    start = 0
+    for position in positions:
+        kept.extend(values[start:position - offset])
+        start = position - offset + 1
+    kept.extend(values[start:])
+    return kept
+
+
+class DictColumn:
+    """Dictionary-encoded column: each distinct value is stored once and
+    rows hold a 1/2/4-byte code, so a Yes/No column costs a byte per row."""
+
+    __slots__ = ('values', 'lookup', 'codes')
+
+    def __init__(self, values=None, codes=None):
+        self.values = values if values is not None else []
+        self.lookup = {value: code for code, value in enumerate(self.values)}
+        self.codes = codes if codes is not None else array('B')
+
+    def __len__(self):
+        return len(self.codes)
+
+    def get(self, row_id):
+        return self.values[self.codes[row_id]]
+
+    def _add(self, value):
+        code = len(self.values)
+        self.values.append(value)
+        self.lookup[value] = code
+        wider, limit = _WIDER_CODES[self.codes.typecode]
+        if code >= limit:
+            self.codes = array(wider, self.codes)
+        return code
+
+    def extend(self, cells):
+        get = self.lookup.get
+        codes = [get(value, -1) for value in cells]
+        if -1 in codes:
+            for pos, code in enumerate(codes):
+                if code == -1:
+                    value = cells[pos]
+                    code = get(value, -1)
+                    codes[pos] = code if code != -1 else self._add(value)
+        self.codes.extend(codes)
+
+    def set(self, row_id, value):
+        code = self.lookup.get(value)
+        self.codes[row_id] = code if code is not None else self._add(value)
+
+    def slice(self, start, stop):
+        return list(map(self.values.__getitem__, self.codes[start:stop]))
+
+    def delete(self, row_ids):
+        # Values no longer used keep their code; distinct_values skips them
+        self.codes = _without(self.codes, row_ids)
+
+    def high_cardinality(self):
+        return len(self.values) > DICT_MAX_VALUES and len(self.values) * DICT_MIN_REPEAT > len(self.codes)
+
+    def to_state(self):
+        return {"kind": "dict", "values": self.values, "typecode": self.codes.typecode,
+                "codes": _encode_array(self.codes)}
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(list(state['values']), _decode_array(state['typecode'], state['codes']))
+
+
+class TextColumn:
+    """Mostly-unique text (names, phone numbers): every BLOCK_SIZE rows are
+    joined into one string with an ``array`` of end offsets, so a cell costs
+    its characters plus 4 bytes instead of a whole ``str`` object."""
+
+    __slots__ = ('blocks', 'ends', 'tail')
+
+    def __init__(self, blocks=None, ends=None, tail=None):
+        self.blocks = blocks if blocks is not None else []
+        self.ends = ends if ends is not None else []
+        self.tail = tail if tail is not None else []
+
+    def __len__(self):
+        return (len(self.blocks) << BLOCK_BITS) + len(self.tail)
+
+    def get(self, row_id):
+        block_idx = row_id >> BLOCK_BITS
+        pos = row_id & BLOCK_MASK
+        if block_idx >= len(self.blocks):
+            return self.tail[row_id - (len(self.blocks) << BLOCK_BITS)]
+        ends = self.ends[block_idx]
+        return self.blocks[block_idx][ends[pos - 1] if pos else 0:ends[pos]]
+
+    def _block_values(self, block_idx):
+        text = self.blocks[block_idx]
+        ends = self.ends[block_idx]
+        return [text[start:end] for start, end in zip(itertools.chain((0,), ends), ends)]
+
+    def _pack(self, values):
+        return ''.join(values), array('I', itertools.accumulate(map(len, values)))
+
+    def extend(self, cells):
+        tail = self.tail
+        tail.extend(cells)
+        while len(tail) >= BLOCK_SIZE:
+            text, ends = self._pack(tail[:BLOCK_SIZE])
+            self.blocks.append(text)
+            self.ends.append(ends)
+            del tail[:BLOCK_SIZE]
+
+    def set(self, row_id, value):
+        block_idx = row_id >> BLOCK_BITS
+        if block_idx >= len(self.blocks):
+            self.tail[row_id - (len(self.blocks) << BLOCK_BITS)] = value
+            return
+        values = self._block_values(block_idx)
+        values[row_id & BLOCK_MASK] = value
+        self.blocks[block_idx], self.ends[block_idx] = self._pack(values)
+
+    def delete(self, row_ids):
+        # Blocks have a fixed size, so everything from the first affected block is repacked
+        start = (row_ids[0] >> BLOCK_BITS) << BLOCK_BITS
+        values = _without(self.slice(start, len(self)), row_ids, start)
+        del self.blocks[start >> BLOCK_BITS:]
+        del self.ends[start >> BLOCK_BITS:]
+        self.tail = []
+        self.extend(values)
+
+    def slice(self, start, stop):
+        stop = min(stop, len(self))
+        if start >= stop:
+            return []
+        block_idx = start >> BLOCK_BITS
+        offset = block_idx << BLOCK_BITS
+        values = []
+        while block_idx < len(self.blocks) and (block_idx << BLOCK_BITS) < stop:
+            values.extend(self._block_values(block_idx))
+            block_idx += 1
+        if stop > (len(self.blocks) << BLOCK_BITS):
+            values.extend(self.tail)
+        return values[start - offset:stop - offset]
+
+    def to_state(self):
+        return {"kind": "text", "blocks": self.blocks, "ends": [_encode_array(ends) for ends in self.ends],
+                "tail": self.tail}
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(list(state['blocks']), [_decode_array('I', ends) for ends in state['ends']], list(state['tail']))
+
+
+_COLUMN_KINDS = {"dict": DictColumn, "text": TextColumn}
+
+
+class RowView:
+    """Read-only list-like view of one dataset row (``len``, indexing,
+    iteration), so code written for ``rows[i][col]`` keeps working."""
+
+    __slots__ = ('dataset', 'row_id')
+
+    def __init__(self, dataset, row_id):
+        self.dataset = dataset
+        self.row_id = row_id
+
+    def __len__(self):
+        return self.dataset.row_length(self.row_id)
+
+    def __getitem__(self, col_idx):
+        dataset = self.dataset
+        if type(col_idx) is int and dataset.lengths is None and 0 <= col_idx < dataset.width:
+            return dataset.columns[col_idx].get(self.row_id)
+        if isinstance(col_idx, slice):
+            return self.to_list()[col_idx]
+        length = dataset.row_length(self.row_id)
+        if col_idx < 0:
+            col_idx += length
+        if not 0 <= col_idx < length:
+            raise IndexError('row index out of range')
+        return dataset.columns[col_idx].get(self.row_id)
+
+    def __iter__(self):
+        return iter(self.to_list())
+
+    def __eq__(self, other):
+        if isinstance(other, RowView):
+            other = other.to_list()
+        return self.to_list() == other
+
+    def __repr__(self):
+        return f"RowView({self.to_list()!r})"
+
+    def to_list(self):
+        row_id = self.row_id
+        return [column.get(row_id) for column in self.dataset.columns[:len(self)]]
+
+
+class ContactDataset:
+    """Column-oriented contact sheet.
+
+    Cells are kept per column - dictionary-encoded for repetitive columns
+    (categories, where most values are "Yes"/"No") and packed text for
+    mostly-unique ones - instead of a Python list of ``str`` per row.
+    Indexing returns a ``RowView``, so the dataset can stand in for the
+    old list of rows. Short rows are remembered (their missing cells read
+    as absent, not ''), and non-string cells are stored as strings.
+    """
+
+    def __init__(self, headers=(), rows=()):
+        self.headers = list(headers)
+        self.columns = []
+        self.row_count = 0
+        self.width = 0
+        # Per-row cell counts; None while every row has ``width`` cells
+        self.lengths = None
+        if rows:
+            self.extend(rows)
+
+    def __len__(self):
+        return self.row_count
+
+    def __getitem__(self, row_id):
+        if row_id < 0:
+            row_id += self.row_count
+        if not 0 <= row_id < self.row_count:
+            raise IndexError('dataset index out of range')
+        return RowView(self, row_id)
+
+    def __iter__(self):
+        for row_id in range(self.row_count):
+            yield RowView(self, row_id)
+
+    def row_length(self, row_id):
+        return self.width if self.lengths is None else self.lengths[row_id]
+
+    def column(self, col_idx):
+        """The column object for a position, or None past the widest row"""
+        return self.columns[col_idx] if 0 <= col_idx < self.width else None
+
+    def _widen(self, width):
+        for _ in range(self.width, width):
+            # Rows already stored read '' in the new column
+            self.columns.append(DictColumn([''], array('B', bytes(self.row_count))) if self.row_count else DictColumn())
+        self.width = width
+
+    def extend(self, rows):
+        """Append a batch of rows (lists of cells)"""
+        rows = rows if isinstance(rows, list) else list(rows)
+        if not rows:
+            return
+        lengths = list(map(len, rows))
+        shortest, widest = min(lengths), max(lengths)
+        ragged = shortest != widest or (self.row_count and widest != self.width)
+        if ragged and self.lengths is None:
+            self.lengths = array('H', [self.width]) * self.row_count
+        if widest > self.width:
+            self._widen(widest)
+        if shortest != self.width:
+            padding = [''] * self.width
+            rows = [row if len(row) == self.width else list(row) + padding[len(row):] for row in rows]
+        if self.lengths is not None:
+            self.lengths.extend(lengths)
+
+        for col_idx, cells in enumerate(zip(*rows)):
+            if set(map(type, cells)) != {str}:
+                cells = ['' if value is None else str(value) for value in cells]
+            column = self.columns[col_idx]
+            column.extend(cells)
+            if isinstance(column, DictColumn) and column.high_cardinality():
+                text = TextColumn()
+                text.extend(column.slice(0, len(column)))
+                self.columns[col_idx] = text
+        self.row_count += len(rows)
+
+    def append(self, row):
+        self.extend([row])
+
+    def set_cell(self, row_id, col_idx, value):
+        """Overwrite one cell, growing the row (and dataset width) if needed"""
+        if not 0 <= row_id < self.row_count:
+            raise IndexError('dataset index out of range')
+        value = '' if value is None else str(value)
+        if col_idx >= self.row_length(row_id):
+            if self.lengths is None:
+                self.lengths = array('H', [self.width]) * self.row_count
+            if col_idx >= self.width:
+                self._widen(col_idx + 1)
+            self.lengths[row_id] = col_idx + 1
+        self.columns[col_idx].set(row_id, value)
+
+    def delete_rows(self, row_ids):
+        """Remove rows by ID; the rows after each one move up"""
+        row_ids = sorted(set(row_ids))
+        if not row_ids:
+            return
+        if row_ids[0] < 0 or row_ids[-1] >= self.row_count:
+            raise IndexError('dataset index out of range')
+        for column in self.columns:
+            column.delete(row_ids)
+        if self.lengths is not None:
+            self.lengths = _without(self.lengths, row_ids)
+        self.row_count -= len(row_ids)
+
+    def column_values(self, col_idx):
+        """Every row's cell in one column ('' where the row is too short)"""
+        if not 0 <= col_idx < self.width:
+            return [''] * self.row_count
+        return self.columns[col_idx].slice(0, self.row_count)
+
+    def distinct_values(self, col_idx):
+        """Distinct cells of a column in order of first appearance"""
+        column = self.column(col_idx)
+        if column is None:
+            return [''] if self.row_count else []
+        if isinstance(column, DictColumn):
+            # Codes are handed out in order of first appearance
+            values = [column.values[code] for code in sorted(set(column.codes))]
+        else:
+            values = list(dict.fromkeys(column.slice(0, self.row_count)))
+        if self.lengths is not None and '' not in values and min(self.lengths) <= col_idx:
+            values.append('')
+        return values
+
+    def to_rows(self, start=0, stop=None):
+        """Plain lists of cells for rows ``start:stop`` (e.g. for JSON)"""
+        stop = self.row_count if stop is None else min(stop, self.row_count)
+        if start >= stop:
+            return []
+        cells = [column.slice(start, stop) for column in self.columns]
+        if not cells:
+            return [[] for _ in range(start, stop)]
+        rows = list(map(list, zip(*cells)))
+        if self.lengths is not None:
+            for offset, length in enumerate(self.lengths[start:stop]):
+                if length != self.width:
+                    del rows[offset][length:]
+        return rows
+
+    def to_state(self):
+        """JSON-friendly encoding (job params, shared store)"""
+        return {
+            "headers": self.headers,
+            "row_count": self.row_count,
+            "width": self.width,
+            "lengths": _encode_array(self.lengths) if self.lengths is not None else None,
+            "columns": [column.to_state() for column in self.columns]
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        dataset = cls(state['headers'])
+        dataset.row_count = state['row_count']
+        dataset.width = state['width']
+        dataset.lengths = _decode_array('H', state['lengths']) if state.get('lengths') else None
+        dataset.columns = [_COLUMN_KINDS[column['kind']].from_state(column) for column in state['columns']]
+        return dataset
+
+
+def as_dataset(headers, rows):
+    """A ContactDataset for a list of rows, an encoded state or a dataset"""
+    if isinstance(rows, ContactDataset):
+        return rows
+    if isinstance(rows, dict):
+        return ContactDataset.from_state(rows)
+    return ContactDataset(headers, rows)
+
+
+def column_values(rows, col_idx):
+    """One column's cells from a ContactDataset or a list of rows"""
+    if isinstance(rows, ContactDataset):
+        return rows.column_values(col_idx)
+    return [row[col_idx] if col_idx < len(row) else '' for row in rows]
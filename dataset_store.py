@@ -0,0 +1,410 @@
+import os
+import json
+import zlib
+import threading
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from category_index import CategoryIndex
+from facet_counts import FacetCounts
+from contact_dataset import ContactDataset, as_dataset
+
+
+SPILLED_KEYS = ('headers', 'rows', 'categories', 'summary', 'version')
+# Patches are shared as a log of small deltas; every this many versions the
+# whole dataset is written again so a worker loading it replays only a few
+SNAPSHOT_EVERY = 50
+
+
+class VersionConflict(Exception):
+    """A patch was based on an older version of the dataset than the current one"""
+
+    def __init__(self, version):
+        super().__init__(f"Contacts were changed elsewhere (now version {version}), reload and try again")
+        self.version = version
+
+
+class ReadWriteLock:
+    """Any number of readers or one writer. A waiting writer holds back new
+    readers, so a patch isn't starved by a steady stream of page requests;
+    readers therefore must not take the lock again while holding it."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def reading(self):
+        with self._cond:
+            while self._writing or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def writing(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writing or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+
+def dataset_lock(dataset):
+    """The dataset dict's ReadWriteLock. Patches change its rows, index and
+    facet counts in place, so read them under ``reading()``."""
+    return dataset.setdefault('lock', ReadWriteLock())
+
+
+def snapshot_rows(dataset):
+    """``(version, rows)`` with an independent copy of the dataset's rows,
+    for work that outlives the request (send jobs)"""
+    with dataset_lock(dataset).reading():
+        return dataset['version'], ContactDataset.from_state(as_dataset(dataset['headers'], dataset['rows']).to_state())
+
+
+def dataset_index(dataset):
+    """Attach and return a CategoryIndex for a dataset dict"""
+    index = dataset.get('index')
+    if index is None:
+        index = CategoryIndex(dataset['headers'], dataset['rows'])
+        dataset['index'] = index
+    return index
+
+
+def dataset_facets(dataset):
+    """Attach and return FacetCounts over a dataset dict's category columns"""
+    facets = dataset.get('facets')
+    if facets is None:
+        headers = dataset['headers']
+        category_cols = [headers.index(category) for category in dataset['categories'] if category in headers]
+        facets = FacetCounts(dataset_index(dataset), category_cols)
+        dataset['facets'] = facets
+    return facets
+
+
+def _dump(dataset):
+    """JSON-friendly copy of a dataset dict (rows as an encoded ContactDataset)"""
+    dumped = {key: dataset.get(key) for key in SPILLED_KEYS}
+    dumped['rows'] = as_dataset(dataset['headers'], dataset['rows']).to_state()
+    return dumped
+
+
+def _restore(data):
+    data['rows'] = as_dataset(data['headers'], data['rows'])
+    data.setdefault('summary', None)
+    data['version'] = data.get('version') or 0
+    return data
+
+
+def check_patch(dataset, patch):
+    """Validate a patch against a dataset and return it normalized:
+    ``updates`` as ``[row_id, col_idx, value]``, sorted unique ``deletes``
+    and ``inserts`` as lists of strings. Raises on anything out of range."""
+    rows = dataset['rows']
+    width = len(dataset['headers'])
+    updates = []
+    for row_id, col_idx, value in patch.get('updates') or []:
+        row_id, col_idx = int(row_id), int(col_idx)
+        if not 0 <= row_id < len(rows):
+            raise Exception(f"Row {row_id} does not exist")
+        if not 0 <= col_idx < width:
+            raise Exception(f"Column {col_idx} does not exist")
+        updates.append([row_id, col_idx, '' if value is None else str(value)])
+    deletes = sorted(set(int(row_id) for row_id in patch.get('deletes') or []))
+    if deletes and (deletes[0] < 0 or deletes[-1] >= len(rows)):
+        raise Exception("Deleted row does not exist")
+    inserts = []
+    for row in patch.get('inserts') or []:
+        if not isinstance(row, list) or len(row) > width:
+            raise Exception("Inserted rows must be lists of at most one cell per column")
+        inserts.append(['' if value is None else str(value) for value in row])
+    return {"updates": updates, "deletes": deletes, "inserts": inserts}
+
+
+def _update_summary(summary, rows, category_cols, removed, added):
+    """Fold a patch into the category summary: new values are appended, and
+    a value that was overwritten or deleted is dropped if no row has it any more"""
+    for col_idx, category in category_cols.items():
+        values = summary.setdefault(category, [])
+        present = set(values)
+        for value in added.get(col_idx, ()):
+            value = value.strip()
+            if value and value not in present:
+                values.append(value)
+                present.add(value)
+        gone = {value.strip() for value in removed.get(col_idx, ())} & present
+        if gone:
+            gone -= {value.strip() for value in rows.distinct_values(col_idx)}
+            if gone:
+                summary[category] = [value for value in values if value not in gone]
+
+
+def apply_patch(dataset, patch):
+    """Apply a checked patch in place and bump the dataset's version.
+
+    Updates address row IDs of the version the patch was made against,
+    then deletes remove rows (later rows move up) and inserts are appended.
+    A built CategoryIndex, the facet counts and the category summary are
+    updated for just the changed cells and rows instead of being rebuilt.
+    """
+    rows = dataset['rows']
+    headers = dataset['headers']
+    index = dataset.get('index')
+    facets = dataset.get('facets')
+    summary = dataset.get('summary')
+    category_cols = {headers.index(category): category for category in dataset['categories'] if category in headers}
+    removed = {}
+    added = {}
+
+    changes = []
+    for row_id, col_idx, value in patch['updates']:
+        # A cell past the end of a short row pads it with '' cells first;
+        # each padded cell is a change too, so it's applied one at a time
+        cells = [(pad_idx, '') for pad_idx in range(rows.row_length(row_id), col_idx)] + [(col_idx, value)]
+        for cell_idx, cell_value in cells:
+            old_value = rows[row_id][cell_idx] if cell_idx < rows.row_length(row_id) else None
+            rows.set_cell(row_id, cell_idx, cell_value)
+            changes.append((row_id, cell_idx, old_value, cell_value))
+            if facets is not None:
+                facets.update_cell(rows, row_id, cell_idx, old_value)
+            if cell_idx in category_cols:
+                if old_value is not None:
+                    removed.setdefault(cell_idx, []).append(old_value)
+                added.setdefault(cell_idx, []).append(cell_value)
+    if index is not None and changes:
+        index.update_cells(changes)
+
+    deletes = patch['deletes']
+    if deletes:
+        for col_idx in category_cols:
+            removed.setdefault(col_idx, []).extend(
+                rows[row_id][col_idx] for row_id in deletes if col_idx < rows.row_length(row_id))
+        if facets is not None:
+            facets.remove_rows(rows, deletes)
+        rows.delete_rows(deletes)
+        if index is not None:
+            index.delete_rows(deletes)
+
+    inserts = patch['inserts']
+    if inserts:
+        for col_idx in category_cols:
+            added.setdefault(col_idx, []).extend(row[col_idx] for row in inserts if col_idx < len(row))
+        start = len(rows)
+        if index is not None:
+            index.add_rows(inserts)
+        else:
+            rows.extend(inserts)
+        if facets is not None:
+            facets.add_rows(rows, start)
+
+    if summary is not None:
+        _update_summary(summary, rows, category_cols, removed, added)
+    dataset['version'] += 1
+
+
+def _pack(dataset):
+    data = json.dumps(_dump(dataset), ensure_ascii=False, separators=(',', ':'))
+    # Level 1: contact sheets are repetitive, so even the fastest level shrinks them several times
+    return zlib.compress(data.encode('utf-8'), 1)
+
+
+class DatasetStore:
+    """Keeps parsed contact datasets server-side, keyed by dataset ID.
+
+    Recently used datasets stay in memory (LRU). When more than
+    ``max_in_memory`` datasets are held, the least recently used one is
+    evicted and, if ``spill_dir`` is set, written to disk so a later lookup
+    can reload it instead of failing.
+
+    With a ``shared`` store (see shared_state.py) every dataset is also
+    written there on ``put``, so another app worker that gets a request for
+    it loads it from the shared store and builds its own index.
+
+    Datasets are edited in place with ``patch``. Each patch bumps the
+    dataset's version and is stored in the shared store as a small delta
+    under that version; the first worker to claim a version wins, and
+    workers holding an older copy replay the deltas they missed on ``get``.
+    """
+
+    def __init__(self, max_in_memory=8, spill_dir=None, shared=None, ttl=None):
+        self.max_in_memory = max_in_memory
+        self.spill_dir = spill_dir
+        self.shared = shared
+        self.ttl = ttl
+        self._datasets = OrderedDict()
+        self._lock = threading.Lock()
+        self._patch_lock = threading.RLock()
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def put(self, headers, rows, categories=None, index=None, summary=None):
+        """Store a dataset (and optionally its prebuilt index and category
+        summary), return its ID. ``rows`` is a ContactDataset; plain row
+        lists are converted."""
+        dataset_id = uuid.uuid4().hex
+        dataset = {
+            "headers": headers,
+            "rows": as_dataset(headers, rows),
+            "categories": categories or [],
+            "summary": summary,
+            "version": 0
+        }
+        if index is not None:
+            dataset['index'] = index
+        if self.shared is not None:
+            self.shared.set(self._shared_key(dataset_id), _pack(dataset), self.ttl)
+        with self._lock:
+            self._datasets[dataset_id] = dataset
+            self._evict_locked()
+        return dataset_id
+
+    def get(self, dataset_id):
+        """Return the dataset dict for an ID, or None if unknown/expired"""
+        if not dataset_id:
+            return None
+        with self._lock:
+            dataset = self._datasets.get(dataset_id)
+            if dataset is not None:
+                self._datasets.move_to_end(dataset_id)
+            else:
+                dataset = self._load_spilled(dataset_id)
+                if dataset is None:
+                    dataset = self._load_shared(dataset_id)
+                if dataset is not None:
+                    self._datasets[dataset_id] = dataset
+                    self._evict_locked()
+        if dataset is not None:
+            self._catch_up(dataset_id, dataset)
+        return dataset
+
+    def patch(self, dataset_id, base_version, patch):
+        """Apply a patch made against ``base_version`` and return the updated
+        dataset dict (None if the ID is unknown). Raises VersionConflict if
+        the dataset has moved on since ``base_version``."""
+        dataset = self.get(dataset_id)
+        if dataset is None:
+            return None
+        with self._patch_lock:
+            if base_version != dataset['version']:
+                raise VersionConflict(dataset['version'])
+            patch = check_patch(dataset, patch)
+            version = base_version + 1
+            if self.shared is not None:
+                if not self.shared.add_json(self._delta_key(dataset_id, version), patch, self.ttl):
+                    # Another worker claimed this version first
+                    self._catch_up(dataset_id, dataset)
+                    raise VersionConflict(dataset['version'])
+            with dataset_lock(dataset).writing():
+                apply_patch(dataset, patch)
+            if self.shared is not None and version % SNAPSHOT_EVERY == 0:
+                self.shared.set(self._shared_key(dataset_id), _pack(dataset), self.ttl)
+            path = self._spill_path(dataset_id)
+            if path and os.path.exists(path):
+                # Stale now; spilled again on eviction
+                os.remove(path)
+        return dataset
+
+    def _catch_up(self, dataset_id, dataset):
+        """Replay deltas other workers stored after this copy's version"""
+        if self.shared is None:
+            return
+        with self._patch_lock:
+            while True:
+                patch = self.shared.get_json(self._delta_key(dataset_id, dataset['version'] + 1))
+                if patch is None:
+                    return
+                with dataset_lock(dataset).writing():
+                    apply_patch(dataset, patch)
+
+    def get_index(self, dataset_id):
+        """Return the dataset's CategoryIndex, building it on first use"""
+        dataset = self.get(dataset_id)
+        if dataset is None:
+            return None
+        return dataset_index(dataset)
+
+    def get_facets(self, dataset_id):
+        """Return the dataset's FacetCounts, building them (and the index) on first use"""
+        dataset = self.get(dataset_id)
+        if dataset is None:
+            return None
+        return dataset_facets(dataset)
+
+    def discard(self, dataset_id):
+        with self._lock:
+            dataset = self._datasets.pop(dataset_id, None)
+            path = self._spill_path(dataset_id)
+            if path and os.path.exists(path):
+                os.remove(path)
+        if self.shared is not None:
+            self.shared.delete(self._shared_key(dataset_id))
+            for version in range(1, (dataset or {}).get('version', 0) + 1):
+                self.shared.delete(self._delta_key(dataset_id, version))
+
+    def _evict_locked(self):
+        while len(self._datasets) > self.max_in_memory:
+            dataset_id, dataset = self._datasets.popitem(last=False)
+            # Already persisted in the shared store; nothing to spill
+            if self.shared is None:
+                self._spill(dataset_id, dataset)
+
+    def _spill_path(self, dataset_id):
+        if not self.spill_dir:
+            return None
+        # IDs are generated by us, but never trust them as path components
+        safe_id = ''.join(ch for ch in dataset_id if ch.isalnum())
+        if not safe_id:
+            return None
+        return os.path.join(self.spill_dir, f"{safe_id}.json")
+
+    def _spill(self, dataset_id, dataset):
+        path = self._spill_path(dataset_id)
+        if not path or os.path.exists(path):
+            return
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f, dataset_lock(dataset).reading():
+            json.dump(_dump(dataset), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _load_spilled(self, dataset_id):
+        path = self._spill_path(dataset_id)
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return _restore(json.load(f))
+        except (OSError, ValueError):
+            return None
+
+    def _shared_key(self, dataset_id):
+        return f"dataset:{dataset_id}"
+
+    def _delta_key(self, dataset_id, version):
+        return f"dataset:{dataset_id}:v{version}"
+
+    def _load_shared(self, dataset_id):
+        if self.shared is None:
+            return None
+        packed = self.shared.get(self._shared_key(dataset_id))
+        if packed is None:
+            return None
+        try:
+            return _restore(json.loads(zlib.decompress(packed).decode('utf-8')))
+        except (zlib.error, ValueError):
+            return None
@@ -0,0 +1,157 @@
+import threading
+from collections import Counter, OrderedDict
+from itertools import combinations
+from contact_dataset import ContactDataset, DictColumn
+from category_index import normalize_value, count_bits
+
+
+# Columns with more distinct values than this (names, notes) stay out of the cube
+FACET_MAX_VALUES = 64
+# Column pairs with up to this many value combinations are counted by ANDing
+# posting bitsets; bigger ones with one pass over the dictionary codes
+PAIR_AND_LIMIT = 1024
+
+
+class FacetCounts:
+    """Precomputed match counts for category filters.
+
+    Built once from a CategoryIndex: rows per value of every category
+    column, and for every pair of category columns rows per combination of
+    values. Counting one or two ``{category: value}`` conditions is then a
+    dict lookup; deeper combinations are ANDed on the index once and
+    memoized in a small LRU. Patches keep the counts current through
+    ``update_cell``, ``remove_rows`` and ``add_rows``.
+    """
+
+    def __init__(self, index, category_cols, max_cached=1024):
+        self.index = index
+        self.max_cached = max_cached
+        self.row_count = index.row_count
+        self.values = {}
+        for col_idx in sorted(set(category_cols)):
+            postings = index.postings(col_idx)
+            if len(postings) <= FACET_MAX_VALUES:
+                self.values[col_idx] = {key: count_bits(bits) for key, bits in postings.items()}
+        self.pairs = {}
+        for col_a, col_b in combinations(sorted(self.values), 2):
+            self.pairs[(col_a, col_b)] = self._count_pair(col_a, col_b)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _count_pair(self, col_a, col_b):
+        postings_a = self.index.postings(col_a)
+        postings_b = self.index.postings(col_b)
+        rows = self.index.rows
+        if len(postings_a) * len(postings_b) > PAIR_AND_LIMIT and isinstance(rows, ContactDataset) \
+                and rows.lengths is None:
+            column_a, column_b = rows.column(col_a), rows.column(col_b)
+            if isinstance(column_a, DictColumn) and isinstance(column_b, DictColumn):
+                keys_a = [normalize_value(value) for value in column_a.values]
+                keys_b = [normalize_value(value) for value in column_b.values]
+                counts = {}
+                for (code_a, code_b), count in Counter(zip(column_a.codes, column_b.codes)).items():
+                    pair = (keys_a[code_a], keys_b[code_b])
+                    counts[pair] = counts.get(pair, 0) + count
+                return counts
+        counts = {}
+        for key_a, bits_a in postings_a.items():
+            for key_b, bits_b in postings_b.items():
+                count = count_bits(bits_a & bits_b)
+                if count:
+                    counts[(key_a, key_b)] = count
+        return counts
+
+    def value_counts(self, col_idx):
+        """``{normalized value: rows}`` for a column (from the index if it isn't in the cube)"""
+        counts = self.values.get(col_idx)
+        if counts is None:
+            counts = {key: count_bits(bits) for key, bits in self.index.postings(col_idx).items()}
+        return counts
+
+    def count(self, filters):
+        """Rows matching every ``{category: value}`` pair, like CategoryIndex.count"""
+        conditions = set()
+        for category, required_value in filters.items():
+            col_idx = self.index.column_index(category)
+            if col_idx == -1:
+                return 0
+            conditions.add((col_idx, str(required_value).upper()))
+        conditions = sorted(conditions)
+        cols = [col_idx for col_idx, _ in conditions]
+        if not conditions:
+            return self.row_count
+        if len(conditions) == 1 and cols[0] in self.values:
+            return self.values[cols[0]].get(conditions[0][1], 0)
+        if len(conditions) == 2 and (cols[0], cols[1]) in self.pairs:
+            return self.pairs[(cols[0], cols[1])].get((conditions[0][1], conditions[1][1]), 0)
+
+        return self._memoized(tuple(conditions), lambda: self.index.count(filters))
+
+    def count_filter(self, compiled):
+        """Rows passing a CompiledFilter; expressions are evaluated on the
+        index once and memoized by their text"""
+        if compiled.simple is not None:
+            return self.count(compiled.simple)
+        return self._memoized(compiled.key, lambda: compiled.count(self.index))
+
+    def _memoized(self, key, compute):
+        with self._lock:
+            count = self._cache.get(key)
+            if count is not None:
+                self._cache.move_to_end(key)
+                return count
+        count = compute()
+        with self._lock:
+            self._cache[key] = count
+            while len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+        return count
+
+    def _row_keys(self, rows, row_id):
+        length = rows.row_length(row_id) if isinstance(rows, ContactDataset) else len(rows[row_id])
+        row = rows[row_id]
+        return {col_idx: normalize_value(row[col_idx]) for col_idx in self.values if col_idx < length}
+
+    def _add(self, keys, delta):
+        for col_idx, key in keys.items():
+            counts = self.values[col_idx]
+            counts[key] = counts.get(key, 0) + delta
+            if not counts[key]:
+                del counts[key]
+        for (col_a, col_b), counts in self.pairs.items():
+            if col_a in keys and col_b in keys:
+                pair = (keys[col_a], keys[col_b])
+                counts[pair] = counts.get(pair, 0) + delta
+                if not counts[pair]:
+                    del counts[pair]
+
+    def update_cell(self, rows, row_id, col_idx, old_value):
+        """Move a row's counts after one of its cells changed (``rows`` already has the new value)"""
+        with self._lock:
+            self._cache.clear()
+            if col_idx not in self.values:
+                return
+            keys = self._row_keys(rows, row_id)
+            old_keys = dict(keys)
+            if old_value is None:
+                del old_keys[col_idx]
+            else:
+                old_keys[col_idx] = normalize_value(old_value)
+            self._add(old_keys, -1)
+            self._add(keys, 1)
+
+    def remove_rows(self, rows, row_ids):
+        """Forget rows that are about to be deleted from ``rows``"""
+        with self._lock:
+            self._cache.clear()
+            for row_id in set(row_ids):
+                self._add(self._row_keys(rows, row_id), -1)
+            self.row_count -= len(set(row_ids))
+
+    def add_rows(self, rows, start):
+        """Count rows appended to ``rows`` from ``start`` on"""
+        with self._lock:
+            self._cache.clear()
+            for row_id in range(start, len(rows)):
+                self._add(self._row_keys(rows, row_id), 1)
+            self.row_count = len(rows)
@@ -0,0 +1,109 @@
+import json
+import time
+import argparse
+import threading
+import itertools
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class FakeWhatsAppServer:
+    """Local stand-in for a WhatsApp Cloud API style messages endpoint.
+
+    Accepts ``POST /<phone_number_id>/messages`` with the usual JSON body,
+    records every message and answers like the real API. Used by the
+    ``fake`` send backend and for load testing without touching WhatsApp.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, fail_every=0):
+        self.latency = latency
+        self.fail_every = fail_every
+        self.messages = []
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _record(self, payload):
+        with self._lock:
+            message_id = next(self._ids)
+            if self.fail_every and message_id % self.fail_every == 0:
+                return None
+            self.messages.append(payload)
+            return f"wamid.fake{message_id}"
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                try:
+                    payload = json.loads(self.rfile.read(length) or b'{}')
+                except ValueError:
+                    return self._reply(400, {"error": {"message": "Invalid JSON"}})
+
+                if not self.path.rstrip('/').endswith('/messages'):
+                    return self._reply(404, {"error": {"message": "Unknown endpoint"}})
+                if not payload.get('to') or not payload.get('text', {}).get('body'):
+                    return self._reply(400, {"error": {"message": "Missing recipient or body"}})
+
+                if server.latency:
+                    time.sleep(server.latency)
+
+                message_id = server._record(payload)
+                if message_id is None:
+                    return self._reply(503, {"error": {"message": "Simulated failure"}})
+                self._reply(200, {
+                    "messaging_product": "whatsapp",
+                    "contacts": [{"input": payload['to'], "wa_id": payload['to'].lstrip('+')}],
+                    "messages": [{"id": message_id}]
+                })
+
+            def _reply(self, status, body):
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a fake WhatsApp messages API for testing')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds to wait before answering')
+    args = parser.parse_args()
+
+    fake = FakeWhatsAppServer(args.host, args.port, args.latency)
+    print(f"✅ Fake WhatsApp API listening on {fake.url}")
+    try:
+        fake.serve_forever()
+    except KeyboardInterrupt:
+        fake.stop()
@@ -0,0 +1,327 @@
+import re
+from contact_dataset import ContactDataset, TextColumn, BLOCK_BITS, BLOCK_SIZE
+from category_index import normalize_value, bits_from_row_ids, count_bits
+
+
+class FilterError(Exception):
+    """A filter expression that can't be parsed or refers to unknown columns"""
+
+
+_TOKEN_RE = re.compile(r"""\s*(?:
+    (?P<string>'(?:[^']|'')*'|"(?:[^"]|"")*")
+  | (?P<op><=|>=|!=|<>|==|=|<|>)
+  | (?P<punct>[(),])
+  | (?P<word>[^\s()=,!<>'"]+)
+)""", re.VERBOSE)
+
+_KEYWORDS = {'AND', 'OR', 'NOT', 'IN', 'BETWEEN'}
+
+
+def _tokenize(text):
+    """``(kind, value)`` tokens; kinds are string, op, punct, keyword and word"""
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        found = _TOKEN_RE.match(text, pos)
+        if not found or found.end() == pos:
+            pos = len(text) - len(text[pos:].lstrip())
+            raise FilterError(f"Unexpected character at position {pos + 1}: {text[pos]!r}")
+        pos = found.end()
+        kind = found.lastgroup
+        value = found.group(kind)
+        if kind == 'string':
+            value = value[1:-1].replace(value[0] * 2, value[0])
+        elif kind == 'op':
+            value = {'==': '=', '<>': '!='}.get(value, value)
+        elif kind == 'word' and value.upper() in _KEYWORDS:
+            kind, value = 'keyword', value.upper()
+        tokens.append((kind, value))
+    return tokens
+
+
+class _Parser:
+    """Recursive descent over the tokens:
+
+        expr       := term (OR term)*
+        term       := factor (AND factor)*
+        factor     := NOT factor | '(' expr ')' | comparison
+        comparison := name ('=' | '!=' | '<' | '<=' | '>' | '>=') value
+                    | name [NOT] IN '(' value (',' value)* ')'
+                    | name [NOT] BETWEEN value AND value
+
+    Unquoted names and values may span several words; quote them ('...' or
+    "...") to use keywords or punctuation. Produces nested tuples with
+    column names still unresolved.
+    """
+
+    def __init__(self, text):
+        self.tokens = _tokenize(text)
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def take(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def expect(self, kind, value):
+        token = self.take()
+        if token != (kind, value):
+            raise FilterError(f"Expected '{value}'" + (f" but found '{token[1]}'" if token[1] else " at end of expression"))
+
+    def parse(self):
+        if not self.tokens:
+            raise FilterError("Empty filter expression")
+        node = self.expr()
+        if self.pos < len(self.tokens):
+            raise FilterError(f"Unexpected '{self.peek()[1]}'")
+        return node
+
+    def expr(self):
+        nodes = [self.term()]
+        while self.peek() == ('keyword', 'OR'):
+            self.take()
+            nodes.append(self.term())
+        return nodes[0] if len(nodes) == 1 else ('or', nodes)
+
+    def term(self):
+        nodes = [self.factor()]
+        while self.peek() == ('keyword', 'AND'):
+            self.take()
+            nodes.append(self.factor())
+        return nodes[0] if len(nodes) == 1 else ('and', nodes)
+
+    def factor(self):
+        if self.peek() == ('keyword', 'NOT'):
+            self.take()
+            return ('not', self.factor())
+        if self.peek() == ('punct', '('):
+            self.take()
+            node = self.expr()
+            self.expect('punct', ')')
+            return node
+        return self.comparison()
+
+    def words(self, what):
+        """One quoted string, or consecutive unquoted words joined by spaces"""
+        kind, value = self.peek()
+        if kind == 'string':
+            self.take()
+            return value
+        parts = []
+        while self.peek()[0] == 'word':
+            parts.append(self.take()[1])
+        if not parts:
+            raise FilterError(f"Expected {what}" + (f" but found '{value}'" if value else " at end of expression"))
+        return ' '.join(parts)
+
+    def comparison(self):
+        name = self.words('a column name')
+        negate = False
+        if self.peek() == ('keyword', 'NOT'):
+            self.take()
+            negate = True
+            if self.peek() not in (('keyword', 'IN'), ('keyword', 'BETWEEN')):
+                raise FilterError(f"Expected IN or BETWEEN after '{name} NOT'")
+        kind, value = self.take()
+        if kind == 'op' and not negate:
+            node = ('cmp', name, value, self.words('a value'))
+        elif (kind, value) == ('keyword', 'IN'):
+            self.expect('punct', '(')
+            values = [self.words('a value')]
+            while self.peek() == ('punct', ','):
+                self.take()
+                values.append(self.words('a value'))
+            self.expect('punct', ')')
+            node = ('in', name, values)
+        elif (kind, value) == ('keyword', 'BETWEEN'):
+            low = self.words('a value')
+            self.expect('keyword', 'AND')
+            node = ('between', name, low, self.words('a value'))
+        else:
+            raise FilterError(f"Expected a comparison after '{name}'" + (f" but found '{value}'" if value else ""))
+        return ('not', node) if negate else node
+
+
+def _as_number(key):
+    try:
+        return float(key)
+    except ValueError:
+        return None
+
+
+_COMPARE = {
+    '<': lambda a, b: a < b,
+    '<=': lambda a, b: a <= b,
+    '>': lambda a, b: a > b,
+    '>=': lambda a, b: a >= b,
+}
+
+
+def _range_test(op, bound):
+    """``test(normalized key) -> bool`` for ``<``/``<=``/``>``/``>=``.
+    Numeric bounds only match cells that parse as numbers; other bounds
+    compare text (so ISO dates work too)."""
+    compare = _COMPARE[op]
+    number = _as_number(bound)
+    if number is None:
+        bound = normalize_value(bound)
+        return lambda key: compare(key, bound)
+
+    def test(key):
+        value = _as_number(key)
+        return value is not None and compare(value, number)
+    return test
+
+
+def _resolve(node, columns):
+    """Turn parsed nodes into evaluable ones with column positions:
+    ``('keys', col, {keys})``, ``('test', col, test)``, ``('not', n)``,
+    ``('and', [n])``, ``('or', [n])``."""
+    kind = node[0]
+    if kind in ('and', 'or'):
+        return (kind, [_resolve(child, columns) for child in node[1]])
+    if kind == 'not':
+        return ('not', _resolve(node[1], columns))
+    name = node[1]
+    col_idx = columns.get(name)
+    if col_idx is None:
+        # Header names are matched case-insensitively if there's no exact hit
+        col_idx = columns.get(('ci', name.strip().casefold()))
+    if col_idx is None:
+        raise FilterError(f"Unknown column: {name}")
+    if kind == 'in':
+        return ('keys', col_idx, {normalize_value(value) for value in node[2]})
+    if kind == 'between':
+        low, high = _range_test('>=', node[2]), _range_test('<=', node[3])
+        return ('test', col_idx, lambda key: low(key) and high(key))
+    op, value = node[2], node[3]
+    if op == '=':
+        return ('keys', col_idx, {normalize_value(value)})
+    if op == '!=':
+        return ('not', ('keys', col_idx, {normalize_value(value)}))
+    return ('test', col_idx, _range_test(op, value))
+
+
+def _scan_text(column, test, keys=None):
+    """Row IDs of a packed text column whose normalized cell passes ``test``.
+    With ``keys`` (equality/IN), blocks whose upper-cased text contains none
+    of them are skipped whole."""
+    row_ids = []
+    for block_idx, text in enumerate(column.blocks):
+        if keys is not None:
+            text = text.upper()
+            if not any(key in text for key in keys):
+                continue
+        base = block_idx << BLOCK_BITS
+        for pos, value in enumerate(column.slice(base, base + BLOCK_SIZE)):
+            if test(normalize_value(value)):
+                row_ids.append(base + pos)
+    base = len(column.blocks) << BLOCK_BITS
+    for pos, value in enumerate(column.tail):
+        if test(normalize_value(value)):
+            row_ids.append(base + pos)
+    return row_ids
+
+
+def _columns_of(node, found):
+    if node[0] in ('and', 'or'):
+        for child in node[1]:
+            _columns_of(child, found)
+    elif node[0] == 'not':
+        _columns_of(node[1], found)
+    elif node[1] not in found:
+        found.append(node[1])
+    return found
+
+
+class CompiledFilter:
+    """A message filter compiled against a sheet's headers.
+
+    ``filters`` is either the classic ``{category: value}`` dict (every
+    pair must match, case-insensitively) or an expression string such as
+    ``Mehendi = Yes AND (Sangeet = Yes OR City IN (Pune, Goa)) AND Age >= 18``.
+    Expressions are parsed and their columns resolved once; ``match`` then
+    evaluates the whole tree as bitset operations on a CategoryIndex:
+    equality and IN OR together posting lists, ranges test each distinct
+    value once, NOT complements against all rows. Free-text columns that
+    aren't indexed yet are scanned instead of building a posting per cell.
+    """
+
+    def __init__(self, filters, headers):
+        self.filters = filters
+        self.simple = None
+        headers = list(headers)
+        if isinstance(filters, dict):
+            self.simple = filters
+            self.text = ", ".join(f"{k}={v}" for k, v in filters.items())
+            self.key = ('dict', tuple(sorted((str(k), str(v).upper()) for k, v in filters.items())))
+            self.columns = [(category, headers.index(category) if category in headers else -1) for category in filters]
+            return
+        if not isinstance(filters, str):
+            raise FilterError("Filters must be an object of {column: value} pairs or an expression string")
+        self.text = filters.strip()
+        columns = {}
+        for idx, header in enumerate(headers):
+            columns.setdefault(header, idx)
+            columns.setdefault(('ci', header.strip().casefold()), idx)
+        self.tree = _resolve(_Parser(self.text).parse(), columns)
+        self.key = ('expr', self.text)
+        self.columns = [(headers[col_idx], col_idx) for col_idx in _columns_of(self.tree, [])]
+
+    def describe(self):
+        return self.text
+
+    def match(self, index):
+        """Bitset of the index's rows that pass the filter"""
+        if self.simple is not None:
+            return index.match(self.simple)
+        return self._eval(self.tree, index)
+
+    def count(self, index):
+        return count_bits(self.match(index))
+
+    def _eval(self, node, index):
+        kind = node[0]
+        if kind == 'and':
+            bits = index.all_bits
+            for child in node[1]:
+                bits &= self._eval(child, index)
+                if not bits:
+                    break
+            return bits
+        if kind == 'or':
+            bits = 0
+            for child in node[1]:
+                bits |= self._eval(child, index)
+            return bits
+        if kind == 'not':
+            return index.all_bits & ~self._eval(node[1], index)
+        col_idx = node[1]
+        if kind == 'keys':
+            test = node[2].__contains__
+        else:
+            test = node[2]
+        rows = index.rows
+        if isinstance(rows, ContactDataset) and rows.lengths is None and not index.has_postings(col_idx) \
+                and isinstance(rows.column(col_idx), TextColumn):
+            row_ids = _scan_text(rows.column(col_idx), test, node[2] if kind == 'keys' else None)
+            return bits_from_row_ids(row_ids, index.row_count)
+        postings = index.postings(col_idx)
+        bits = 0
+        if kind == 'keys':
+            for key in node[2]:
+                bits |= postings.get(key, 0)
+        else:
+            for key, key_bits in postings.items():
+                if test(key):
+                    bits |= key_bits
+        return bits
+
+
+def compile_filter(filters, headers):
+    """Compile a filter payload (dict or expression string), raising FilterError"""
+    return CompiledFilter(filters, headers)
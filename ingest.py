@@ -0,0 +1,162 @@
+import io
+import csv
+
+
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def _stream_size(stream):
+    """Total byte size of a seekable stream, or None"""
+    try:
+        position = stream.tell()
+        stream.seek(0, io.SEEK_END)
+        size = stream.tell()
+        stream.seek(position)
+        return size
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def _fraction(done, total):
+    if not total or done is None:
+        return None
+    return min(1.0, done / total)
+
+
+def _tell(stream):
+    try:
+        return stream.tell()
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def _open_binary(source):
+    """Accept a path or a binary file-like object; return (stream, owned)"""
+    if isinstance(source, (str, bytes)) or hasattr(source, '__fspath__'):
+        return open(source, 'rb'), True
+    return source, False
+
+
+def stream_csv(source, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """Return (headers, chunks) for a CSV path or binary stream.
+
+    ``chunks`` is a generator of row lists of at most ``chunk_size`` rows.
+    The upload stream is read directly, so nothing is written to disk.
+    ``progress(rows_read, fraction)`` is called per chunk, with the
+    fraction estimated from the stream position (None if unknown).
+    """
+    stream, owned = _open_binary(source)
+    total_bytes = _stream_size(stream)
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    try:
+        reader = csv.reader(text)
+        headers = next(reader, [])
+    except Exception:
+        text.detach()
+        if owned:
+            stream.close()
+        raise
+
+    def chunks():
+        rows_read = 0
+        try:
+            chunk = []
+            for row in reader:
+                if len(row) >= 2:  # At least Name and Phone
+                    chunk.append([cell.strip() for cell in row])
+                    if len(chunk) >= chunk_size:
+                        rows_read += len(chunk)
+                        if progress:
+                            progress(rows_read, _fraction(_tell(stream), total_bytes))
+                        yield chunk
+                        chunk = []
+            if chunk:
+                rows_read += len(chunk)
+                yield chunk
+            if progress:
+                progress(rows_read, 1.0)
+        finally:
+            # Don't let the wrapper close a stream that belongs to the caller
+            text.detach()
+            if owned:
+                stream.close()
+
+    return headers, chunks()
+
+
+def stream_xlsx(source, chunk_size=DEFAULT_CHUNK_SIZE, progress=None, sheet=None):
+    """Return (headers, chunks) for an XLSX path or seekable binary stream.
+
+    The workbook is opened read-only so rows are streamed from the sheet
+    XML instead of building every cell object in memory. ``sheet`` names
+    the worksheet to read (default: the active one).
+    ``progress(rows_read, fraction)`` is called per chunk, with the
+    fraction taken from the sheet dimensions (None if unknown).
+    """
+    import openpyxl  # only needed for Excel uploads; keeps startup fast
+
+    workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    try:
+        if sheet is not None:
+            if sheet not in workbook.sheetnames:
+                raise Exception(f"Sheet not found in workbook: {sheet}")
+            sheet = workbook[sheet]
+        else:
+            sheet = workbook.active
+        if sheet is None:
+            raise Exception("No active sheet found in workbook")
+
+        row_iter = sheet.iter_rows(values_only=True)
+        header_row = next(row_iter, None) or ()
+        headers = [str(value).strip() if value else f"Column{i}"
+                   for i, value in enumerate(header_row, 1)]
+        total_rows = sheet.max_row - 1 if sheet.max_row else None
+    except Exception:
+        workbook.close()
+        raise
+
+    def chunks():
+        rows_read = 0
+        try:
+            chunk = []
+            for row in row_iter:
+                if row and any(row):  # Skip empty rows
+                    row_data = [str(cell).strip() if cell is not None else '' for cell in row]
+                    if len(row_data) >= 2:  # At least Name and Phone
+                        chunk.append(row_data)
+                        if len(chunk) >= chunk_size:
+                            rows_read += len(chunk)
+                            if progress:
+                                progress(rows_read, _fraction(rows_read, total_rows))
+                            yield chunk
+                            chunk = []
+            if chunk:
+                rows_read += len(chunk)
+                yield chunk
+            if progress:
+                progress(rows_read, 1.0)
+        finally:
+            workbook.close()
+
+    return headers, chunks()
+
+
+def workbook_sheets(source):
+    """Names of the worksheets in an XLSX path or seekable binary stream"""
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(source, read_only=True)
+    try:
+        # Chart sheets have no cells
+        return [sheet.title for sheet in workbook.worksheets]
+    finally:
+        workbook.close()
+
+
+def stream_file(source, file_ext, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """Dispatch to the streaming reader for a file extension"""
+    if file_ext == 'csv':
+        return stream_csv(source, chunk_size, progress)
+    if file_ext in ['xlsx', 'xls']:
+        return stream_xlsx(source, chunk_size, progress)
+    raise Exception(f"Unsupported file type: {file_ext}")
@@ -0,0 +1,76 @@
+import os
+import json
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+
+LEVELS = {'trace': 5, 'debug': 10, 'info': 20, 'warning': 30, 'error': 40}
+DEFAULT_CAPACITY = 5000
+
+
+class JobLog:
+    """Structured, bounded log for a single send job.
+
+    Each call records ``{ts, level, message, row, filter_id, event}``.
+    Records below ``level`` are dropped before any formatting work, the
+    newest ``capacity`` records are kept in a ring buffer, and every kept
+    record can also be appended to a rotating JSONL file (``spill_path``)
+    and passed to ``sink`` (e.g. the job queue's log writer).
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, level='info', spill_path=None,
+                 spill_max_bytes=10 * 1024 * 1024, spill_backups=3, sink=None):
+        if level not in LEVELS:
+            raise Exception(f"Unknown log level: {level}")
+        self.capacity = capacity
+        self.level = level
+        self.threshold = LEVELS[level]
+        self.records = deque(maxlen=capacity)
+        self.sink = sink
+        self._spill = None
+        if spill_path:
+            directory = os.path.dirname(spill_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._spill = RotatingFileHandler(spill_path, maxBytes=spill_max_bytes,
+                                              backupCount=spill_backups, encoding='utf-8')
+            self._spill.setFormatter(logging.Formatter('%(message)s'))
+        self._lock = threading.Lock()
+
+    def enabled(self, level):
+        return LEVELS[level] >= self.threshold
+
+    def __call__(self, message, level='info', row=None, filter_id=None, event=None):
+        if LEVELS[level] < self.threshold:
+            return
+        record = {
+            "ts": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            "level": level,
+            "message": message,
+            "row": row,
+            "filter_id": filter_id,
+            "event": event
+        }
+        with self._lock:
+            self.records.append(record)
+        if self._spill is not None:
+            self._spill.handle(logging.makeLogRecord({"msg": json.dumps(record, ensure_ascii=False)}))
+        if self.sink is not None:
+            self.sink(record)
+
+    def close(self):
+        if self._spill is not None:
+            self._spill.close()
+
+
+def structured_logger(logger):
+    """Adapt a plain ``logger(line)`` callable to the JobLog call signature.
+
+    Plain callables keep receiving every line (trace level), as before.
+    """
+    if isinstance(logger, JobLog):
+        return logger
+    return JobLog(capacity=0, level='trace', sink=lambda record: logger(record['message']))
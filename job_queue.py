@@ -0,0 +1,474 @@
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import threading
+from datetime import datetime
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    params TEXT NOT NULL,
+    info TEXT NOT NULL DEFAULT '{}',
+    progress TEXT,
+    summary TEXT,
+    error TEXT,
+    created_at TEXT,
+    started_at TEXT,
+    finished_at TEXT,
+    worker TEXT,
+    heartbeat REAL,
+    not_before REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS job_logs (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    line TEXT NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+CREATE TABLE IF NOT EXISTS job_recipients (
+    job_id TEXT NOT NULL,
+    delivery_key TEXT NOT NULL,
+    state TEXT NOT NULL,
+    updated_at TEXT,
+    PRIMARY KEY (job_id, delivery_key)
+);
+CREATE TABLE IF NOT EXISTS sent_ledger (
+    campaign TEXT NOT NULL,
+    phone TEXT NOT NULL,
+    template_hash TEXT NOT NULL,
+    sent_at TEXT,
+    PRIMARY KEY (campaign, phone, template_hash)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS dead_letters (
+    job_id TEXT NOT NULL,
+    delivery_key TEXT NOT NULL,
+    campaign TEXT,
+    name TEXT,
+    phone TEXT NOT NULL,
+    message TEXT NOT NULL,
+    template_hash TEXT,
+    attempts INTEGER NOT NULL,
+    error TEXT,
+    created_at TEXT,
+    PRIMARY KEY (job_id, delivery_key)
+);
+"""
+
+# A running job whose worker hasn't checked in for this long is treated as
+# interrupted (process crashed or was restarted) and goes back to the queue.
+STALE_AFTER_SECONDS = 60
+
+
+class JobParked(Exception):
+    """Raised by a job to give up its runner slot until ``not_before``"""
+
+    def __init__(self, not_before):
+        super().__init__(f"Parked until {not_before}")
+        self.not_before = not_before
+
+
+def _now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+class JobQueue:
+    """Persistent job store and queue on SQLite (WAL mode).
+
+    Holds each job's parameters, status, log lines and per-recipient send
+    state, so a restarted process can pick up where a job stopped. The
+    sent ledger records delivered messages across jobs of a campaign. Every
+    thread gets its own connection; WAL lets readers (status pages) run
+    while a worker is writing.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        self._migrate(conn)
+
+    def _migrate(self, conn):
+        columns = {row['name'] for row in conn.execute('PRAGMA table_info(jobs)')}
+        if 'progress' not in columns:
+            conn.execute('ALTER TABLE jobs ADD COLUMN progress TEXT')
+        if 'not_before' not in columns:
+            conn.execute('ALTER TABLE jobs ADD COLUMN not_before REAL')
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def create_job(self, params, info=None, first_log=None, job_id=None):
+        """Queue a new job and return its ID"""
+        job_id = job_id or str(uuid.uuid4())
+        conn = self._conn()
+        conn.execute('BEGIN')
+        conn.execute(
+            'INSERT INTO jobs (id, status, params, info, created_at) VALUES (?, ?, ?, ?, ?)',
+            (job_id, 'queued', json.dumps(params, ensure_ascii=False), json.dumps(info or {}), _now())
+        )
+        if first_log:
+            conn.execute('INSERT INTO job_logs (job_id, seq, line) VALUES (?, 0, ?)',
+                         (job_id, first_log))
+        conn.execute('COMMIT')
+        return job_id
+
+    def exists(self, job_id):
+        row = self._conn().execute('SELECT 1 FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return row is not None
+
+    def get_job(self, job_id, include_logs=True):
+        """Job info in the shape the status page expects, or None"""
+        row = self._conn().execute(
+            'SELECT id, status, info, progress, summary, error, created_at, started_at, finished_at FROM jobs WHERE id = ?',
+            (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        job = json.loads(row['info'])
+        job.update({
+            "status": row['status'],
+            "created_at": row['created_at'],
+            "started_at": row['started_at'],
+            "finished_at": row['finished_at'],
+            "counters": json.loads(row['progress']) if row['progress'] else {}
+        })
+        if row['error']:
+            job['error'] = row['error']
+        if row['summary']:
+            job['summary'] = json.loads(row['summary'])
+        if include_logs:
+            job['logs'] = self.get_logs(job_id)
+        return job
+
+    def get_logs(self, job_id, since=0, limit=None):
+        """Log lines from offset ``since`` on (offsets are 0-based line numbers)"""
+        rows = self._conn().execute(
+            'SELECT line FROM job_logs WHERE job_id = ? AND seq >= ? ORDER BY seq LIMIT ?',
+            (job_id, since, -1 if limit is None else limit)
+        ).fetchall()
+        return [row['line'] for row in rows]
+
+    def list_jobs(self):
+        rows = self._conn().execute(
+            'SELECT id, status, info, created_at FROM jobs ORDER BY created_at'
+        ).fetchall()
+        return {
+            row['id']: {
+                "status": row['status'],
+                "created_at": row['created_at'],
+                "total_rows": json.loads(row['info']).get('total_rows', 0)
+            }
+            for row in rows
+        }
+
+    def first_log_offset(self, job_id):
+        """Offset of the oldest line still kept for a job (older ones were trimmed)"""
+        row = self._conn().execute('SELECT MIN(seq) FROM job_logs WHERE job_id = ?', (job_id,)).fetchone()
+        return row[0] or 0
+
+    def append_logs(self, job_id, lines, keep=None):
+        """Append log lines; with ``keep``, only the newest ``keep`` lines are retained"""
+        if not lines:
+            return
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        row = conn.execute('SELECT COALESCE(MAX(seq), -1) FROM job_logs WHERE job_id = ?', (job_id,)).fetchone()
+        next_seq = row[0] + 1
+        conn.executemany(
+            'INSERT INTO job_logs (job_id, seq, line) VALUES (?, ?, ?)',
+            [(job_id, next_seq + offset, line) for offset, line in enumerate(lines)]
+        )
+        if keep:
+            conn.execute('DELETE FROM job_logs WHERE job_id = ? AND seq < ?',
+                         (job_id, next_seq + len(lines) - keep))
+        conn.execute('COMMIT')
+
+    def claim_next(self, worker):
+        """Atomically move the oldest queued job that is due to running; return (id, params)"""
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                "SELECT id, params FROM jobs WHERE status = 'queued' AND (not_before IS NULL OR not_before <= ?) "
+                "ORDER BY created_at LIMIT 1", (time.time(),)
+            ).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, heartbeat = ?, started_at = COALESCE(started_at, ?) WHERE id = ?",
+                (worker, time.time(), _now(), row['id'])
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return row['id'], json.loads(row['params'])
+
+    def heartbeat(self, job_ids):
+        if not job_ids:
+            return
+        now = time.time()
+        self._conn().executemany('UPDATE jobs SET heartbeat = ? WHERE id = ?', [(now, job_id) for job_id in job_ids])
+
+    def requeue_stale(self, stale_after=STALE_AFTER_SECONDS):
+        """Put running jobs whose worker stopped checking in back on the queue"""
+        cursor = self._conn().execute(
+            "UPDATE jobs SET status = 'queued', worker = NULL WHERE status = 'running' AND heartbeat < ?",
+            (time.time() - stale_after,)
+        )
+        return cursor.rowcount
+
+    def park(self, job_id, not_before):
+        """Put a running job back on the queue, not to be claimed before ``not_before``"""
+        self._conn().execute(
+            "UPDATE jobs SET status = 'queued', worker = NULL, not_before = ? WHERE id = ?",
+            (not_before, job_id)
+        )
+
+    def finish(self, job_id, summary=None):
+        self._conn().execute(
+            "UPDATE jobs SET status = 'finished', finished_at = ?, summary = ? WHERE id = ?",
+            (_now(), json.dumps(summary) if summary is not None else None, job_id)
+        )
+
+    def fail(self, job_id, error):
+        self._conn().execute(
+            "UPDATE jobs SET status = 'failed', finished_at = ?, error = ? WHERE id = ?",
+            (_now(), error, job_id)
+        )
+
+    def get_params(self, job_id):
+        row = self._conn().execute('SELECT params FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return json.loads(row['params']) if row is not None else None
+
+    def sent_keys(self, job_id):
+        rows = self._conn().execute(
+            "SELECT delivery_key FROM job_recipients WHERE job_id = ? AND state = 'sent'", (job_id,)
+        ).fetchall()
+        return {row['delivery_key'] for row in rows}
+
+    def set_progress(self, job_id, counters):
+        self._conn().execute('UPDATE jobs SET progress = ? WHERE id = ?', (json.dumps(counters), job_id))
+
+    def mark_recipients(self, job_id, states):
+        """Record ``{delivery_key: state}`` for a job in one transaction"""
+        if not states:
+            return
+        now = _now()
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        conn.executemany(
+            'INSERT OR REPLACE INTO job_recipients (job_id, delivery_key, state, updated_at) VALUES (?, ?, ?, ?)',
+            [(job_id, key, state, now) for key, state in states.items()]
+        )
+        conn.execute('COMMIT')
+
+    def add_dead_letters(self, job_id, entries):
+        """Store deliveries that ran out of retries (dicts as built by run_send_job)"""
+        if not entries:
+            return
+        now = _now()
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        conn.executemany(
+            'INSERT OR REPLACE INTO dead_letters (job_id, delivery_key, campaign, name, phone, message, '
+            'template_hash, attempts, error, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            [(job_id, e['key'], e['campaign'], e['name'], e['phone'], e['message'],
+              e['template_hash'], e['attempts'], e['error'], now) for e in entries]
+        )
+        conn.execute('COMMIT')
+
+    def dead_letters(self, job_id):
+        rows = self._conn().execute(
+            'SELECT delivery_key AS key, campaign, name, phone, message, template_hash, attempts, error, created_at '
+            'FROM dead_letters WHERE job_id = ? ORDER BY created_at, delivery_key', (job_id,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def delivered(self, campaign):
+        """(phone, template_hash) pairs already sent in a campaign, by any job"""
+        rows = self._conn().execute(
+            'SELECT phone, template_hash FROM sent_ledger WHERE campaign = ?', (campaign,)
+        ).fetchall()
+        return {(row['phone'], row['template_hash']) for row in rows}
+
+    def record_delivered(self, entries):
+        """Add ``(phone, template_hash, campaign)`` entries to the sent ledger"""
+        if not entries:
+            return
+        now = _now()
+        self._conn().executemany(
+            'INSERT OR IGNORE INTO sent_ledger (campaign, phone, template_hash, sent_at) VALUES (?, ?, ?, ?)',
+            [(campaign, phone, template_hash, now) for phone, template_hash, campaign in entries]
+        )
+
+
+class JobContext:
+    """Per-job handle given to the job function: buffered logging,
+    per-recipient progress and dead letters, flushed to the queue in batches."""
+
+    FLUSH_LINES = 200
+    FLUSH_SECONDS = 1.0
+
+    def __init__(self, job_queue, job_id, log_capacity=None):
+        self.job_queue = job_queue
+        self.job_id = job_id
+        self.log_capacity = log_capacity
+        self._sent = job_queue.sent_keys(job_id)
+        self._failed = 0
+        self._pending_logs = []
+        self._pending_states = {}
+        self._pending_dead = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def _due(self):
+        # Called with self._lock held
+        pending = len(self._pending_logs) + len(self._pending_states) + len(self._pending_dead)
+        return pending >= self.FLUSH_LINES or time.monotonic() - self._last_flush >= self.FLUSH_SECONDS
+
+    def log(self, line, timestamp=None):
+        timestamp = timestamp or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self._lock:
+            self._pending_logs.append(f"[{timestamp}] {line}")
+            due = self._due()
+        if due:
+            self.flush()
+
+    def is_sent(self, delivery_key):
+        return delivery_key in self._sent
+
+    def mark(self, delivery_key, state):
+        with self._lock:
+            if state == 'sent':
+                self._sent.add(delivery_key)
+            elif state == 'failed':
+                self._failed += 1
+            self._pending_states[delivery_key] = state
+            due = self._due()
+        # Sends usually log nothing at info level, so resume state and the
+        # counters are flushed on the same schedule as log lines
+        if due:
+            self.flush()
+
+    def dead_letter(self, entry):
+        with self._lock:
+            self._pending_dead.append(entry)
+            due = self._due()
+        if due:
+            self.flush()
+
+    def park(self, not_before):
+        """Stop the job and run it again from the start at ``not_before`` (a
+        Unix timestamp), freeing its runner slot meanwhile. Raises JobParked."""
+        self.flush()
+        raise JobParked(not_before)
+
+    def flush(self):
+        # Serialize flushes so batches land in the order they were logged
+        with self._flush_lock:
+            with self._lock:
+                logs, self._pending_logs = self._pending_logs, []
+                states, self._pending_states = self._pending_states, {}
+                dead, self._pending_dead = self._pending_dead, []
+                counters = {"sent": len(self._sent), "failed": self._failed}
+                self._last_flush = time.monotonic()
+            self.job_queue.add_dead_letters(self.job_id, dead)
+            if states:
+                self.job_queue.mark_recipients(self.job_id, states)
+                self.job_queue.set_progress(self.job_id, counters)
+            self.job_queue.append_logs(self.job_id, logs, keep=self.log_capacity)
+
+
+class JobRunner:
+    """Bounded pool of worker threads that run queued jobs.
+
+    ``run_job(job_id, params, context)`` does the work and returns the job
+    summary. Stale running jobs are requeued, so jobs interrupted by a
+    restart are resumed by whichever process picks them up next. A job that
+    parks itself (``context.park``) goes back on the queue until it is due.
+    """
+
+    def __init__(self, job_queue, run_job, max_workers=2, poll_interval=1.0):
+        self.job_queue = job_queue
+        self.run_job = run_job
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
+        self.worker_name = f"{socket.gethostname()}:{os.getpid()}"
+        self._wakeup = threading.Condition()
+        self._active = set()
+        self._active_lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        if self._threads:
+            return self
+        for worker_idx in range(self.max_workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{worker_idx + 1}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        heartbeat = threading.Thread(target=self._heartbeat, name='job-heartbeat', daemon=True)
+        heartbeat.start()
+        self._threads.append(heartbeat)
+        return self
+
+    def notify(self):
+        """Wake an idle worker after a job was queued"""
+        with self._wakeup:
+            self._wakeup.notify()
+
+    def active_jobs(self):
+        with self._active_lock:
+            return set(self._active)
+
+    def _heartbeat(self):
+        while True:
+            self.job_queue.heartbeat(self.active_jobs())
+            if self.job_queue.requeue_stale():
+                self.notify()
+            time.sleep(STALE_AFTER_SECONDS / 4)
+
+    def _work(self):
+        while True:
+            claimed = self.job_queue.claim_next(self.worker_name)
+            if claimed is None:
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_interval)
+                continue
+
+            job_id, params = claimed
+            with self._active_lock:
+                self._active.add(job_id)
+            context = JobContext(self.job_queue, job_id, log_capacity=params.get('log_capacity'))
+            try:
+                summary = self.run_job(job_id, params, context)
+                context.flush()
+                self.job_queue.finish(job_id, summary)
+            except JobParked as e:
+                self.job_queue.park(job_id, e.not_before)
+            except Exception as e:
+                context.log(f'❌ Job error: {str(e)}')
+                context.flush()
+                self.job_queue.fail(job_id, str(e))
+            finally:
+                with self._active_lock:
+                    self._active.discard(job_id)
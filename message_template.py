@@ -0,0 +1,125 @@
+import re
+from functools import lru_cache
+
+
+class TemplateError(Exception):
+    pass
+
+
+# {Field} or {Field|default}; {{ and }} are literal braces, as are braces
+# that don't enclose a placeholder (e.g. "Dress code :)}" or "{venue TBD")
+_TOKEN = re.compile(r'\{\{|\}\}|\{([^{}|]*)(?:\|([^{}]*))?\}|[{}]')
+
+
+class CompiledTemplate:
+    """A message template parsed once into literal text and placeholders
+    bound to column indices.
+
+    ``render(row)`` is a small function generated for this template that
+    just concatenates literals and stripped cells, so rendering costs about
+    as much as building the string by hand.
+    """
+
+    __slots__ = ('source', 'literals', 'fields', 'placeholders', 'render')
+
+    def __init__(self, source, literals, fields, placeholders):
+        self.source = source
+        self.literals = literals
+        self.fields = fields
+        self.placeholders = placeholders
+        self.render = self._build_renderer()
+
+    def render_slow(self, row):
+        """Reference renderer for short rows and non-string cells"""
+        parts = [self.literals[0]]
+        for (col_idx, default), literal in zip(self.fields, self.literals[1:]):
+            value = str(row[col_idx]).strip() if col_idx < len(row) else ''
+            parts.append(value or default)
+            parts.append(literal)
+        return ''.join(parts)
+
+    def _build_renderer(self):
+        # Only column indices (ints) go into the generated source; all text is
+        # passed in through the namespace.
+        namespace = {'_slow': self.render_slow}
+        terms = []
+        for idx, (col_idx, default) in enumerate(self.fields):
+            if self.literals[idx]:
+                namespace[f'_l{idx}'] = self.literals[idx]
+                terms.append(f'_l{idx}')
+            if default:
+                namespace[f'_d{idx}'] = default
+                terms.append(f'(row[{col_idx}].strip() or _d{idx})')
+            else:
+                terms.append(f'row[{col_idx}].strip()')
+        if self.literals[-1]:
+            namespace['_tail'] = self.literals[-1]
+            terms.append('_tail')
+
+        source = (
+            "def render(row):\n"
+            "    try:\n"
+            f"        return {' + '.join(terms) or repr('')}\n"
+            "    except (IndexError, AttributeError, TypeError):\n"
+            "        return _slow(row)\n"
+        )
+        exec(source, namespace)
+        return namespace['render']
+
+
+def _resolve_column(field, headers, name_col_idx, phone_col_idx):
+    if field in headers:
+        return headers.index(field)
+    lowered = field.lower()
+    for idx, header in enumerate(headers):
+        if header.strip().lower() == lowered:
+            return idx
+    # {name} / {phone} always mean the detected contact columns
+    if lowered == 'name' and name_col_idx >= 0:
+        return name_col_idx
+    if lowered == 'phone' and phone_col_idx >= 0:
+        return phone_col_idx
+    return -1
+
+
+@lru_cache(maxsize=256)
+def _compile(source, headers, name_col_idx, phone_col_idx):
+    literals = []
+    fields = []
+    placeholders = []
+    literal = []
+    position = 0
+    for match in _TOKEN.finditer(source):
+        literal.append(source[position:match.start()])
+        position = match.end()
+        token = match.group(0)
+        if token in ('{{', '}}'):
+            literal.append(token[0])
+            continue
+        field = (match.group(1) or '').strip()
+        if not field:
+            literal.append(token)
+            continue
+
+        default = (match.group(2) or '').strip()
+        col_idx = _resolve_column(field, headers, name_col_idx, phone_col_idx)
+        if col_idx == -1:
+            raise TemplateError(f"Unknown placeholder {{{field}}}. Available: " +
+                                ", ".join(f"{{{header}}}" for header in headers))
+        literals.append(''.join(literal))
+        literal = []
+        fields.append((col_idx, default))
+        placeholders.append(field)
+    literal.append(source[position:])
+    literals.append(''.join(literal))
+    return CompiledTemplate(source, tuple(literals), tuple(fields), tuple(placeholders))
+
+
+def compile_template(source, headers, name_col_idx=-1, phone_col_idx=-1):
+    """Compile a template against the sheet headers (cached).
+
+    Raises TemplateError for unknown placeholders, so bad templates are
+    caught when the job is submitted rather than mid-send. Braces that don't
+    enclose a name are kept as literal text.
+    """
+    return _compile(source, tuple(headers), name_col_idx, phone_col_idx)
@@ -0,0 +1,221 @@
+import time
+import threading
+from bisect import bisect_left
+
+
+# Seconds; covers sub-millisecond index lookups up to slow browser sends
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def labels(self, *values):
+        """Child metric for one label combination (cached, so cheap to call per event).
+        Pass label values as strings."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise Exception(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _samples(self):
+        if not self.labelnames:
+            self.labels()
+        with self._lock:
+            children = sorted(self._children.items())
+        for values, child in children:
+            yield from child.samples(self.name, self.labelnames, values)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{name}{labels} {_format_value(value)}" for name, labels, value in self._samples())
+        return '\n'.join(lines)
+
+
+class _CounterChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name, labelnames, values):
+        yield name, _format_labels(labelnames, values), self.value
+
+
+class Counter(_Metric):
+    """Monotonic count; exported as ``<name>_total``"""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        super().__init__(f"{name}_total", documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class _GaugeChild:
+    __slots__ = ('value', 'function')
+
+    def __init__(self):
+        self.value = 0.0
+        self.function = None
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        """Compute the value at scrape time (e.g. a queue's current depth)"""
+        self.function = function
+
+    def samples(self, name, labelnames, values):
+        yield name, _format_labels(labelnames, values), self.function() if self.function else self.value
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def set_function(self, function):
+        self.labels().set_function(function)
+
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', 'count', '_lock')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        slot = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[slot] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        return _Timer(self)
+
+    def samples(self, name, labelnames, values):
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            yield f"{name}_bucket", _format_labels(labelnames, values, [('le', _format_value(bound))]), cumulative
+        yield f"{name}_sum", _format_labels(labelnames, values), total
+        yield f"{name}_count", _format_labels(labelnames, values), count
+
+
+class Histogram(_Metric):
+    """Bucketed distribution of observed values (usually durations in seconds)"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+
+class _Timer:
+    """``with histogram.time():`` records the block's duration"""
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.child.observe(time.perf_counter() - self.started)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics)
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+REGISTRY = Registry()
+
+# Ingestion
+ROWS_INGESTED = Counter('wa_rows_ingested', 'Contact rows parsed from uploaded sheets', ['format'])
+PARSE_SECONDS = Histogram('wa_parse_duration_seconds', 'Time to parse and index an uploaded sheet', ['format'])
+UPLOAD_CACHE = Counter('wa_upload_cache_lookups', 'Upload cache lookups by result', ['result'])
+
+# Matching and send jobs
+FILTER_MATCH_SECONDS = Histogram('wa_filter_match_duration_seconds',
+                                 'Time to match filters against the category index', ['source'])
+JOB_STAGE_SECONDS = Histogram('wa_job_stage_duration_seconds', 'Time spent in each send job stage', ['stage'])
+MESSAGES = Counter('wa_messages', 'Message deliveries by filter and outcome', ['filter', 'outcome'])
+CONTACTS_SKIPPED = Counter('wa_contacts_skipped', 'Contacts skipped before sending', ['reason'])
+
+# Sending
+SEND_SECONDS = Histogram('wa_send_latency_seconds', 'Backend send call latency', ['backend'])
+QUEUE_DEPTH = Gauge('wa_send_queue_depth', 'Deliveries waiting in send worker queues')
+SCHEDULED = Gauge('wa_scheduled_messages', 'Deliveries waiting in the campaign scheduler for their send time')
+ACTIVE_JOBS = Gauge('wa_active_jobs', 'Send jobs currently running in this process')
@@ -0,0 +1,228 @@
+import os
+import threading
+import multiprocessing
+from operator import itemgetter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from ingest import stream_csv, stream_xlsx, workbook_sheets, DEFAULT_CHUNK_SIZE
+from contact_dataset import ContactDataset
+from phone_numbers import normalize_phones, MAX_REPORT_SAMPLES
+
+
+# Parser processes for multi-sheet and multi-file uploads (0 = one per CPU core)
+INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS', '0')) or os.cpu_count() or 1
+# Category column added to merged datasets with the sheet/file each row came from
+SOURCE_COLUMN = 'Source'
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    """The shared parser pool, started on first use and kept for later uploads.
+
+    Parser processes are never forked from the web process directly: that
+    would copy its threads' locks (job runner, SQLite, upload threads)
+    mid-use. They come from a forkserver with this module preloaded, or
+    are spawned where there is none (Windows).
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            if 'forkserver' in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context('forkserver')
+                context.set_forkserver_preload(['parallel_ingest'])
+            else:
+                context = multiprocessing.get_context('spawn')
+            _pool = ProcessPoolExecutor(max_workers=INGEST_WORKERS, mp_context=context)
+        return _pool
+
+
+def _drop_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+def ingest_parts(files, all_sheets=True):
+    """Split uploaded files into parse tasks ``(path, file_ext, sheet, label)``.
+
+    ``files`` is a list of ``(path, file_ext, name)``. Every CSV is one
+    part; workbooks give one part per worksheet (only the active sheet
+    unless ``all_sheets``). Labels name the sheet, the file, or both.
+    """
+    parts = []
+    for path, file_ext, name in files:
+        if file_ext in ['xlsx', 'xls'] and all_sheets:
+            for sheet in workbook_sheets(path):
+                parts.append((path, file_ext, sheet, f"{name} / {sheet}" if len(files) > 1 else sheet))
+        else:
+            parts.append((path, file_ext, None, name))
+    return parts
+
+
+def parse_part(path, file_ext, sheet=None):
+    """Headers and rows of one CSV or worksheet (runs in a pool process)"""
+    if file_ext == 'csv':
+        headers, chunks = stream_csv(path)
+    else:
+        headers, chunks = stream_xlsx(path, sheet=sheet)
+    rows = []
+    for chunk in chunks:
+        rows.extend(chunk)
+    return headers, rows
+
+
+def parse_parts(parts, progress=None, workers=None):
+    """Parse every part and return ``[(headers, rows)]`` in part order.
+
+    Parts are spread over a process pool, so a workbook with a sheet per
+    family side takes about as long as its biggest sheet rather than the
+    sum of them (XML parsing is CPU-bound and the GIL would serialize
+    threads). ``progress(rows_read, fraction)`` is called as parts finish.
+    """
+    workers = min(len(parts), workers or INGEST_WORKERS)
+    results = [None] * len(parts)
+    rows_read = 0
+    if workers <= 1:
+        for idx, (path, file_ext, sheet, label) in enumerate(parts):
+            try:
+                results[idx] = parse_part(path, file_ext, sheet)
+            except Exception as e:
+                raise Exception(f"{label}: {str(e)}")
+            rows_read += len(results[idx][1])
+            if progress:
+                progress(rows_read, (idx + 1) / len(parts))
+        return results
+
+    pool = _get_pool()
+    try:
+        futures = {pool.submit(parse_part, path, file_ext, sheet): idx
+                   for idx, (path, file_ext, sheet, _) in enumerate(parts)}
+        for done, future in enumerate(as_completed(futures), 1):
+            idx = futures[future]
+            try:
+                results[idx] = future.result()
+            except BrokenProcessPool:
+                raise
+            except Exception as e:
+                for other in futures:
+                    other.cancel()
+                raise Exception(f"{parts[idx][3]}: {str(e)}")
+            rows_read += len(results[idx][1])
+            if progress:
+                progress(rows_read, done / len(parts))
+    except BrokenProcessPool:
+        # A parser process died (e.g. out of memory); start a fresh pool next time
+        _drop_pool(pool)
+        raise Exception("A parser process stopped unexpectedly, please try again")
+    return results
+
+
+def _header_key(header):
+    return str(header).strip().casefold()
+
+
+def merge_parts(parts, results, contact_columns, country_code=None):
+    """Merge parsed parts into one ``(headers, ContactDataset, report)``.
+
+    ``contact_columns(headers)`` returns a part's ``(name_col_idx,
+    phone_col_idx)``; parts without both are skipped. Headers are aligned
+    case-insensitively: the first part's columns come first, new columns
+    from later parts are appended, and every part's Name/Phone columns map
+    onto the first part's even if named differently ("Mobile"). Merging
+    several parts adds a ``Source`` category column.
+
+    A phone number already seen in an earlier part drops the row;
+    duplicates inside one part are kept for the phone check to report, as
+    with single uploads. Numbers are compared after normalization (see
+    normalize_phones), so only numbers valid with ``country_code`` dedupe.
+    """
+    usable = []
+    skipped = []
+    for (_, _, _, label), (headers, rows) in zip(parts, results):
+        name_col_idx, phone_col_idx = contact_columns(headers)
+        if name_col_idx == -1 or phone_col_idx == -1:
+            missing = 'Name' if name_col_idx == -1 else 'Phone'
+            skipped.append({"source": label, "reason": f"no '{missing}' column"})
+            continue
+        usable.append((label, headers, rows, name_col_idx, phone_col_idx))
+    if not usable:
+        raise Exception("No sheet or file has both a 'Name' and a 'Phone' column")
+
+    _, first_headers, _, merged_name_idx, merged_phone_idx = usable[0]
+    headers = list(first_headers)
+    positions = {}
+    for idx, header in enumerate(headers):
+        positions.setdefault(_header_key(header), idx)
+    for _, part_headers, _, name_col_idx, phone_col_idx in usable[1:]:
+        for idx, header in enumerate(part_headers):
+            if idx in (name_col_idx, phone_col_idx):
+                continue
+            if _header_key(header) not in positions:
+                positions[_header_key(header)] = len(headers)
+                headers.append(header)
+    source_idx = None
+    if len(usable) > 1 and _header_key(SOURCE_COLUMN) not in positions:
+        source_idx = len(headers)
+        headers.append(SOURCE_COLUMN)
+
+    dataset = ContactDataset(headers)
+    first_part = {}
+    report_parts = []
+    duplicate_samples = []
+    duplicates = 0
+    for part_idx, (label, part_headers, rows, name_col_idx, phone_col_idx) in enumerate(usable):
+        width = len(part_headers)
+        # Source slot for each merged column: a part column, width (blank) or width + 1 (label)
+        slots = [width] * len(headers)
+        for idx, header in enumerate(part_headers):
+            if idx not in (name_col_idx, phone_col_idx):
+                slots[positions[_header_key(header)]] = idx
+        slots[merged_name_idx] = name_col_idx
+        slots[merged_phone_idx] = phone_col_idx
+        if source_idx is not None:
+            slots[source_idx] = width + 1
+        aligned = slots == list(range(width))
+        pick = itemgetter(*slots)
+        tail = ['', label]
+
+        phones, _ = normalize_phones([row[phone_col_idx] if phone_col_idx < len(row) else '' for row in rows],
+                                     country_code)
+        kept = 0
+        dropped = 0
+        chunk = []
+        for row_num, (row, phone) in enumerate(zip(rows, phones), 1):
+            if phone is not None:
+                first = first_part.setdefault(phone, part_idx)
+                if first != part_idx:
+                    dropped += 1
+                    if len(duplicate_samples) < MAX_REPORT_SAMPLES:
+                        duplicate_samples.append({"source": label, "row": row_num, "phone": phone,
+                                                  "first_source": usable[first][0]})
+                    continue
+            if aligned and len(row) == width:
+                chunk.append(row)
+            else:
+                if len(row) != width:
+                    row = row[:width] + [''] * (width - len(row))
+                chunk.append(list(pick(row + tail)))
+            if len(chunk) >= DEFAULT_CHUNK_SIZE:
+                dataset.extend(chunk)
+                kept += len(chunk)
+                chunk = []
+        if chunk:
+            dataset.extend(chunk)
+            kept += len(chunk)
+        duplicates += dropped
+        report_parts.append({"source": label, "rows": kept, "duplicates": dropped})
+
+    report = {
+        "parts": report_parts,
+        "skipped": skipped,
+        "duplicates": duplicates,
+        "duplicate_samples": duplicate_samples
+    }
+    return headers, dataset, report
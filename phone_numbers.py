@@ -0,0 +1,124 @@
+import re
+from contact_dataset import column_values
+
+
+# Separators people type inside numbers: spaces, dashes, dots, brackets, slashes
+_SEPARATORS = str.maketrans('', '', ' -().\t/\u00a0\u200b')
+# Excel hands numeric cells back as floats ("919876543210.0")
+_FLOAT_SUFFIX = re.compile(r'\.0+$', re.M)
+
+MIN_DIGITS = 8    # shortest plausible country code + subscriber number
+MAX_DIGITS = 15   # E.164 limit, country code included
+MAX_REPORT_SAMPLES = 20
+
+
+def normalize_phones(phones, country_code=None):
+    """Normalize a batch of phone numbers to E.164 (``+<digits>``).
+
+    The whole batch is cleaned with one regex pass and one ``translate``
+    over a joined string, then each value gets a few C-level string
+    checks. Numbers without ``+``/``00`` get ``country_code`` (e.g. "+91")
+    prefixed after dropping a national trunk ``0``; without a country code
+    they are rejected, as before.
+
+    Returns ``(normalized, problems)``: ``normalized[i]`` is the E.164
+    string or None, ``problems`` maps index -> reason for every None.
+    """
+    cc_digits = (country_code or '').strip().lstrip('+')
+    if cc_digits and not cc_digits.isdigit():
+        raise Exception(f"Invalid default country code: {country_code}")
+
+    texts = list(map(str, phones))
+    cleaned = _FLOAT_SUFFIX.sub('', '\n'.join(texts)).translate(_SEPARATORS).split('\n')
+    if len(cleaned) != len(texts):
+        # Some cell had an embedded line break; clean per value instead
+        cleaned = [_FLOAT_SUFFIX.sub('', text.replace('\n', ' ')).translate(_SEPARATORS) for text in texts]
+
+    normalized = []
+    append = normalized.append
+    problems = {}
+    for idx, value in enumerate(cleaned):
+        if value[:1] == '+':
+            digits = value[1:]
+        elif value[:2] == '00':
+            digits = value[2:]
+        elif not value or value == 'None':
+            problems[idx] = 'missing phone number'
+            append(None)
+            continue
+        elif cc_digits:
+            # Long numbers that already start with the country code keep it
+            if len(value) > 10 and value.startswith(cc_digits):
+                digits = value
+            else:
+                digits = cc_digits + value.lstrip('0')
+        else:
+            problems[idx] = 'missing country code'
+            append(None)
+            continue
+
+        if not (digits.isdigit() and digits.isascii()):
+            problems[idx] = 'contains letters or symbols'
+            append(None)
+        elif len(digits) < MIN_DIGITS:
+            problems[idx] = 'is too short'
+            append(None)
+        elif len(digits) > MAX_DIGITS:
+            problems[idx] = f'is too long (max {MAX_DIGITS} digits with country code)'
+            append(None)
+        else:
+            append('+' + digits)
+    return normalized, problems
+
+
+def find_duplicates(normalized):
+    """Map index -> index of the first row with the same normalized number"""
+    first_seen = {}
+    duplicates = {}
+    for idx, phone in enumerate(normalized):
+        if phone is None:
+            continue
+        first = first_seen.setdefault(phone, idx)
+        if first != idx:
+            duplicates[idx] = first
+    return duplicates
+
+
+def validate_contacts(rows, phone_col_idx, country_code=None, dedupe=True):
+    """Pre-send validation stage for a whole sheet.
+
+    Returns ``(recipients, rejected, report)``: ``recipients[i]`` is the
+    normalized phone for row i, or None when the row is invalid or a
+    duplicate of an earlier row, and ``rejected`` maps those row indices
+    to a reason. Row numbers in the report are 1-based. With ``dedupe``
+    off, repeated numbers are all kept (each row is its own delivery).
+    """
+    raw = column_values(rows, phone_col_idx)
+    normalized, problems = normalize_phones(raw, country_code)
+    duplicates = find_duplicates(normalized) if dedupe else {}
+
+    recipients = list(normalized)
+    rejected = dict(problems)
+    for idx, first in duplicates.items():
+        recipients[idx] = None
+        rejected[idx] = f'is a duplicate of row {first + 1}'
+
+    changed = sum(1 for phone, value in zip(normalized, raw)
+                  if phone is not None and phone != str(value).strip())
+    report = {
+        "total": len(rows),
+        "valid": len(rows) - len(problems) - len(duplicates),
+        "invalid": len(problems),
+        "duplicates": len(duplicates),
+        "normalized": changed,
+        "country_code": country_code or None,
+        "invalid_samples": [
+            {"row": idx + 1, "phone": str(raw[idx]), "reason": reason}
+            for idx, reason in list(problems.items())[:MAX_REPORT_SAMPLES]
+        ],
+        "duplicate_samples": [
+            {"row": idx + 1, "phone": normalized[idx], "duplicate_of": first + 1}
+            for idx, first in list(duplicates.items())[:MAX_REPORT_SAMPLES]
+        ]
+    }
+    return recipients, rejected, report
@@ -0,0 +1,115 @@
+import threading
+from array import array
+from collections import OrderedDict
+from contact_dataset import DictColumn, BLOCK_BITS, BLOCK_SIZE
+from category_index import bits_from_codes, bits_from_row_ids, row_ids_from_bits
+
+
+# Largest window one request may ask for
+MAX_PAGE_ROWS = 1000
+
+
+def _sort_key(value):
+    return value.strip().casefold()
+
+
+def _text_matches(column, needle):
+    """Row IDs of a packed text column whose cell contains ``needle``.
+    Each block is checked as a whole first, so blocks without a hit cost one scan."""
+    row_ids = []
+    for block_idx, text in enumerate(column.blocks):
+        if needle not in text.casefold():
+            continue
+        base = block_idx << BLOCK_BITS
+        for pos, value in enumerate(column.slice(base, base + BLOCK_SIZE)):
+            if needle in value.casefold():
+                row_ids.append(base + pos)
+    base = len(column.blocks) << BLOCK_BITS
+    for pos, value in enumerate(column.tail):
+        if needle in value.casefold():
+            row_ids.append(base + pos)
+    return row_ids
+
+
+def search_rows(dataset, text):
+    """Ascending IDs of rows with any cell containing ``text`` (case-insensitive)"""
+    needle = text.casefold()
+    bits = 0
+    for column in dataset.columns:
+        if isinstance(column, DictColumn):
+            # Each distinct value is checked once, then its rows come from the codes
+            wanted = [code for code, value in enumerate(column.values) if needle in value.casefold()]
+            if wanted:
+                bits |= bits_from_codes(column.codes, wanted)
+        else:
+            bits |= bits_from_row_ids(_text_matches(column, needle), dataset.row_count)
+    return array('I', row_ids_from_bits(bits))
+
+
+def sort_rows(dataset, row_ids, col_idx, descending=False):
+    """``row_ids`` ordered by one column (case-insensitive, stable)"""
+    column = dataset.column(col_idx)
+    if column is None:
+        return row_ids
+    if isinstance(column, DictColumn):
+        # Rank the distinct values once; rows sort by their value's rank
+        order = sorted(range(len(column.values)), key=lambda code: _sort_key(column.values[code]))
+        ranks = [0] * len(order)
+        for rank, code in enumerate(order):
+            ranks[code] = rank
+        codes = column.codes
+        key = lambda row_id: ranks[codes[row_id]]
+    else:
+        key = list(map(_sort_key, column.slice(0, dataset.row_count))).__getitem__
+    return array('I', sorted(row_ids, key=key, reverse=descending))
+
+
+class RowPager:
+    """Windows of a dataset's rows for the paged contacts table.
+
+    A search and/or sort produces a list of row IDs (a "view") that is kept
+    per dataset version in a small LRU, so scrolling through a sorted or
+    searched table only slices it. Unsorted, unsearched paging needs no
+    view at all.
+    """
+
+    def __init__(self, max_views=16):
+        self.max_views = max_views
+        self._views = OrderedDict()
+        self._lock = threading.Lock()
+
+    def view(self, dataset_id, rows, search='', sort_col=None, descending=False, version=0):
+        """Row IDs in display order, or None for all rows in their original order"""
+        if not search and sort_col is None:
+            return None
+        key = (dataset_id, version, search.casefold(), sort_col, descending)
+        with self._lock:
+            row_ids = self._views.get(key)
+            if row_ids is not None:
+                self._views.move_to_end(key)
+                return row_ids
+        row_ids = search_rows(rows, search) if search else array('I', range(len(rows)))
+        if sort_col is not None:
+            row_ids = sort_rows(rows, row_ids, sort_col, descending)
+        with self._lock:
+            self._views[key] = row_ids
+            while len(self._views) > self.max_views:
+                self._views.popitem(last=False)
+        return row_ids
+
+    def page(self, dataset_id, rows, offset=0, limit=100, search='', sort_col=None, descending=False, version=0):
+        """Return ``(total, row_ids, cells)`` for one window of the view"""
+        limit = max(0, min(limit, MAX_PAGE_ROWS))
+        offset = max(0, offset)
+        row_ids = self.view(dataset_id, rows, search, sort_col, descending, version)
+        if row_ids is None:
+            total = len(rows)
+            stop = min(offset + limit, total)
+            return total, list(range(offset, stop)), rows.to_rows(offset, stop)
+        window = row_ids[offset:offset + limit].tolist()
+        return len(row_ids), window, [rows[row_id].to_list() for row_id in window]
+
+    def discard(self, dataset_id):
+        with self._lock:
+            for key in [key for key in self._views if key[0] == dataset_id]:
+                del self._views[key]
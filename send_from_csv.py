@@ -1,20 +1,260 @@
+import os
 import json
 import time
-from datetime import datetime
-import pywhatkit as kit
-import keyboard
+import uuid
+import queue
+import hashlib
+import threading
+import http.client
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+from array import array
+from category_index import CategoryIndex, bits_from_row_ids, row_ids_from_bits, count_bits
+from filter_expr import compile_filter, FilterError
+from contact_dataset import as_dataset, column_values
+from send_pool import SendWorkerPool, backoff_delay
+from job_log import structured_logger
+from message_template import compile_template, TemplateError
+from phone_numbers import validate_contacts
+from campaign_scheduler import scheduler as default_scheduler, parse_send_datetime
+from campaign_simulation import simulate_sends, latency_preset, format_duration
+from metrics import JOB_STAGE_SECONDS, FILTER_MATCH_SECONDS, MESSAGES, CONTACTS_SKIPPED
 
 
-def run_send_job(params, logger):
+# A job whose next batch is due later than this parks (gives its runner slot
+# back until then) when its tracker supports it, instead of waiting in place
+PARK_AFTER_SECONDS = 60
+
+
+class SendBackend:
+    """Transport used by run_send_job to deliver one message.
+
+    ``max_concurrency`` tells the caller how many sends may be in flight at
+    once; desktop automation can only ever do one.
+    """
+
+    name = 'base'
+    max_concurrency = 1
+
+    def send(self, phone, message):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class PyWhatKitBackend(SendBackend):
+    """Sends through WhatsApp Web in the desktop browser via pywhatkit"""
+
+    name = 'pywhatkit'
+    # One browser per machine, shared by every job that is sending right now
+    _browser_lock = threading.Lock()
+
+    def __init__(self, wait_time=10):
+        # pywhatkit probes the display and network on import, so load it only
+        # when this backend is actually used
+        import pywhatkit
+        import keyboard
+        self.kit = pywhatkit
+        self.keyboard = keyboard
+        self.wait_time = wait_time
+
+    def send(self, phone, message):
+        with self._browser_lock:
+            # Schedule for the next minute, the earliest pywhatkit accepts
+            send_at = datetime.now() + timedelta(minutes=1)
+            self.kit.sendwhatmsg(phone, message, send_at.hour, send_at.minute, self.wait_time, True, 2)
+            
+            # Wait between messages
+            time.sleep(self.wait_time)
+            
+            # Press ESC to close tab
+            self.keyboard.press_and_release('esc')
+            time.sleep(1)
+
+
+class HttpApiBackend(SendBackend):
+    """Sends through a WhatsApp Cloud API style REST endpoint.
+
+    Keeps a small pool of persistent HTTP/1.1 connections so consecutive
+    sends reuse the same TCP/TLS session instead of reconnecting.
+    """
+
+    name = 'http'
+
+    def __init__(self, api_url, phone_number_id, token='', pool_size=4, timeout=30):
+        parts = urlsplit(api_url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise Exception(f"Invalid API URL: {api_url}")
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.path = f"{parts.path.rstrip('/')}/{phone_number_id}/messages"
+        self.token = token
+        self.timeout = timeout
+        self.max_concurrency = pool_size
+        self._pool = queue.LifoQueue()
+        for _ in range(pool_size):
+            self._pool.put(None)
+
+    def _connect(self):
+        if self.scheme == 'https':
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def send(self, phone, message):
+        body = json.dumps({
+            "messaging_product": "whatsapp",
+            "to": phone,
+            "type": "text",
+            "text": {"body": message}
+        }).encode('utf-8')
+        headers = {'Content-Type': 'application/json'}
+        if self.token:
+            headers['Authorization'] = f"Bearer {self.token}"
+
+        conn = self._pool.get()
+        try:
+            if conn is None:
+                conn = self._connect()
+            try:
+                conn.request('POST', self.path, body, headers)
+                response = conn.getresponse()
+            except (http.client.HTTPException, OSError):
+                # Pooled keep-alive connection went stale; retry once on a fresh one
+                conn.close()
+                conn = self._connect()
+                conn.request('POST', self.path, body, headers)
+                response = conn.getresponse()
+            data = response.read()
+            if response.will_close:
+                conn.close()
+                conn = None
+        except Exception:
+            if conn is not None:
+                conn.close()
+            conn = None
+            raise
+        finally:
+            self._pool.put(conn)
+
+        if response.status >= 300:
+            raise Exception(f"API returned {response.status}: {data[:200].decode('utf-8', 'replace')}")
+        return json.loads(data or b'{}')
+
+    def close(self):
+        while True:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            if conn is not None:
+                conn.close()
+
+
+class FakeServerBackend(HttpApiBackend):
+    """HTTP backend wired to an in-process FakeWhatsAppServer, for testing"""
+
+    name = 'fake'
+
+    def __init__(self, pool_size=4, latency=0.0):
+        from fake_whatsapp_server import FakeWhatsAppServer
+        self.server = FakeWhatsAppServer(latency=latency).start()
+        super().__init__(self.server.url, 'fake', pool_size=pool_size)
+
+    def close(self):
+        super().close()
+        self.server.stop()
+
+
+def get_send_backend(params):
+    """Build the backend named by ``params['backend']`` (default pywhatkit)"""
+    backend = params.get('send_backend')
+    if backend is not None:
+        return backend
+
+    name = params.get('backend') or 'pywhatkit'
+    pool_size = params.get('pool_size') or max(4, params.get('concurrency', 1))
+    if name == 'pywhatkit':
+        return PyWhatKitBackend(params.get('wait_time', 10))
+    if name == 'http':
+        api_url = params.get('api_url') or os.environ.get('WHATSAPP_API_URL', 'https://graph.facebook.com/v19.0')
+        phone_number_id = params.get('phone_number_id') or os.environ.get('WHATSAPP_PHONE_NUMBER_ID')
+        token = params.get('api_token') or os.environ.get('WHATSAPP_API_TOKEN', '')
+        if not phone_number_id:
+            raise Exception("HTTP backend needs a phone number ID (set WHATSAPP_PHONE_NUMBER_ID)")
+        return HttpApiBackend(api_url, phone_number_id, token, pool_size=pool_size)
+    if name == 'fake':
+        return FakeServerBackend(pool_size=pool_size)
+    raise Exception(f"Unknown send backend: {name}")
+
+
+def config_hash(filter_messages):
+    """Default campaign ID: the same filters, templates and times hash the same"""
+    config = [[fm['filters'], fm['template'], fm.get('send_datetime')] for fm in filter_messages]
+    return hashlib.sha1(json.dumps(config, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+
+
+def template_hash(sources):
+    """Ledger hash of the template(s) making up one delivery"""
+    return hashlib.sha1('\x00'.join(sources).encode('utf-8')).hexdigest()[:16]
+
+
+def deliveries_sheet(deliveries):
+    """Job params that send pre-rendered deliveries (e.g. resubmitted dead
+    letters) through the normal pipeline: one row per delivery and a single
+    match-all filter whose template is the stored message."""
+    return {
+        "headers": ['Name', 'Phone', 'Message'],
+        "rows": [[d.get('name') or d['phone'], d['phone'], d['message']] for d in deliveries],
+        "filter_messages": [{"filters": {}, "template": '{Message}', "send_datetime": None}],
+        "template_hashes": [d.get('template_hash') for d in deliveries],
+        # Several deliveries may go to one phone (different filters/templates)
+        "dedupe": False
+    }
+
+
+def run_send_job(params, logger, tracker=None, ledger=None):
     """
     Main function to send WhatsApp messages based on filter combinations
+
+    ``logger`` is a JobLog or a plain ``logger(line)`` callable.
+    ``tracker`` (optional) records per-recipient state so an interrupted job
+    can resume: it needs ``is_sent(key)``, ``mark(key, state)`` and
+    ``dead_letter(entry)`` for deliveries that ran out of retries.
+    Failed sends are retried through the scheduler with exponential backoff
+    (``max_attempts``, ``retry_base_seconds``, ``retry_max_seconds``).
+    Each filter's messages wait in the campaign scheduler until its
+    ``send_datetime`` (``params['scheduler']`` overrides the shared one).
+    If the tracker also has ``park(not_before)`` (JobContext), batches due
+    more than PARK_AFTER_SECONDS out aren't waited for: the job sends what is
+    due, then parks until the next batch and runs again from the start,
+    skipping deliveries already sent.
+    ``ledger`` (optional) remembers delivered messages across jobs, keyed by
+    (phone, template hash, campaign): it needs ``delivered(campaign)`` and
+    ``record_delivered(entries)``; runs on the ``fake`` backend skip it.
+    With ``params['coalesce']`` a contact's messages that share a send time
+    are merged into one delivery.
+    ``params['deliveries']`` sends pre-rendered messages instead of a sheet.
+    With ``params['dry_run']`` nothing is sent: every delivery is matched and
+    rendered as usual, then replayed through a simulated backend in virtual
+    time (``params['simulation']``: ``latency`` distribution, ``failure_rate``,
+    ``seed``) to estimate how long the campaign will take.
     """
-    logger("🚀 Starting send job...")
+    if params.get('deliveries'):
+        params = dict(params, **deliveries_sheet(params['deliveries']))
+    logger = structured_logger(logger)
+    trace_enabled = logger.enabled('trace')
+    debug_enabled = logger.enabled('debug')
+    
+    dry_run = bool(params.get('dry_run'))
+    pipeline_started = time.perf_counter()
+    logger("🧪 Starting dry run (nothing will be sent)..." if dry_run else "🚀 Starting send job...")
     
-    rows = params['rows']
     headers = params['headers']
+    # Job params carry the sheet as an encoded ContactDataset (plain row lists also work)
+    rows = as_dataset(headers, params['rows'])
     filter_messages = params['filter_messages']
-    wait_time = params['wait_time']
     
     # Dynamically find Name and Phone column indices with priority
     name_col_idx = -1
@@ -47,22 +287,87 @@ def run_send_job(params, logger):
                 break
     
     if name_col_idx == -1:
-        logger("❌ ERROR: Could not find 'Name' column in headers")
+        logger("❌ ERROR: Could not find 'Name' column in headers", 'error')
         raise Exception("Name column not found. Please ensure your file has a column with 'Name' in the header.")
     
     if phone_col_idx == -1:
-        logger("❌ ERROR: Could not find 'Phone' column in headers")
+        logger("❌ ERROR: Could not find 'Phone' column in headers", 'error')
         raise Exception("Phone column not found. Please ensure your file has a column with 'Phone' in the header.")
     
     logger(f"📋 Headers: {', '.join(headers)}")
     logger(f"✅ Name column detected at index {name_col_idx}: '{headers[name_col_idx]}'")
     logger(f"✅ Phone column detected at index {phone_col_idx}: '{headers[phone_col_idx]}'")
+    # Compile each filter's template once; unknown placeholders fail the job before any send
+    templates = []
+    for filter_idx, fm in enumerate(filter_messages):
+        try:
+            templates.append(compile_template(fm['template'], headers, name_col_idx, phone_col_idx))
+        except TemplateError as e:
+            logger(f"❌ ERROR: Filter #{filter_idx + 1} message template: {str(e)}", 'error', filter_id=filter_idx + 1)
+            raise Exception(f"Filter #{filter_idx + 1} message template: {str(e)}")
+    # Compile each filter's conditions once as well (plain dicts or expressions)
+    compiled_filters = []
+    for filter_idx, fm in enumerate(filter_messages):
+        try:
+            compiled_filters.append(compile_filter(fm['filters'], headers))
+        except FilterError as e:
+            logger(f"❌ ERROR: Filter #{filter_idx + 1} conditions: {str(e)}", 'error', filter_id=filter_idx + 1)
+            raise Exception(f"Filter #{filter_idx + 1} conditions: {str(e)}")
+    send_times = [parse_send_datetime(fm.get('send_datetime')) for fm in filter_messages]
+    
+    # Send groups: one per filter, or with coalescing one per distinct send
+    # time, so a contact gets a single combined message for that time
+    coalesce = bool(params.get('coalesce'))
+    send_groups = []
+    group_of_filter = []
+    group_by_time = {}
+    for filter_idx, due_ts in enumerate(send_times):
+        if not coalesce or due_ts not in group_by_time:
+            group_by_time[due_ts] = len(send_groups)
+            send_groups.append([])
+        group_idx = group_by_time[due_ts]
+        send_groups[group_idx].append(filter_idx)
+        group_of_filter.append(group_idx)
+    
+    campaign = params.get('campaign') or config_hash(filter_messages)
+    # Local test server runs stay out of the sent ledger: they neither skip
+    # nor block messages of the real campaign
+    if params.get('backend') == 'fake':
+        ledger = None
+    delivered = ledger.delivered(campaign) if ledger is not None else set()
+    delivery_hashes = {}
+    row_hashes = params.get('template_hashes')
+    
+    def delivery_hash(row_id, filter_idxs):
+        # Resubmitted deliveries keep the hash of the template they came from
+        if row_hashes and row_hashes[row_id]:
+            return row_hashes[row_id]
+        if filter_idxs not in delivery_hashes:
+            delivery_hashes[filter_idxs] = template_hash([filter_messages[f]['template'] for f in filter_idxs])
+        return delivery_hashes[filter_idxs]
+    
+    max_attempts = max(1, int(params.get('max_attempts', 3)))
+    retry_base = float(params.get('retry_base_seconds', 5))
+    retry_max = float(params.get('retry_max_seconds', 300))
+    
+    # Normalize and dedupe every phone number up front, in one batch
+    with JOB_STAGE_SECONDS.labels('validate').time():
+        recipients, rejected, validation = validate_contacts(rows, phone_col_idx, params.get('country_code'),
+                                                            dedupe=params.get('dedupe', True))
+    
     logger(f"📊 Total contacts: {len(rows)}")
+    logger(f"☎️ Phone numbers: {validation['valid']} valid, {validation['invalid']} invalid, "
+           f"{validation['duplicates']} duplicates, {validation['normalized']} normalized")
     logger(f"🎯 Total filter combinations: {len(filter_messages)}")
     
     sent_count = 0
     skip_count = 0
     error_count = 0
+    ledger_skips = 0
+    resumed_count = 0
+    coalesced_count = 0
+    retry_count = 0
+    dead_count = 0
     
     # Track summary by filter
     filter_summary = []
@@ -74,111 +379,415 @@ def run_send_job(params, logger):
             'skipped': 0
         })
     
-    for row_idx, row in enumerate(rows, 1):
+    # Match every filter once against the category index, then look up
+    # each row's matched filters instead of re-scanning cells per filter
+    with JOB_STAGE_SECONDS.labels('match').time():
+        index = params.get('index') or CategoryIndex(headers, rows)
+        matched_filters_by_row = {}
+        matched_bits_by_filter = []
+        for filter_idx, compiled in enumerate(compiled_filters):
+            with FILTER_MATCH_SECONDS.labels('job').time():
+                matched_bits = compiled.match(index)
+            matched_bits_by_filter.append(matched_bits)
+            for row_id in row_ids_from_bits(matched_bits):
+                matched_filters_by_row.setdefault(row_id, set()).add(filter_idx)
+    
+    # Column positions for the per-category trace lines, resolved once
+    filter_columns = [
+        [(category, required_value, index.column_index(category))
+         for category, required_value in compiled.simple.items()]
+        if compiled.simple is not None else compiled.columns
+        for compiled in compiled_filters
+    ]
+    
+    backend = None if dry_run else get_send_backend(params)
+    counter_lock = threading.Lock()
+    
+    # Deliveries scheduled but not yet sent or given up on; the dispatch
+    # loop below ends when this drops to zero
+    outstanding = 0
+    attempts = {}
+    
+    def settle():
+        nonlocal outstanding
+        with counter_lock:
+            outstanding -= 1
+            if outstanding == 0:
+                due_batches.put(None)
+    
+    def on_send_result(delivery, error):
+        nonlocal sent_count, error_count, retry_count, dead_count
+        filter_id = delivery['filter_id']
+        if error is None:
+            MESSAGES.labels(str(filter_id), 'sent').inc()
+            if tracker is not None:
+                tracker.mark(delivery['key'], 'sent')
+            if ledger is not None:
+                ledger.record_delivered([(delivery['phone'], delivery['template_hash'], campaign)])
+            if debug_enabled:
+                logger(f"   ✅ Filter #{delivery['label']} message sent successfully to {delivery['name']}!",
+                       'debug', delivery['row'], filter_id, 'sent')
+            with counter_lock:
+                sent_count += 1
+            settle()
+        elif delivery['attempt'] < max_attempts:
+            # Back off and let the scheduler hand it back; workers never wait here
+            delay = backoff_delay(delivery['attempt'], retry_base, retry_max)
+            MESSAGES.labels(str(filter_id), 'retried').inc()
+            with counter_lock:
+                attempts[(delivery['row'] - 1, delivery['group'])] = delivery['attempt'] + 1
+                retry_count += 1
+            if tracker is not None:
+                tracker.mark(delivery['key'], 'retrying')
+            logger(f"   🔁 Filter #{delivery['label']} message to {delivery['name']} failed "
+                   f"(attempt {delivery['attempt']}/{max_attempts}): {str(error)}; retrying in {delay:.0f}s",
+                   'warning', delivery['row'], filter_id, 'send_retry')
+            scheduler.schedule(schedule_key, scheduler.clock() + delay, delivery['group'], [delivery['row'] - 1])
+        else:
+            MESSAGES.labels(str(filter_id), 'failed').inc()
+            if tracker is not None:
+                tracker.mark(delivery['key'], 'failed')
+                tracker.dead_letter({
+                    'key': delivery['key'],
+                    'campaign': campaign,
+                    'name': delivery['name'],
+                    'phone': delivery['phone'],
+                    'message': delivery['message'],
+                    'template_hash': delivery['template_hash'],
+                    'attempts': delivery['attempt'],
+                    'error': str(error)
+                })
+            logger(f"   ❌ Error sending Filter #{delivery['label']} message to {delivery['name']} "
+                   f"after {delivery['attempt']} attempt(s): {str(error)}",
+                   'error', delivery['row'], filter_id, 'send_failed')
+            with counter_lock:
+                error_count += 1
+                dead_count += 1
+            settle()
+    
+    if dry_run:
+        # The browser backend can only ever send one message at a time
+        backend_name = params.get('backend') or 'pywhatkit'
+        sim_concurrency = 1 if backend_name == 'pywhatkit' else max(1, int(params.get('concurrency', 1) or 1))
+        logger(f"📡 Send backend: {backend_name}, simulated ({sim_concurrency} worker(s))")
+    else:
+        # Started when the first batch comes due, so throughput excludes the wait
+        pool = SendWorkerPool(
+            backend,
+            on_send_result,
+            concurrency=params.get('concurrency', 1),
+            rate_per_second=params.get('rate_per_second', 0),
+            phone_cooldown=params.get('phone_cooldown', 0)
+        )
+        logger(f"📡 Send backend: {backend.name} ({pool.concurrency} worker(s))")
+    if delivered:
+        logger(f"📒 Campaign {campaign}: {len(delivered)} message(s) already delivered by earlier jobs")
+    
+    # Matched deliveries per send group, as dataset row IDs
+    scheduled_rows = [array('I') for _ in send_groups]
+    # Skip reasons, published to metrics once after the loop
+    skip_reasons = {}
+    prepare_started = time.perf_counter()
+    
+    # Rows that can be messaged at all; the rest are logged and counted here
+    names = column_values(rows, name_col_idx)
+    phones = column_values(rows, phone_col_idx)
+    min_length = max(name_col_idx, phone_col_idx) + 1
+    valid_row_ids = []
+    for row_id, (name, phone) in enumerate(zip(names, phones)):
+        row_idx = row_id + 1
+        if rows.row_length(row_id) < min_length:
+            logger(f"⚠️ Row {row_idx}: Invalid row format, skipping", 'warning', row_idx, event='row_skipped')
+            skip_reasons['invalid_row'] = skip_reasons.get('invalid_row', 0) + 1
+            skip_count += 1
+        elif not str(name).strip() or not str(phone).strip():
+            logger(f"⚠️ Row {row_idx}: Missing name or phone, skipping", 'warning', row_idx, event='row_skipped')
+            skip_reasons['missing_name_or_phone'] = skip_reasons.get('missing_name_or_phone', 0) + 1
+            skip_count += 1
+        elif recipients[row_id] is None:
+            # Use the normalized E.164 number; invalid and duplicate numbers are skipped
+            logger(f"⚠️ Row {row_idx}: Phone {str(phone).strip()} {rejected[row_id]}, skipping", 'warning', row_idx, event='row_skipped')
+            reason = 'duplicate_phone' if rejected[row_id].startswith('is a duplicate') else 'invalid_phone'
+            skip_reasons[reason] = skip_reasons.get(reason, 0) + 1
+            skip_count += 1
+        else:
+            valid_row_ids.append(row_id)
+    
+    # Per-filter breakdown straight from the match bitsets
+    valid_bits = bits_from_row_ids(valid_row_ids, len(rows))
+    any_bits = 0
+    for filter_idx, matched_bits in enumerate(matched_bits_by_filter):
+        matched_bits &= valid_bits
+        any_bits |= matched_bits
+        filter_summary[filter_idx]['sent'] = count_bits(matched_bits)
+        filter_summary[filter_idx]['skipped'] = len(valid_row_ids) - filter_summary[filter_idx]['sent']
+    no_match_count = len(valid_row_ids) - count_bits(any_bits)
+    if no_match_count:
+        skip_reasons['no_match'] = no_match_count
+        skip_count += no_match_count
+    
+    # Only matched rows are visited, unless debug/trace logging wants every contact
+    verbose = debug_enabled or trace_enabled
+    for row_id in valid_row_ids if verbose else row_ids_from_bits(any_bits):
+        row_idx = row_id + 1
         try:
-            if len(row) <= max(name_col_idx, phone_col_idx):
-                logger(f"⚠️ Row {row_idx}: Invalid row format, skipping")
-                skip_count += 1
-                continue
+            name = str(names[row_id]).strip()
+            phone = recipients[row_id]
+            matched_filters = matched_filters_by_row.get(row_id, ())
             
-            name = str(row[name_col_idx]).strip() if name_col_idx < len(row) else ''
-            phone = str(row[phone_col_idx]).strip() if phone_col_idx < len(row) else ''
-            
-            if not name or not phone:
-                logger(f"⚠️ Row {row_idx}: Missing name or phone, skipping")
-                skip_count += 1
-                continue
-            
-            # Ensure phone has country code
-            if not phone.startswith('+'):
-                logger(f"⚠️ Row {row_idx}: Phone {phone} missing country code, skipping")
-                skip_count += 1
-                continue
-            
-            logger(f"\n{'='*60}")
-            logger(f"👤 Contact {row_idx}: {name} ({phone})")
-            
-            # Check which filter combinations match this contact
-            messages_to_send = []
-            
-            for filter_idx, filter_msg in enumerate(filter_messages):
-                filters = filter_msg['filters']
-                match = True
-                
-                logger(f"   🔍 Checking Filter #{filter_idx + 1}:")
-                
-                # Check each category filter
-                for category, required_value in filters.items():
-                    col_idx = headers.index(category) if category in headers else -1
-                    
-                    if col_idx == -1 or col_idx >= len(row):
-                        logger(f"      ❌ {category}: Column not found")
-                        match = False
-                        break
+            if verbose:
+                row = rows[row_id]
+                if debug_enabled:
+                    logger(f"\n{'='*60}", 'debug', row_idx)
+                    logger(f"👤 Contact {row_idx}: {name} ({phone})", 'debug', row_idx, event='contact')
+                for filter_idx in range(len(filter_messages)):
+                    match = filter_idx in matched_filters
                     
-                    cell_value = str(row[col_idx]).strip()
+                    # Trace each category filter (off unless trace logging is enabled)
+                    if trace_enabled:
+                        logger(f"   🔍 Checking Filter #{filter_idx + 1}:", 'trace', row_idx, filter_idx + 1, 'filter_check')
+                        if compiled_filters[filter_idx].simple is None:
+                            # Expressions: show the cells they read and the overall result
+                            for category, col_idx in filter_columns[filter_idx]:
+                                cell_value = str(row[col_idx]).strip() if col_idx < len(row) else ''
+                                logger(f"      • {category}: '{cell_value}'", 'trace', row_idx, filter_idx + 1, 'category_value')
+                            logger(f"      {'✅' if match else '❌'} {compiled_filters[filter_idx].describe()}",
+                                   'trace', row_idx, filter_idx + 1, 'category_match' if match else 'category_mismatch')
+                        else:
+                            for category, required_value, col_idx in filter_columns[filter_idx]:
+                                if col_idx == -1 or col_idx >= len(row):
+                                    logger(f"      ❌ {category}: Column not found", 'trace', row_idx, filter_idx + 1, 'category_missing')
+                                    break
+                                
+                                cell_value = str(row[col_idx]).strip()
+                                
+                                if cell_value.upper() != str(required_value).upper():
+                                    logger(f"      ❌ {category}: Expected '{required_value}', Got '{cell_value}'",
+                                           'trace', row_idx, filter_idx + 1, 'category_mismatch')
+                                    break
+                                else:
+                                    logger(f"      ✅ {category}: {cell_value} (matches)", 'trace', row_idx, filter_idx + 1, 'category_match')
                     
-                    if cell_value.upper() != required_value.upper():
-                        logger(f"      ❌ {category}: Expected '{required_value}', Got '{cell_value}'")
-                        match = False
-                        break
-                    else:
-                        logger(f"      ✅ {category}: {cell_value} (matches)")
+                    if debug_enabled:
+                        if match:
+                            logger(f"   ✅ Filter #{filter_idx + 1} MATCHED - Message will be sent",
+                                   'debug', row_idx, filter_idx + 1, 'filter_matched')
+                        else:
+                            logger(f"   ⏭️ Filter #{filter_idx + 1} NOT MATCHED - Skipping",
+                                   'debug', row_idx, filter_idx + 1, 'filter_not_matched')
                 
-                if match:
-                    logger(f"   ✅ Filter #{filter_idx + 1} MATCHED - Message will be sent")
-                    messages_to_send.append({
-                        'filter_id': filter_idx + 1,
-                        'message': filter_msg['template'],
-                        'datetime': filter_msg['send_datetime'],
-                        'filters': filters
-                    })
-                    filter_summary[filter_idx]['sent'] += 1
-                else:
-                    logger(f"   ⏭️ Filter #{filter_idx + 1} NOT MATCHED - Skipping")
-                    filter_summary[filter_idx]['skipped'] += 1
+                if not matched_filters:
+                    if debug_enabled:
+                        logger(f"   ℹ️ No matching filters for {name}", 'debug', row_idx, event='no_match')
+                    continue
             
-            if not messages_to_send:
-                logger(f"   ℹ️ No matching filters for {name}")
-                skip_count += 1
-                continue
+            # Schedule one delivery per send group the contact matched
+            group_filters = {}
+            for filter_idx in sorted(matched_filters):
+                group_filters.setdefault(group_of_filter[filter_idx], []).append(filter_idx)
             
-            # Send messages for each matched filter
-            for msg_data in messages_to_send:
-                filter_id = msg_data['filter_id']
-                try:
-                    template = msg_data['message']
-                    
-                    # Replace placeholders
-                    message = template.replace('{name}', name).replace('{Name}', name)
-                    
-                    logger(f"   📤 Sending Filter #{filter_id} message to {name}...")
-                    
-                    # Get current time for immediate send
-                    now = datetime.now()
-                    hour = now.hour
-                    minute = now.minute + 1
-                    
-                    # Send via WhatsApp
-                    kit.sendwhatmsg(phone, message, hour, minute, wait_time, True, 2)
-                    
-                    logger(f"   ✅ Filter #{filter_id} message sent successfully!")
-                    sent_count += 1
-                    
-                    # Wait between messages
-                    time.sleep(wait_time)
-                    
-                    # Press ESC to close tab
-                    keyboard.press_and_release('esc')
-                    time.sleep(1)
-                    
-                except Exception as e:
-                    logger(f"   ❌ Error sending Filter #{filter_id} message: {str(e)}")
-                    error_count += 1
+            for group_idx, filter_idxs in group_filters.items():
+                filter_idxs = tuple(filter_idxs)
+                filter_id = filter_idxs[0] + 1
+                label = '+'.join(str(f + 1) for f in filter_idxs)
+                delivery_key = f"{row_idx}:{label}"
+                if tracker is not None and tracker.is_sent(delivery_key):
+                    resumed_count += 1
+                    MESSAGES.labels(str(filter_id), 'skipped').inc()
+                    if debug_enabled:
+                        logger(f"   ⏩ Filter #{label} message already sent to {name} before restart, skipping",
+                               'debug', row_idx, filter_id, 'already_sent')
+                    continue
+                if (phone, delivery_hash(row_id, filter_idxs)) in delivered:
+                    ledger_skips += 1
+                    MESSAGES.labels(str(filter_id), 'skipped').inc()
+                    if debug_enabled:
+                        logger(f"   📒 Filter #{label} message already delivered to {phone} in this campaign, skipping",
+                               'debug', row_idx, filter_id, 'already_delivered')
+                    continue
+                
+                if debug_enabled:
+                    logger(f"   🗓️ Scheduling Filter #{label} message to {name}...", 'debug', row_idx, filter_id, 'scheduled')
+                scheduled_rows[group_idx].append(row_id)
+                coalesced_count += len(filter_idxs) - 1
                     
         except Exception as e:
-            logger(f"❌ Error processing row {row_idx}: {str(e)}")
-            error_count += 1
+            logger(f"❌ Error processing row {row_idx}: {str(e)}", 'error', row_idx, event='row_error')
+            with counter_lock:
+                error_count += 1
+    
+    JOB_STAGE_SECONDS.labels('prepare').observe(time.perf_counter() - prepare_started)
+    for reason, count in skip_reasons.items():
+        CONTACTS_SKIPPED.labels(reason).inc(count)
+    
+    if resumed_count:
+        logger(f"⏩ Skipped {resumed_count} message(s) this job already sent before it was parked or restarted")
+    if ledger_skips:
+        logger(f"📒 Skipped {ledger_skips} message(s) already delivered in campaign {campaign}")
+    if coalesced_count:
+        logger(f"🧩 Merged {coalesced_count} message(s) into other deliveries to the same contact")
+    
+    def render_delivery(row_id, group):
+        """Matched filters, label and message for one row in a send group"""
+        matched = matched_filters_by_row[row_id]
+        filter_idxs = tuple(f for f in group if f in matched)
+        # Fill placeholders from this row's columns
+        row = rows[row_id]
+        return filter_idxs, '+'.join(str(f + 1) for f in filter_idxs), '\n\n'.join(templates[f].render(row) for f in filter_idxs)
+    
+    if dry_run:
+        # Render every delivery as a real send would, then replay them in virtual time
+        simulated = []
+        with JOB_STAGE_SECONDS.labels('render').time():
+            for group_idx, row_ids in enumerate(scheduled_rows):
+                group = send_groups[group_idx]
+                for row_id in row_ids:
+                    try:
+                        _, label, _ = render_delivery(row_id, group)
+                        simulated.append((send_times[group[0]], recipients[row_id], label))
+                    except Exception as e:
+                        logger(f"❌ Error processing row {row_id + 1}: {str(e)}", 'error', row_id + 1, event='row_error')
+                        error_count += 1
+        pipeline_seconds = time.perf_counter() - pipeline_started
+        
+        simulation = params.get('simulation') or {}
+        latency = simulation.get('latency') or latency_preset(params)
+        simulate_started = time.perf_counter()
+        estimate = simulate_sends(
+            simulated,
+            time.time(),
+            concurrency=sim_concurrency,
+            rate_per_second=params.get('rate_per_second', 0),
+            phone_cooldown=params.get('phone_cooldown', 0),
+            latency=latency,
+            failure_rate=float(simulation.get('failure_rate', 0) or 0),
+            max_attempts=max_attempts,
+            retry_base=retry_base,
+            retry_max=retry_max,
+            seed=simulation.get('seed', 0)
+        )
+        simulate_seconds = time.perf_counter() - simulate_started
+        
+        def at(ts):
+            return datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M')
+        
+        logger("\n" + "=" * 60)
+        logger("🧪 DRY RUN ESTIMATE")
+        logger("=" * 60)
+        logger(f"👥 Total contacts processed: {len(rows)}")
+        logger(f"✉️ Messages that would be sent: {len(simulated)}")
+        logger(f"⏭️ Skipped: {skip_count}")
+        logger(f"❌ Errors: {error_count}")
+        logger(f"📡 Simulated send latency: {json.dumps(latency)}")
+        if simulated:
+            logger(f"⏱️ Estimated wall-clock time: {format_duration(estimate['wall_clock_seconds'])} "
+                   f"(done around {at(estimate['finish'])})")
+            logger(f"⚡ Sending: {format_duration(estimate['send_seconds'])} at ~{estimate['throughput_per_minute']} "
+                   f"messages/min with {sim_concurrency} worker(s), {estimate['worker_utilization']:.0%} busy")
+            logger(f"📦 Peak queue depth: {estimate['peak_queue_depth']} (up to {estimate['peak_backlog']} message(s) waiting)")
+        if estimate['retries'] or estimate['failed']:
+            logger(f"🔁 Expected retries: {estimate['retries']} ({estimate['failed']} message(s) would give up)")
+        logger(f"⚙️ Pipeline (validate, match, render): {pipeline_seconds:.2f}s; simulation: {simulate_seconds:.2f}s")
+        logger("\n🎯 FILTER BREAKDOWN:")
+        for stats in estimate['filters']:
+            logger(f"   Filter #{stats['filter']}: {stats['messages']} message(s), "
+                   f"{at(stats['first_send'])} → {at(stats['finished'])} "
+                   f"({format_duration(stats['finished'] - stats['first_send'])})")
+        logger("=" * 60)
+        
+        return {
+            "dry_run": True,
+            "sent": 0,
+            "skipped": skip_count,
+            "errors": error_count,
+            "concurrency": sim_concurrency,
+            "phones": validation,
+            "campaign": campaign,
+            "already_delivered": ledger_skips,
+            "coalesced": coalesced_count,
+            "pipeline_seconds": round(pipeline_seconds, 3),
+            "estimate": estimate,
+            "filters": filter_summary
+        }
+    
+    # Hand every group's batch to the scheduler, then send batches as they come due.
+    # Batches far in the future are left for a later run when the job can park.
+    scheduler = params.get('scheduler') or default_scheduler
+    schedule_key = uuid.uuid4().hex
+    due_batches = queue.Queue()
+    scheduler.register(schedule_key, lambda group_idx, row_ids: due_batches.put((group_idx, row_ids)))
+    park_horizon = time.time() + PARK_AFTER_SECONDS if hasattr(tracker, 'park') else None
+    park_until = None
+    batches = []
+    for group_idx, row_ids in enumerate(scheduled_rows):
+        if not row_ids:
+            continue
+        due_ts = send_times[send_groups[group_idx][0]]
+        if park_horizon is not None and due_ts is not None and due_ts > park_horizon:
+            park_until = due_ts if park_until is None else min(park_until, due_ts)
+        else:
+            batches.append((group_idx, due_ts, row_ids))
+    outstanding = sum(len(row_ids) for _, _, row_ids in batches)
+    if outstanding == 0:
+        due_batches.put(None)
+    try:
+        for group_idx, row_ids in enumerate(scheduled_rows):
+            due_ts = send_times[send_groups[group_idx][0]]
+            if row_ids and due_ts is not None and due_ts > time.time():
+                group_label = '+'.join(str(f + 1) for f in send_groups[group_idx])
+                logger(f"🗓️ Filter #{group_label}: {len(row_ids)} message(s) scheduled for "
+                       f"{datetime.fromtimestamp(due_ts).strftime('%Y-%m-%d %H:%M')}",
+                       filter_id=send_groups[group_idx][0] + 1, event='filter_scheduled')
+        for group_idx, due_ts, row_ids in batches:
+            scheduler.schedule(schedule_key, due_ts, group_idx, row_ids)
+        
+        while True:
+            batch = due_batches.get()
+            if batch is None:
+                break
+            group_idx, row_ids = batch
+            group = send_groups[group_idx]
+            if not pool.started:
+                pool.start()
+            if len(row_ids) > 1 or (row_ids[0], group_idx) not in attempts:
+                logger(f"⏰ Filter #{'+'.join(str(f + 1) for f in group)}: sending {len(row_ids)} message(s)",
+                       filter_id=group[0] + 1, event='filter_due')
+            for row_id in row_ids:
+                try:
+                    name = str(rows[row_id][name_col_idx]).strip()
+                    filter_idxs, label, message = render_delivery(row_id, group)
+                    if debug_enabled:
+                        logger(f"   📤 Queueing Filter #{label} message to {name}...", 'debug', row_id + 1, filter_idxs[0] + 1, 'queued')
+                    pool.submit({
+                        'key': f"{row_id + 1}:{label}",
+                        'row': row_id + 1,
+                        'group': group_idx,
+                        'attempt': attempts.get((row_id, group_idx), 1),
+                        'filter_id': filter_idxs[0] + 1,
+                        'label': label,
+                        'name': name,
+                        'phone': recipients[row_id],
+                        'message': message,
+                        'template_hash': delivery_hash(row_id, filter_idxs)
+                    })
+                except Exception as e:
+                    logger(f"❌ Error processing row {row_id + 1}: {str(e)}", 'error', row_id + 1, event='row_error')
+                    with counter_lock:
+                        error_count += 1
+                    settle()
+    finally:
+        scheduler.cancel(schedule_key)
+    
+    send_stats = pool.join()
+    JOB_STAGE_SECONDS.labels('send').observe(send_stats['elapsed'])
+    backend.close()
+    
+    if park_until is not None:
+        if sent_count or error_count:
+            logger(f"📊 Sent {sent_count} message(s) so far ({error_count} error(s))")
+        logger(f"🅿️ Waiting for the next batch at {datetime.fromtimestamp(park_until).strftime('%Y-%m-%d %H:%M')}; "
+               f"the job will resume then", event='job_parked')
+        tracker.park(park_until)
     
     # Summary
     logger("\n" + "=" * 60)
@@ -188,8 +797,30 @@ def run_send_job(params, logger):
     logger(f"✅ Messages sent: {sent_count}")
     logger(f"⏭️ Skipped: {skip_count}")
     logger(f"❌ Errors: {error_count}")
+    if retry_count or dead_count:
+        logger(f"🔁 Retries: {retry_count} ({dead_count} message(s) gave up after {max_attempts} attempts, see dead letters)")
+    logger(f"⚡ Throughput: {send_stats['throughput'] * 60:.1f} messages/min "
+           f"({send_stats['completed']} attempts in {send_stats['elapsed']:.1f}s, "
+           f"{send_stats['concurrency']} worker(s))")
     logger("\n🎯 FILTER BREAKDOWN:")
     for summary in filter_summary:
-        filter_desc = ", ".join([f"{k}={v}" for k, v in summary['filters'].items()])
+        filter_desc = compiled_filters[summary['filter_id'] - 1].describe()
         logger(f"   Filter #{summary['filter_id']} ({filter_desc}): {summary['sent']} sent, {summary['skipped']} skipped")
     logger("=" * 60)
+    
+    return {
+        "sent": sent_count,
+        "skipped": skip_count,
+        "errors": error_count,
+        "throughput_per_minute": round(send_stats['throughput'] * 60, 1),
+        "send_seconds": round(send_stats['elapsed'], 2),
+        "concurrency": send_stats['concurrency'],
+        "phones": validation,
+        "campaign": campaign,
+        "already_delivered": ledger_skips,
+        "already_sent": resumed_count,
+        "coalesced": coalesced_count,
+        "retries": retry_count,
+        "dead_letters": dead_count,
+        "filters": filter_summary
+    }
@@ -0,0 +1,154 @@
+import time
+import queue
+import random
+import threading
+import weakref
+from metrics import SEND_SECONDS, QUEUE_DEPTH
+
+
+# Pools with workers running, for the queue depth gauge
+_running_pools = weakref.WeakSet()
+QUEUE_DEPTH.set_function(lambda: sum(pool.queue_depth() for pool in list(_running_pools)))
+
+
+def backoff_delay(attempt, base=5.0, cap=300.0, rng=random.random):
+    """Seconds to wait before retry number ``attempt`` (1-based): exponential
+    growth capped at ``cap``, with jitter so failed sends don't retry in lockstep.
+    """
+    delay = min(cap, base * (2 ** (attempt - 1)))
+    return delay * (0.5 + rng() / 2)
+
+
+class TokenBucket:
+    """Global messages-per-second limiter.
+
+    ``rate`` tokens are added per second up to ``burst``; each send takes one.
+    A rate of 0 (or less) disables limiting. The clock is injectable so the
+    same limiter can run against simulated time.
+    """
+
+    def __init__(self, rate, burst=None, clock=time.monotonic):
+        self.rate = float(rate or 0)
+        self.burst = float(burst if burst is not None else max(1.0, self.rate))
+        self.clock = clock
+        self._tokens = self.burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token and return how many seconds to wait before using it"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+
+class PhoneCooldown:
+    """Minimum gap between two sends to the same phone number"""
+
+    def __init__(self, cooldown, clock=time.monotonic):
+        self.cooldown = float(cooldown or 0)
+        self.clock = clock
+        self._next_allowed = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, phone):
+        """Book the next slot for a phone; return seconds to wait for it"""
+        if self.cooldown <= 0:
+            return 0.0
+        with self._lock:
+            now = self.clock()
+            slot = max(now, self._next_allowed.get(phone, now))
+            self._next_allowed[phone] = slot + self.cooldown
+            return slot - now
+
+
+class SendWorkerPool:
+    """Runs backend sends on N worker threads fed from a bounded queue.
+
+    Every delivery passes the global TokenBucket and the per-phone cooldown
+    before it is sent. ``on_result(delivery, error)`` is called from the
+    worker thread after each attempt (``error`` is None on success).
+    ``clock`` and ``sleep`` can be swapped for simulated time in tests.
+    """
+
+    def __init__(self, backend, on_result, concurrency=1, rate_per_second=0,
+                 phone_cooldown=0, queue_size=None, clock=time.monotonic, sleep=time.sleep):
+        self.backend = backend
+        self.on_result = on_result
+        self.concurrency = max(1, min(int(concurrency or 1), backend.max_concurrency))
+        self.clock = clock
+        self.sleep = sleep
+        self.limiter = TokenBucket(rate_per_second, clock=clock)
+        self.cooldown = PhoneCooldown(phone_cooldown, clock=clock)
+        self._queue = queue.Queue(maxsize=queue_size or self.concurrency * 100)
+        self._workers = []
+        self._started = None
+        self._last_send = None
+        self.completed = 0
+        self._lock = threading.Lock()
+        self._latency = SEND_SECONDS.labels(backend.name)
+
+    @property
+    def started(self):
+        return self._started is not None
+
+    def start(self):
+        self._started = self.clock()
+        for worker_idx in range(self.concurrency):
+            worker = threading.Thread(target=self._work, name=f"send-worker-{worker_idx + 1}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        _running_pools.add(self)
+        return self
+
+    def submit(self, delivery):
+        """Queue a delivery dict with at least 'phone' and 'message' (blocks when full)"""
+        self._queue.put(delivery)
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def join(self):
+        """Wait for every queued delivery, stop the workers, return stats"""
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        _running_pools.discard(self)
+        elapsed = (self._last_send - self._started) if self._last_send is not None else 0.0
+        return {
+            "completed": self.completed,
+            "elapsed": elapsed,
+            "throughput": self.completed / elapsed if elapsed > 0 else float(self.completed),
+            "concurrency": self.concurrency
+        }
+
+    def _work(self):
+        while True:
+            delivery = self._queue.get()
+            if delivery is None:
+                return
+
+            delay = max(self.limiter.reserve(), self.cooldown.reserve(delivery['phone']))
+            if delay > 0:
+                self.sleep(delay)
+
+            error = None
+            started = time.perf_counter()
+            try:
+                self.backend.send(delivery['phone'], delivery['message'])
+            except Exception as e:
+                error = e
+            self._latency.observe(time.perf_counter() - started)
+
+            with self._lock:
+                self.completed += 1
+                self._last_send = self.clock()
+            self.on_result(delivery, error)
@@ -0,0 +1,177 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+
+class SharedStore:
+    """Key/value store that every app and worker process can see.
+
+    Values are bytes; ``ttl`` is in seconds (None keeps the key until it is
+    deleted). Backends only implement ``get``, ``set``, ``add`` and
+    ``delete``, so a Redis server (or anything speaking its protocol) can
+    replace the default SQLite file without touching the callers.
+    """
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        raise NotImplementedError
+
+    def add(self, key, value, ttl=None):
+        """Set a key only if it doesn't exist yet; True if this call set it.
+        Atomic across processes, so it can arbitrate between writers."""
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def get_json(self, key):
+        value = self.get(key)
+        return json.loads(value) if value is not None else None
+
+    def set_json(self, key, value, ttl=None):
+        self.set(key, json.dumps(value, ensure_ascii=False).encode('utf-8'), ttl)
+
+    def add_json(self, key, value, ttl=None):
+        return self.add(key, json.dumps(value, ensure_ascii=False).encode('utf-8'), ttl)
+
+
+class SQLiteStore(SharedStore):
+    """Default backend: one SQLite file (WAL mode) shared by all processes on a host"""
+
+    # Expired keys are cleared on read, and in bulk every this many writes
+    PURGE_EVERY = 200
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._writes = 0
+        self._conn().execute(
+            'CREATE TABLE IF NOT EXISTS shared_state ('
+            'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL)'
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute(
+            'SELECT value, expires_at FROM shared_state WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at is not None and expires_at <= time.time():
+            self.delete(key)
+            return None
+        return bytes(value)
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        conn = self._conn()
+        conn.execute('INSERT OR REPLACE INTO shared_state (key, value, expires_at) VALUES (?, ?, ?)',
+                     (key, sqlite3.Binary(value), expires_at))
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            conn.execute('DELETE FROM shared_state WHERE expires_at <= ?', (time.time(),))
+
+    def add(self, key, value, ttl=None):
+        now = time.time()
+        conn = self._conn()
+        # An expired key counts as absent; both statements run in one write transaction
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM shared_state WHERE key = ? AND expires_at <= ?', (key, now))
+            cursor = conn.execute('INSERT OR IGNORE INTO shared_state (key, value, expires_at) VALUES (?, ?, ?)',
+                                  (key, sqlite3.Binary(value), now + ttl if ttl else None))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return cursor.rowcount == 1
+
+    def delete(self, key):
+        self._conn().execute('DELETE FROM shared_state WHERE key = ?', (key,))
+
+
+class RedisStore(SharedStore):
+    """Redis (or a Redis-compatible server) via the optional ``redis`` package"""
+
+    def __init__(self, url, prefix='wa:'):
+        try:
+            import redis
+        except ImportError:
+            raise Exception("SHARED_STATE_URL points at Redis but the 'redis' package is not installed (pip install redis)")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, value, ex=max(1, int(ttl + 0.5)) if ttl else None)
+
+    def add(self, key, value, ttl=None):
+        return bool(self.client.set(self.prefix + key, value, ex=max(1, int(ttl + 0.5)) if ttl else None, nx=True))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+
+class MemoryStore(SharedStore):
+    """In-process stand-in for single-process runs and scripts; not shared between workers"""
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._values[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._values[key] = (value, time.time() + ttl if ttl else None)
+
+    def add(self, key, value, ttl=None):
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > time.time()):
+                return False
+            self._values[key] = (value, time.time() + ttl if ttl else None)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._values.pop(key, None)
+
+
+def open_store(url):
+    """Build a store from a URL: ``sqlite:///data/shared.db``, ``redis://host:6379/0``
+    (also ``rediss://``) or ``memory://``"""
+    if url.startswith('sqlite:///'):
+        return SQLiteStore(url[len('sqlite:///'):])
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisStore(url)
+    if url.startswith('memory://'):
+        return MemoryStore()
+    raise Exception(f"Unsupported SHARED_STATE_URL: {url}")
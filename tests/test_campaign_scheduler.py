@@ -0,0 +1,95 @@
+import queue
+from datetime import datetime
+import pytest
+from campaign_scheduler import CampaignScheduler, parse_send_datetime
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def scheduler(clock):
+    return CampaignScheduler(clock=clock)
+
+
+def advance(scheduler, clock, now):
+    """Move simulated time and wake the dispatcher to look at the heap again"""
+    with scheduler._cond:
+        clock.now = now
+        scheduler._cond.notify()
+
+
+def collect(scheduler, campaign):
+    dispatched = queue.Queue()
+    scheduler.register(campaign, lambda filter_idx, row_ids: dispatched.put((campaign, filter_idx, list(row_ids))))
+    return dispatched
+
+
+def take(dispatched, count):
+    return [dispatched.get(timeout=5) for _ in range(count)]
+
+
+def test_batches_are_dispatched_in_due_time_order(scheduler, clock):
+    dispatched = collect(scheduler, 'a')
+    scheduler.schedule('a', 30, 0, [1, 2])
+    scheduler.schedule('a', 10, 1, [3])
+    scheduler.schedule('a', 20, 2, range(4, 7))
+    scheduler.schedule('a', 10, 3, [7])
+    assert scheduler.next_due() == 10
+    assert scheduler.pending() == 7
+
+    advance(scheduler, clock, 25)
+    # Equal due times keep the order they were scheduled in
+    assert take(dispatched, 3) == [('a', 1, [3]), ('a', 3, [7]), ('a', 2, [4, 5, 6])]
+    assert scheduler.next_due() == 30
+    assert dispatched.empty()
+
+    advance(scheduler, clock, 30)
+    assert take(dispatched, 1) == [('a', 0, [1, 2])]
+    assert scheduler.next_due() is None
+
+
+def test_now_and_past_batches_go_out_immediately(scheduler, clock):
+    clock.now = 100
+    dispatched = collect(scheduler, 'a')
+    scheduler.schedule('a', None, 0, [1])
+    scheduler.schedule('a', 50, 1, [2])
+    scheduler.schedule('a', 150, 2, [3])
+    assert sorted(take(dispatched, 2)) == [('a', 0, [1]), ('a', 1, [2])]
+    assert scheduler.pending() == 1
+
+
+def test_campaigns_share_the_heap_and_cancelled_ones_are_dropped(scheduler, clock):
+    first, second = collect(scheduler, 'first'), collect(scheduler, 'second')
+    scheduler.schedule('first', 20, 0, [1])
+    scheduler.schedule('second', 10, 0, [2])
+    scheduler.schedule('first', 15, 1, [3, 4])
+    scheduler.schedule('second', 5, 1, [])
+    assert (scheduler.pending('first'), scheduler.pending('second')) == (3, 1)
+
+    scheduler.cancel('first')
+    advance(scheduler, clock, 20)
+    assert take(second, 1) == [('second', 0, [2])]
+    # Wait for the later (dropped) entries to leave the heap too
+    scheduler.schedule('second', 20, 2, [5])
+    assert take(second, 1) == [('second', 2, [5])]
+    assert first.empty()
+    assert scheduler.pending() == 0
+
+
+def test_parse_send_datetime():
+    assert parse_send_datetime('') is None
+    assert parse_send_datetime(None) is None
+    assert parse_send_datetime('2026-12-01T18:30') == datetime(2026, 12, 1, 18, 30).timestamp()
+    with pytest.raises(Exception, match="Invalid send date/time: tomorrow"):
+        parse_send_datetime('tomorrow')
@@ -0,0 +1,140 @@
+import json
+import pytest
+from contact_dataset import BLOCK_SIZE, ContactDataset, DictColumn, RowView, TextColumn
+
+
+HEADERS = ['Name', 'Phone', 'Mehendi', 'City', 'Age']
+CITIES = ['Pune', 'Goa', 'Delhi']
+
+
+def make_rows(count):
+    """Unique names/phones, repetitive categories, and every 7th row cut short"""
+    rows = []
+    for n in range(count):
+        row = [f'Guest {n}', f'+9198765{n:05d}', 'Yes' if n % 3 else 'No', CITIES[n % 3], n % 90]
+        rows.append(row[:2] if n % 7 == 3 else row)
+    return rows
+
+
+def as_strings(rows):
+    return [[str(value) for value in row] for row in rows]
+
+
+@pytest.fixture(scope='module')
+def rows():
+    # Two full text blocks plus a tail
+    return make_rows(2 * BLOCK_SIZE + 100)
+
+
+def test_columns_are_encoded_by_cardinality(rows):
+    dataset = ContactDataset(HEADERS, rows)
+    assert [type(column) for column in dataset.columns] == [TextColumn, TextColumn, DictColumn, DictColumn, DictColumn]
+    assert len(dataset.columns[0].blocks) == 2 and len(dataset.columns[0].tail) == 100
+    assert dataset.columns[2].codes.typecode == 'B'
+    assert dataset.to_rows() == as_strings(rows)
+    assert dataset.to_rows(BLOCK_SIZE - 2, BLOCK_SIZE + 2) == as_strings(rows[BLOCK_SIZE - 2:BLOCK_SIZE + 2])
+    assert dataset.column_values(3)[:4] == ['Pune', 'Goa', 'Delhi', '']
+    assert dataset.distinct_values(3) == ['Pune', 'Goa', 'Delhi', '']
+    assert dataset.distinct_values(9) == ['']
+
+
+def test_dict_codes_widen_past_256_values():
+    dataset = ContactDataset(['Table'], [[f'T{n % 300}'] for n in range(1200)])
+    column = dataset.columns[0]
+    assert isinstance(column, DictColumn) and column.codes.typecode == 'H'
+    assert dataset.distinct_values(0) == [f'T{n}' for n in range(300)]
+    assert ContactDataset.from_state(dataset.to_state()).to_rows() == dataset.to_rows()
+
+
+def test_row_view_reads_like_a_list(rows):
+    dataset = ContactDataset(HEADERS, rows)
+    full, short = dataset[1], dataset[3]
+    assert isinstance(full, RowView)
+    assert len(full) == 5 and len(short) == 2
+    assert full[0] == 'Guest 1' and full[-1] == '1' and short[-1] == '+919876500003'
+    assert full[1:3] == ['+919876500001', 'Yes']
+    assert list(short) == ['Guest 3', '+919876500003']
+    assert short == ['Guest 3', '+919876500003'] and short == dataset[3]
+    assert repr(short) == "RowView(['Guest 3', '+919876500003'])"
+    with pytest.raises(IndexError):
+        short[2]
+    with pytest.raises(IndexError):
+        dataset[len(rows)]
+    assert dataset[-1] == as_strings(rows)[-1]
+
+
+def test_set_cell(rows):
+    dataset = ContactDataset(HEADERS, rows)
+    expected = as_strings(rows)
+    tail_row = len(rows) - 1
+    for row_id, col_idx, value in [
+        (5, 0, 'Renamed'),               # inside the first text block
+        (BLOCK_SIZE, 1, '+14155550100'),  # first row of the second block
+        (tail_row, 0, 'Last'),           # the text column's tail
+        (6, 2, 'Maybe'),                 # a new dictionary value
+        (7, 4, None),
+    ]:
+        dataset.set_cell(row_id, col_idx, value)
+        expected[row_id][col_idx] = '' if value is None else value
+    # Past the end of a short row: the gap reads as ''
+    dataset.set_cell(3, 3, 'Goa')
+    expected[3] += ['', 'Goa']
+    # Past the widest row: the dataset widens
+    dataset.set_cell(0, 6, 'note')
+    expected[0] += ['', 'note']
+    assert dataset.width == 7
+    assert dataset.to_rows() == expected
+    assert len(dataset[3]) == 4 and len(dataset[1]) == 5
+    with pytest.raises(IndexError):
+        dataset.set_cell(len(rows), 0, 'x')
+
+
+@pytest.mark.parametrize('row_ids', [
+    [0],
+    [BLOCK_SIZE - 1, BLOCK_SIZE],
+    [3, BLOCK_SIZE + 3, 2 * BLOCK_SIZE + 3],
+    list(range(BLOCK_SIZE - 50, BLOCK_SIZE + 150)),
+    list(range(2 * BLOCK_SIZE, 2 * BLOCK_SIZE + 100)),
+])
+def test_delete_rows(rows, row_ids):
+    dataset = ContactDataset(HEADERS, rows)
+    dataset.delete_rows(row_ids + row_ids[:1])
+    doomed = set(row_ids)
+    expected = [row for row_id, row in enumerate(as_strings(rows)) if row_id not in doomed]
+    assert len(dataset) == len(expected)
+    assert dataset.to_rows() == expected
+    # Text blocks are repacked to full size; the remainder stays in the tail
+    names = dataset.columns[0]
+    assert len(names.blocks) == len(expected) // BLOCK_SIZE
+    assert len(names.tail) == len(expected) % BLOCK_SIZE
+    assert [dataset[row_id] for row_id in range(0, len(expected), 997)] == expected[::997]
+    with pytest.raises(IndexError):
+        dataset.delete_rows([len(expected)])
+
+
+def test_state_round_trip(rows):
+    dataset = ContactDataset(HEADERS, rows)
+    dataset.set_cell(len(rows) - 1, 0, 'Last')
+    dataset.delete_rows([1, BLOCK_SIZE])
+    state = json.loads(json.dumps(dataset.to_state()))
+    restored = ContactDataset.from_state(state)
+
+    assert restored.headers == HEADERS
+    assert restored.to_rows() == dataset.to_rows()
+    assert list(restored.lengths) == list(dataset.lengths)
+    assert [type(column) for column in restored.columns] == [type(column) for column in dataset.columns]
+    assert restored.columns[0].tail == dataset.columns[0].tail
+
+    # The restored dataset doesn't share storage with the original
+    restored.set_cell(0, 0, 'Changed')
+    restored.set_cell(len(restored) - 1, 0, 'Changed')
+    restored.set_cell(0, 2, 'Changed')
+    restored.delete_rows([2])
+    assert dataset.to_rows() == ContactDataset.from_state(state).to_rows()
+
+
+def test_rectangular_state_has_no_lengths():
+    dataset = ContactDataset(['Name', 'Phone'], [['Asha', '+919876500001'], ['Bina', 919876500002]])
+    state = dataset.to_state()
+    assert state['lengths'] is None
+    assert ContactDataset.from_state(state).to_rows() == [['Asha', '+919876500001'], ['Bina', '919876500002']]
@@ -0,0 +1,160 @@
+import sys
+import random
+import threading
+import pytest
+from category_index import CategoryIndex
+from contact_dataset import ContactDataset
+from dataset_store import DatasetStore, VersionConflict, dataset_index, dataset_facets, dataset_lock, snapshot_rows
+from facet_counts import FacetCounts
+
+
+HEADERS = ['Name', 'Phone', 'Side', 'Mehendi', 'City']
+CATEGORIES = ['Side', 'Mehendi', 'City']
+
+
+def summary_of(rows, categories=CATEGORIES):
+    summary = {}
+    for category in categories:
+        values = (str(value).strip() for value in rows.distinct_values(HEADERS.index(category)))
+        summary[category] = [value for value in dict.fromkeys(values) if value]
+    return summary
+
+
+def stored(rows):
+    """A DatasetStore holding ``rows`` with its index, facets and summary built"""
+    store = DatasetStore()
+    dataset = ContactDataset(HEADERS, rows)
+    dataset_id = store.put(HEADERS, dataset, CATEGORIES, summary=summary_of(dataset))
+    dataset = store.get(dataset_id)
+    dataset_facets(dataset)
+    # A posting list outside the category columns is kept current too
+    dataset_index(dataset).postings(0)
+    return store, dataset_id, dataset
+
+
+def assert_matches_rebuild(dataset):
+    rows = dataset['rows']
+    fresh_rows = ContactDataset(HEADERS, rows.to_rows())
+    fresh_index = CategoryIndex(HEADERS, fresh_rows)
+    category_cols = [HEADERS.index(category) for category in CATEGORIES]
+    fresh_facets = FacetCounts(fresh_index, category_cols)
+
+    index = dataset['index']
+    assert index.row_count == len(fresh_rows)
+    for col_idx in [0] + category_cols:
+        assert index.postings(col_idx) == fresh_index.postings(col_idx)
+    facets = dataset['facets']
+    assert facets.row_count == len(fresh_rows)
+    assert facets.values == fresh_facets.values
+    assert facets.pairs == fresh_facets.pairs
+    fresh_summary = summary_of(fresh_rows)
+    assert {category: set(values) for category, values in dataset['summary'].items()} == \
+        {category: set(values) for category, values in fresh_summary.items()}
+
+
+def test_patch_matches_full_rebuild():
+    store, dataset_id, dataset = stored([
+        ['Asha', '+919876500001', 'Bride', 'Yes', 'Pune'],
+        ['Bina', '+919876500002', 'Groom', 'No', 'Goa'],
+        ['Chirag', '+919876500003', 'Bride', 'No', 'Pune'],
+        ['Dev', '+919876500004', 'Groom', 'Yes', 'Delhi'],
+    ])
+    store.patch(dataset_id, 0, {
+        "updates": [[0, 3, 'No'], [1, 4, 'Mumbai'], [3, 2, 'bride']],
+        "deletes": [2],
+        "inserts": [['Esha', '+919876500005', 'Groom', 'Yes', 'Goa'], ['Farid', '+919876500006', 'Bride']],
+    })
+    assert dataset['version'] == 1
+    assert dataset['rows'].to_rows()[2] == ['Dev', '+919876500004', 'bride', 'Yes', 'Delhi']
+    assert 'Delhi' in dataset['summary']['City'] and 'Goa' in dataset['summary']['City']
+    assert_matches_rebuild(dataset)
+
+
+def test_update_past_the_end_of_a_short_row():
+    store, dataset_id, dataset = stored([
+        ['x', '+919876500001'],
+        ['y', '+919876500002', 'Bride', 'Yes', 'Pune'],
+    ])
+    store.patch(dataset_id, 0, {"updates": [[0, 4, 'Goa']]})
+    assert dataset['rows'].to_rows()[0] == ['x', '+919876500001', '', '', 'Goa']
+    assert dataset['facets'].value_counts(2) == {'': 1, 'BRIDE': 1}
+    assert_matches_rebuild(dataset)
+
+
+def test_random_patches_match_full_rebuild():
+    rng = random.Random(7)
+    values = ['Bride', 'Groom', 'Yes', 'No', 'Pune', 'Goa', '']
+
+    def random_row(name):
+        return [name, f'+9198765{rng.randrange(100000):05d}'] + \
+            [rng.choice(values) for _ in range(rng.randrange(4))]
+
+    rows = [random_row(f'N{row_id}') for row_id in range(40)]
+    store, dataset_id, dataset = stored(rows)
+    for step in range(30):
+        row_count = len(dataset['rows'])
+        patch = {
+            "updates": [[rng.randrange(row_count), rng.randrange(len(HEADERS)), rng.choice(values)]
+                        for _ in range(rng.randrange(4))],
+            "deletes": rng.sample(range(row_count), rng.randrange(3)),
+            "inserts": [random_row(f'I{step}.{n}') for n in range(rng.randrange(3))],
+        }
+        store.patch(dataset_id, step, patch)
+        assert_matches_rebuild(dataset)
+
+
+def test_stale_patch_is_rejected():
+    store, dataset_id, dataset = stored([['Asha', '+919876500001', 'Bride', 'Yes', 'Pune']])
+    store.patch(dataset_id, 0, {"updates": [[0, 2, 'Groom']]})
+    with pytest.raises(VersionConflict):
+        store.patch(dataset_id, 0, {"updates": [[0, 2, 'Bride']]})
+    assert dataset['rows'].to_rows()[0][2] == 'Groom'
+
+
+def test_snapshot_is_not_changed_by_later_patches():
+    store, dataset_id, dataset = stored([
+        ['Asha', '+919876500001', 'Bride', 'Yes', 'Pune'],
+        ['Bina', '+919876500002', 'Groom', 'No', 'Goa'],
+    ])
+    version, rows = snapshot_rows(dataset)
+    index = dataset_index(dataset).copy(rows)
+    store.patch(dataset_id, 0, {"updates": [[0, 2, 'Groom']], "deletes": [1], "inserts": [['Chirag', '+919876500003']]})
+    assert version == 0
+    assert rows.to_rows() == [['Asha', '+919876500001', 'Bride', 'Yes', 'Pune'],
+                              ['Bina', '+919876500002', 'Groom', 'No', 'Goa']]
+    assert index.match({'Side': 'Bride'}) == 0b01
+    assert dataset_index(dataset).match({'Side': 'Bride'}) == 0
+
+
+def test_readers_never_see_a_patch_half_applied():
+    # Switch threads often so readers land inside a patch if they can
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    store, dataset_id, dataset = stored([[f'N{n}', f'+9198765{n:05d}', 'Bride', 'Yes', 'Pune'] for n in range(2000)])
+    problems = []
+    done = threading.Event()
+
+    def read():
+        while not done.is_set():
+            with dataset_lock(dataset).reading():
+                rows = dataset['rows']
+                counts = (len(rows), dataset['index'].row_count, dataset['facets'].row_count,
+                          sum(dataset['facets'].value_counts(2).values()))
+                if len(set(counts)) != 1:
+                    problems.append(counts)
+
+    readers = [threading.Thread(target=read) for _ in range(3)]
+    for reader in readers:
+        reader.start()
+    try:
+        for version in range(50):
+            store.patch(dataset_id, version, {"updates": [[n, 3, 'No'] for n in range(0, 1000, 7)],
+                                              "deletes": list(range(0, 40, 2)),
+                                              "inserts": [[f'I{version}', '+919876599999', 'Groom']]})
+    finally:
+        done.set()
+        sys.setswitchinterval(switch_interval)
+    for reader in readers:
+        reader.join()
+    assert problems == []
+    assert len(dataset['rows']) == 2000 - 50 * 19
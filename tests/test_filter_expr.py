@@ -0,0 +1,78 @@
+import pytest
+from category_index import CategoryIndex, row_ids_from_bits
+from filter_expr import FilterError, compile_filter, _Parser
+
+
+HEADERS = ['Name', 'Phone', 'Mehendi', 'Sangeet', 'City', 'Age', 'Notes']
+ROWS = [
+    ['Asha', '+919876500001', 'Yes', 'No', 'Pune', '34', 'veg'],
+    ['Bina', '+919876500002', 'No', 'Yes', 'Goa', '17', ''],
+    ['Chirag', '+919876500003', 'Yes', 'Yes', 'Delhi', '52', 'AND more'],
+    ['Dev', '+919876500004', 'no', 'no', 'pune', 'n/a'],
+]
+
+
+def matches(expression):
+    index = CategoryIndex(HEADERS, ROWS)
+    return row_ids_from_bits(compile_filter(expression, HEADERS).match(index))
+
+
+def test_and_binds_tighter_than_or():
+    assert _Parser('A = 1 OR B = 2 AND C = 3').parse() == \
+        ('or', [('cmp', 'A', '=', '1'), ('and', [('cmp', 'B', '=', '2'), ('cmp', 'C', '=', '3')])])
+    assert matches('Mehendi = No OR Sangeet = Yes AND City = Delhi') == [1, 2, 3]
+
+
+def test_parentheses_override_precedence():
+    assert _Parser('(A = 1 OR B = 2) AND C = 3').parse() == \
+        ('and', [('or', [('cmp', 'A', '=', '1'), ('cmp', 'B', '=', '2')]), ('cmp', 'C', '=', '3')])
+    assert matches('(Mehendi = No OR Sangeet = Yes) AND City = Delhi') == [2]
+
+
+def test_not_applies_to_the_next_factor_only():
+    assert _Parser('NOT A = 1 AND B = 2').parse() == \
+        ('and', [('not', ('cmp', 'A', '=', '1')), ('cmp', 'B', '=', '2')])
+    assert matches('NOT Mehendi = Yes AND City = Pune') == [3]
+    assert matches('NOT (Mehendi = Yes AND City = Pune)') == [1, 2, 3]
+
+
+def test_comparisons():
+    assert matches('city in (PUNE, goa)') == [0, 1, 3]
+    assert matches('City NOT IN (Pune, Goa)') == [2]
+    assert matches('Mehendi != yes') == [1, 3]
+    assert matches('Age >= 18') == [0, 2]
+    assert matches('Age BETWEEN 17 AND 34') == [0, 1]
+    assert matches('Age NOT BETWEEN 17 AND 34') == [2, 3]
+
+
+def test_quoted_values_may_contain_keywords():
+    assert matches("Notes = 'AND more'") == [2]
+    # Dev's row stops before Notes: a missing cell isn't an empty one
+    assert matches('Notes = "veg" OR Notes = \'\'') == [0, 1]
+
+
+def test_dict_filters_still_match_every_pair():
+    assert matches({'Mehendi': 'yes', 'City': 'pune'}) == [0]
+
+
+@pytest.mark.parametrize('expression, message', [
+    ('', "Empty filter expression"),
+    ('Mehendi =', "Expected a value at end of expression"),
+    ('Foo = Yes', "Unknown column: Foo"),
+    ('(Mehendi = Yes', "Expected ')' at end of expression"),
+    ('Mehendi Yes', "Expected a comparison after 'Mehendi Yes'"),
+    ('City IN Pune', "Expected '(' but found 'Pune'"),
+    ('Age BETWEEN 1', "Expected 'AND' at end of expression"),
+    ('Mehendi = Yes)', "Unexpected ')'"),
+    ('Mehendi NOT = Yes', "Expected IN or BETWEEN after 'Mehendi NOT'"),
+    ('Mehendi = Yes ! x', "Unexpected character at position 15: '!'"),
+])
+def test_error_messages(expression, message):
+    with pytest.raises(FilterError) as error:
+        compile_filter(expression, HEADERS)
+    assert str(error.value) == message
+
+
+def test_rejects_other_payloads():
+    with pytest.raises(FilterError, match="expression string"):
+        compile_filter(['Mehendi'], HEADERS)
@@ -0,0 +1,113 @@
+import os
+import time
+from datetime import datetime
+import pytest
+from campaign_scheduler import CampaignScheduler
+from job_queue import JobQueue, JobContext, JobParked
+from send_from_csv import SendBackend
+from worker import make_run_job
+
+
+HEADERS = ['Name', 'Phone', 'Side']
+ROWS = [[f'Guest {n}', f'+9198765{n:05d}', 'Bride'] for n in range(8)]
+FILTERS = [{"filters": {"Side": "Bride"}, "template": "Hi {Name}", "send_datetime": None}]
+
+
+class RecordingBackend(SendBackend):
+    """Sends nothing; before each send, records what the queue shows for the job"""
+
+    name = 'recording'
+
+    def __init__(self, job_queue, job_id):
+        self.job_queue = job_queue
+        self.job_id = job_id
+        self.seen = []
+
+    def send(self, phone, message):
+        job = self.job_queue.get_job(self.job_id, include_logs=False)
+        self.seen.append((job['counters'].get('sent', 0), len(self.job_queue.sent_keys(self.job_id))))
+
+
+class PhoneBackend(SendBackend):
+    """Sends nothing; remembers which phones were sent to"""
+
+    name = 'phones'
+
+    def __init__(self):
+        self.phones = []
+
+    def send(self, phone, message):
+        self.phones.append(phone)
+
+
+class FakeTime:
+    """Stands in for time.time so a parked job's due time can be reached at once"""
+
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def job_queue(tmp_path):
+    return JobQueue(os.path.join(str(tmp_path), 'jobs.db'))
+
+
+def run(job_queue, job_id, params):
+    context = JobContext(job_queue, job_id)
+    summary = make_run_job(job_queue)(job_id, params, context)
+    context.flush()
+    return summary
+
+
+def test_progress_and_resume_state_are_written_during_the_send(job_queue, monkeypatch):
+    # Flush on every change so the test doesn't depend on timing
+    monkeypatch.setattr(JobContext, 'FLUSH_SECONDS', 0)
+    job_id = job_queue.create_job({})
+    backend = RecordingBackend(job_queue, job_id)
+    params = {"headers": HEADERS, "rows": ROWS, "filter_messages": FILTERS, "send_backend": backend}
+
+    summary = run(job_queue, job_id, params)
+
+    assert summary['sent'] == len(ROWS)
+    # With one worker, every earlier send is already visible when the next one starts
+    assert backend.seen == [(sent, sent) for sent in range(len(ROWS))]
+
+
+def test_parked_job_is_requeued_until_due_and_skips_sent_deliveries_on_rerun(job_queue, monkeypatch):
+    clock = FakeTime(time.time())
+    monkeypatch.setattr(time, 'time', clock)
+    later = datetime.fromtimestamp(clock.now + 3600).replace(second=0, microsecond=0)
+    rows = [[f'Guest {n}', f'+9198765{n:05d}', 'Bride' if n % 2 else 'Groom'] for n in range(8)]
+    filters = [
+        {"filters": {"Side": "Bride"}, "template": "Hi {Name}", "send_datetime": None},
+        {"filters": {"Side": "Groom"}, "template": "Hi {Name}", "send_datetime": later.strftime('%Y-%m-%dT%H:%M')},
+    ]
+    backend = PhoneBackend()
+    params = {"headers": HEADERS, "rows": rows, "filter_messages": filters,
+              "send_backend": backend, "scheduler": CampaignScheduler(clock=clock)}
+    job_id = job_queue.create_job({})
+    assert job_queue.claim_next('test')[0] == job_id
+
+    # The first run sends what is due now and parks until the Groom batch
+    with pytest.raises(JobParked) as parked:
+        run(job_queue, job_id, params)
+    assert parked.value.not_before == later.timestamp()
+    job_queue.park(job_id, parked.value.not_before)
+    brides = [row[1] for row in rows if row[2] == 'Bride']
+    assert backend.phones == brides
+    assert job_queue.get_job(job_id, include_logs=False)['status'] == 'queued'
+
+    clock.now = later.timestamp() - 1
+    assert job_queue.claim_next('test') is None
+    clock.now = later.timestamp()
+    assert job_queue.claim_next('test')[0] == job_id
+
+    # The rerun starts over but only sends the Groom batch
+    summary = run(job_queue, job_id, params)
+    assert backend.phones == brides + [row[1] for row in rows if row[2] == 'Groom']
+    assert summary['sent'] == 4
+    assert summary['already_sent'] == 4
+    assert len(job_queue.sent_keys(job_id)) == 8
@@ -0,0 +1,31 @@
+import pytest
+from message_template import TemplateError, compile_template
+
+
+HEADERS = ['Guest Name', 'Mobile', 'Mehendi']
+ROW = ['Asha ', '+919876500001', 'Yes']
+
+
+def render(source, row=ROW):
+    # Column 0 / 1 stand in for the detected name / phone columns
+    return compile_template(source, HEADERS, 0, 1).render(row)
+
+
+def test_placeholders_and_defaults():
+    assert render('Hi {name}, Mehendi: {mehendi}') == 'Hi Asha, Mehendi: Yes'
+    assert render('Hi {Guest Name|friend}', ['', '+919876500001']) == 'Hi friend'
+    assert render('{Mehendi|TBC}', ['Asha']) == 'TBC'
+
+
+@pytest.mark.parametrize('source', ['Dress code :)}', '{venue TBD', 'Reply with {} or { }', '}{'])
+def test_braces_without_a_placeholder_are_literal(source):
+    assert render(source) == source
+
+
+def test_doubled_braces_escape_a_placeholder():
+    assert render('Type {{name}} to see {name}') == 'Type {name} to see Asha'
+
+
+def test_unknown_placeholder_is_rejected():
+    with pytest.raises(TemplateError, match=r"Unknown placeholder \{Sangeet\}"):
+        compile_template('See you at {Sangeet}', HEADERS)
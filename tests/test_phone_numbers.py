@@ -0,0 +1,96 @@
+import pytest
+from contact_dataset import ContactDataset
+from phone_numbers import find_duplicates, normalize_phones, validate_contacts
+
+
+@pytest.mark.parametrize('raw, expected', [
+    ('+91 98765-43210', '+919876543210'),
+    ('(+91) 98765.43210', '+919876543210'),
+    ('0091 98765 43210', '+919876543210'),
+    ('+91 98765\n43210', '+919876543210'),
+    ('+1 415 555 0100', '+14155550100'),
+])
+def test_international_numbers_keep_their_own_country_code(raw, expected):
+    assert normalize_phones([raw], '+91') == ([expected], {})
+    assert normalize_phones([raw]) == ([expected], {})
+
+
+@pytest.mark.parametrize('raw', ['98765 43210', '098765 43210', '919876543210', 919876543210.0, 9876543210])
+def test_country_code_is_added_when_missing(raw):
+    assert normalize_phones([raw], '+91') == (['+919876543210'], {})
+    assert normalize_phones([raw], '91') == (['+919876543210'], {})
+
+
+@pytest.mark.parametrize('raw, reason', [
+    ('98765 43210', 'missing country code'),
+    ('', 'missing phone number'),
+    (None, 'missing phone number'),
+    ('+91 98765 ABCDE', 'contains letters or symbols'),
+    ('+91 98765 ४३२१०', 'contains letters or symbols'),
+    ('+123456', 'is too short'),
+    ('+1234567890123456', 'is too long (max 15 digits with country code)'),
+])
+def test_invalid_numbers(raw, reason):
+    assert normalize_phones(['+919876543210', raw]) == (['+919876543210', None], {1: reason})
+
+
+def test_invalid_default_country_code():
+    with pytest.raises(Exception, match="Invalid default country code: India"):
+        normalize_phones(['9876543210'], 'India')
+
+
+def test_find_duplicates_points_at_the_first_occurrence():
+    phones = ['+919876543210', None, '+919876543211', '+919876543210', None, '+919876543210']
+    assert find_duplicates(phones) == {3: 0, 5: 0}
+
+
+ROWS = [
+    ['Asha', '+91 98765 43210'],
+    ['Bina', '09876543210'],
+    ['Chirag', 9876543211],
+    ['Dev', '98765-43211'],
+    ['Esha', 'call me'],
+    ['Farid'],
+]
+
+
+@pytest.mark.parametrize('rows', [ROWS, ContactDataset(['Name', 'Phone'], ROWS)])
+def test_validate_contacts_dedupes_across_formats(rows):
+    recipients, rejected, report = validate_contacts(rows, 1, '+91')
+    assert recipients == ['+919876543210', None, '+919876543211', None, None, None]
+    assert rejected == {
+        1: 'is a duplicate of row 1',
+        3: 'is a duplicate of row 3',
+        4: 'contains letters or symbols',
+        5: 'missing phone number',
+    }
+    assert report == {
+        "total": 6,
+        "valid": 2,
+        "invalid": 2,
+        "duplicates": 2,
+        "normalized": 4,
+        "country_code": '+91',
+        "invalid_samples": [
+            {"row": 5, "phone": 'call me', "reason": 'contains letters or symbols'},
+            {"row": 6, "phone": '', "reason": 'missing phone number'},
+        ],
+        "duplicate_samples": [
+            {"row": 2, "phone": '+919876543210', "duplicate_of": 1},
+            {"row": 4, "phone": '+919876543211', "duplicate_of": 3},
+        ],
+    }
+
+
+def test_validate_contacts_without_dedupe_keeps_repeats():
+    recipients, rejected, report = validate_contacts(ROWS, 1, '+91', dedupe=False)
+    assert recipients == ['+919876543210', '+919876543210', '+919876543211', '+919876543211', None, None]
+    assert rejected == {4: 'contains letters or symbols', 5: 'missing phone number'}
+    assert (report['valid'], report['duplicates'], report['duplicate_samples']) == (4, 0, [])
+
+
+def test_validate_contacts_without_country_code():
+    recipients, rejected, report = validate_contacts(ROWS[:3], 1)
+    assert recipients == ['+919876543210', None, None]
+    assert rejected == {1: 'missing country code', 2: 'missing country code'}
+    assert report['country_code'] is None
@@ -0,0 +1,126 @@
+import threading
+from send_from_csv import SendBackend
+from send_pool import SendWorkerPool
+
+
+class FakeClock:
+    """Simulated time: sleeping just moves the clock forward"""
+
+    def __init__(self):
+        self.now = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        with self._lock:
+            self.now += seconds
+
+
+class ClockedBackend(SendBackend):
+    """Records (time, phone) for each send"""
+
+    name = 'clocked'
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.sends = []
+
+    def send(self, phone, message):
+        self.sends.append((self.clock(), phone))
+
+
+def send_all(phones, **options):
+    clock = FakeClock()
+    backend = ClockedBackend(clock)
+    pool = SendWorkerPool(backend, lambda delivery, error: None, clock=clock, sleep=clock.sleep, **options).start()
+    for phone in phones:
+        pool.submit({"phone": phone, "message": "Hi"})
+    return backend.sends, pool.join()
+
+
+def test_rate_limit_allows_a_burst_then_spaces_sends():
+    sends, stats = send_all([f'+91987650000{n}' for n in range(6)], rate_per_second=2)
+    assert [at for at, _ in sends] == [0.0, 0.0, 0.5, 1.0, 1.5, 2.0]
+    assert stats['completed'] == 6
+    assert stats['elapsed'] == 2.0
+    assert stats['throughput'] == 3.0
+
+
+def test_phone_cooldown_only_delays_repeat_numbers():
+    sends, _ = send_all(['A', 'A', 'B', 'A'], phone_cooldown=10)
+    assert sends == [(0.0, 'A'), (10.0, 'A'), (10.0, 'B'), (20.0, 'A')]
+
+
+def test_rate_limit_and_cooldown_take_the_longer_wait():
+    sends, _ = send_all(['A', 'B', 'A', 'C'], rate_per_second=1, phone_cooldown=3)
+    # The bucket refills while the second 'A' waits out its cooldown
+    assert sends == [(0.0, 'A'), (1.0, 'B'), (3.0, 'A'), (3.0, 'C')]
+
+
+def test_concurrency_is_capped_by_the_backend():
+    class PairBackend(SendBackend):
+        name = 'pair'
+        max_concurrency = 2
+
+    assert SendWorkerPool(PairBackend(), None, concurrency=8).concurrency == 2
+    assert SendWorkerPool(PairBackend(), None, concurrency=0).concurrency == 1
+
+
+def test_workers_send_in_parallel_up_to_the_limit():
+    class BarrierBackend(SendBackend):
+        """Each send waits until three are in flight together"""
+        name = 'barrier'
+        max_concurrency = 3
+
+        def __init__(self):
+            self.barrier = threading.Barrier(3, timeout=5)
+            self.lock = threading.Lock()
+            self.in_flight = 0
+            self.most_in_flight = 0
+
+        def send(self, phone, message):
+            with self.lock:
+                self.in_flight += 1
+                self.most_in_flight = max(self.most_in_flight, self.in_flight)
+            self.barrier.wait()
+            with self.lock:
+                self.in_flight -= 1
+
+    backend = BarrierBackend()
+    errors = []
+    pool = SendWorkerPool(backend, lambda delivery, error: errors.append(error), concurrency=3).start()
+    for n in range(6):
+        pool.submit({"phone": str(n), "message": "Hi"})
+    assert pool.join()['completed'] == 6
+    assert errors == [None] * 6
+    assert backend.most_in_flight == 3
+
+
+def test_join_drains_the_queue_before_stopping():
+    class FlakyBackend(SendBackend):
+        name = 'flaky'
+        max_concurrency = 4
+
+        def send(self, phone, message):
+            if int(phone) % 5 == 0:
+                raise Exception(f"Send to {phone} failed")
+
+    results = []
+    lock = threading.Lock()
+
+    def on_result(delivery, error):
+        with lock:
+            results.append((delivery['phone'], error is None))
+
+    # A small queue makes submit block while workers catch up
+    pool = SendWorkerPool(FlakyBackend(), on_result, concurrency=4, queue_size=2).start()
+    for n in range(50):
+        pool.submit({"phone": str(n), "message": "Hi"})
+    stats = pool.join()
+
+    assert stats['completed'] == 50
+    assert sorted(results) == sorted((str(n), n % 5 != 0) for n in range(50))
+    assert pool.queue_depth() == 0
+    assert not any(worker.is_alive() for worker in pool._workers)
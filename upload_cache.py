@@ -0,0 +1,114 @@
+import os
+import json
+import zlib
+import hashlib
+import threading
+
+
+# Bump when the cached entry layout or parsing rules change
+CACHE_VERSION = 1
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class HashingStream:
+    """Wraps the temporary file an upload is spooled into and hashes every
+    byte as it is written, so the content hash is ready once the request
+    body has arrived - no second pass over the file."""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._hash = hashlib.sha256()
+
+    def write(self, data):
+        self._hash.update(data)
+        return self._stream.write(data)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def __iter__(self):
+        return iter(self._stream)
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def content_hash(stream):
+    """SHA-256 of an upload stream; reads (and rewinds) it unless it was hashed while spooling"""
+    if isinstance(stream, HashingStream):
+        return stream.hexdigest()
+    digest = hashlib.sha256()
+    position = stream.tell()
+    for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    stream.seek(position)
+    return digest.hexdigest()
+
+
+class UploadCache:
+    """Parsed uploads on disk, keyed by content hash.
+
+    Each entry is a zlib-compressed JSON file. Hits refresh the file's
+    modification time; when the directory grows past ``max_bytes`` the
+    least recently used entries are deleted. Several processes can share
+    the directory: writes go through a temp file and ``os.replace``.
+    """
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, digest, file_ext):
+        return f"v{CACHE_VERSION}-{file_ext}-{digest}"
+
+    def _path(self, key):
+        safe_key = ''.join(ch for ch in key if ch.isalnum() or ch == '-')
+        return os.path.join(self.directory, f"{safe_key}.json.z")
+
+    def get(self, key):
+        """The cached entry for a key, or None"""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                entry = json.loads(zlib.decompress(f.read()).decode('utf-8'))
+            os.utime(path)
+            return entry
+        except (OSError, zlib.error, ValueError):
+            return None
+
+    def put(self, key, entry):
+        data = zlib.compress(json.dumps(entry, ensure_ascii=False, separators=(',', ':')).encode('utf-8'), 1)
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            total = 0
+            with os.scandir(self.directory) as it:
+                for item in it:
+                    if not item.name.endswith('.json.z'):
+                        continue
+                    try:
+                        stat = item.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, item.path))
+                    total += stat.st_size
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                total -= size
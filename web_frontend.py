@@ -1,13 +1,15 @@
 from flask import Flask, render_template, request, redirect, url_for
 import os
 import json
-import threading
 import subprocess
 import sys
 from datetime import datetime
 import uuid
 from flask import jsonify
-from send_from_csv import run_send_job
+from job_queue import JobQueue, JobRunner
+from job_log import DEFAULT_CAPACITY
+from worker import make_run_job
+from ingest import stream_csv
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(__file__), 'uploads')
@@ -16,21 +18,17 @@ os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 MESSAGES_DB = os.path.join(os.path.dirname(__file__), 'messages_db.json')
 
 
-job_store = {}
+job_queue = JobQueue(os.path.join(os.path.dirname(__file__), 'data', 'jobs.db'))
+LOG_PAGE_SIZE = 2000
 
 
-def launch_send_in_thread(job_id, csv_path, params):
-    def logger(line):
-        job_store[job_id]['logs'].append(line)
-    job_store[job_id]['status'] = 'running'
-    try:
-        params_local = params.copy()
-        params_local['csv'] = csv_path
-        run_send_job(params_local, logger)
-        job_store[job_id]['status'] = 'finished'
-    except Exception as e:
-        job_store[job_id]['logs'].append(f'Job error: {e}')
-        job_store[job_id]['status'] = 'failed'
+# Same job function as app.py: bounded, level-filtered job logs, and the
+# sender (pywhatkit) is only imported when the first job runs
+run_job = make_run_job(job_queue, log_capacity=DEFAULT_CAPACITY,
+                       spill_dir=os.path.join(os.path.dirname(__file__), 'data', 'logs'))
+
+
+job_runner = JobRunner(job_queue, run_job, max_workers=1)
 
 
 @app.route('/', methods=['GET', 'POST'])
@@ -85,9 +83,21 @@ def index():
             'default_send_time': entry.get('send_time'),
         }
 
+        # the job runs from the stored rows, so it survives restarts
+        headers, chunks = stream_csv(save_path)
+        rows = [row for chunk in chunks for row in chunk]
+        flag_col = params['flag_col'] - 1
+        filters = {headers[flag_col]: '1'} if flag_col < len(headers) else {}
+        params.update({
+            'csv': save_path,
+            'rows': rows,
+            'headers': headers,
+            'filter_messages': [{'filters': filters, 'template': message or '', 'send_datetime': entry['send_datetime']}],
+        })
+
         job_id = str(uuid.uuid4())
-        job_store[job_id] = {'logs': [f'Job {job_id} created.'], 'status': 'queued'}
-        threading.Thread(target=launch_send_in_thread, args=(job_id, save_path, params), daemon=True).start()
+        job_queue.create_job(params, info={'total_rows': len(rows)}, first_log=f'Job {job_id} created.', job_id=job_id)
+        job_runner.notify()
 
         return redirect(url_for('status_page', job_id=job_id))
 
@@ -102,17 +112,28 @@ def map_columns(filename):
 
 @app.route('/status/<job_id>')
 def status_page(job_id):
-    if job_id not in job_store:
+    if not job_queue.exists(job_id):
         return 'Job not found', 404
     return render_template('status.html', job_id=job_id)
 
 
 @app.route('/status/<job_id>/logs')
 def status_logs(job_id):
-    if job_id not in job_store:
+    # Same paging as app.py: log lines from ?since=<offset>, so the status
+    # page (which polls here, as there is no event stream) appends new ones
+    job = job_queue.get_job(job_id, include_logs=False)
+    if job is None:
         return jsonify({'error': 'not found'}), 404
-    return jsonify({'status': job_store[job_id]['status'], 'logs': job_store[job_id]['logs']})
+    since = max(0, request.args.get('since', 0, type=int), job_queue.first_log_offset(job_id))
+    lines = job_queue.get_logs(job_id, since, LOG_PAGE_SIZE)
+    job['logs'] = lines
+    job['offset'] = since
+    job['next_offset'] = since + len(lines)
+    job['has_more'] = len(lines) == LOG_PAGE_SIZE
+    return jsonify(job)
 
 
 if __name__ == '__main__':
+    if os.environ.get('RUN_WORKERS', '1') != '0' and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        job_runner.start()
     app.run(host='127.0.0.1', port=5000, debug=True)
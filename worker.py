@@ -0,0 +1,64 @@
+import os
+import time
+import argparse
+from job_queue import JobQueue, JobRunner
+from job_log import JobLog, DEFAULT_CAPACITY
+
+
+def make_run_job(ledger, dataset_store=None, log_capacity=DEFAULT_CAPACITY, spill_dir=None):
+    """Build the ``run_job(job_id, params, context)`` function a JobRunner calls.
+
+    The sender (and pywhatkit behind it) is only imported when the first job
+    runs, so the web process can start quickly on a headless host.
+    """
+    def run_job(job_id, params, context):
+        from send_from_csv import run_send_job
+
+        # Reuse the posting lists of the dataset's index while it's cached in
+        # this process, but only at the version the job snapshotted. Patches
+        # edit the cached index in place, so the job gets its own copy.
+        if dataset_store is not None:
+            from dataset_store import dataset_index, dataset_lock
+            from contact_dataset import as_dataset
+            dataset = dataset_store.get(params.get('dataset_id'))
+            if dataset is not None and 'dataset_version' in params:
+                with dataset_lock(dataset).reading():
+                    if dataset.get('version', 0) == params['dataset_version']:
+                        params['rows'] = as_dataset(params['headers'], params['rows'])
+                        params['index'] = dataset_index(dataset).copy(params['rows'])
+
+        job_log = JobLog(
+            capacity=params.get('log_capacity', log_capacity),
+            level=params.get('log_level', 'info'),
+            spill_path=os.path.join(spill_dir, f"{job_id}.jsonl") if spill_dir else None,
+            sink=lambda record: context.log(record['message'], record['ts'])
+        )
+        try:
+            return run_send_job(params, job_log, tracker=context, ledger=ledger)
+        finally:
+            job_log.close()
+
+    return run_job
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run queued send jobs without the web UI')
+    parser.add_argument('--db', default=os.path.join('data', 'jobs.db'), help='Job queue database shared with app.py')
+    parser.add_argument('--workers', type=int, default=8, help='Jobs to run at once')
+    parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between checks for new jobs')
+    parser.add_argument('--log-dir', default=os.path.join('data', 'logs'), help="Full JSONL job logs ('' to disable)")
+    args = parser.parse_args()
+
+    job_queue = JobQueue(args.db)
+    run_job = make_run_job(job_queue, log_capacity=DEFAULT_CAPACITY, spill_dir=args.log_dir or None)
+    JobRunner(job_queue, run_job, max_workers=args.workers, poll_interval=args.poll_interval).start()
+    print(f"✅ Send worker running {args.workers} job slot(s) from {args.db}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()